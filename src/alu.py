@@ -0,0 +1,65 @@
+from array import array
+import logging
+import time
+
+from .interface import Flags
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Precomputed ALU results. Every entry packs the 8-bit result in the low byte
+# and the flags it produces (in their P bit positions) in the high byte, so a
+# handler gets both from one indexed read:
+#
+#   value = ADC_TABLE[(C << 16) | (A << 8) | M]
+#   result, flags = value & 0xFF, value >> 8
+#
+# N and Z are not stored, they come from the result (see Register.nz).
+# SBC is ADC with the operand inverted: A - M - (1 - C) == A + (M ^ 0xFF) + C.
+
+
+def build_adc_table() -> array:
+    # index: (C << 16) | (A << 8) | M -> result | (C|V) << 8
+    table = array("H", bytes(2 * 0x20000))
+    for carry in (0, 1):
+        base = carry << 16
+        for a in range(256):
+            row = base | (a << 8)
+            for m in range(256):
+                total = a + m + carry
+                result = total & 0xFF
+                flags = Flags.C if total > 0xFF else 0
+                if (a ^ result) & (m ^ result) & 0x80:
+                    flags |= Flags.V
+                table[row | m] = result | (flags << 8)
+    return table
+
+
+def build_compare_table() -> array:
+    # index: (reg << 8) | M -> (reg - M) & 0xFF | C << 8
+    table = array("H", bytes(2 * 0x10000))
+    for reg in range(256):
+        row = reg << 8
+        for m in range(256):
+            table[row | m] = ((reg - m) & 0xFF) | ((Flags.C if reg >= m else 0) << 8)
+    return table
+
+
+def build_shift_tables() -> tuple:
+    # ASL/LSR index: M, ROL/ROR index: (C << 8) | M -> result | C << 8
+    asl = array("H", [((m << 1) & 0xFF) | ((m >> 7) << 8) for m in range(256)])
+    lsr = array("H", [(m >> 1) | ((m & 0x01) << 8) for m in range(256)])
+    rol = array("H", [(((m << 1) | c) & 0xFF) | ((m >> 7) << 8) for c in (0, 1) for m in range(256)])
+    ror = array("H", [((c << 7) | (m >> 1)) | ((m & 0x01) << 8) for c in (0, 1) for m in range(256)])
+    return asl, lsr, rol, ror
+
+
+_start = time.perf_counter()
+ADC_TABLE = build_adc_table()
+COMPARE_TABLE = build_compare_table()
+ASL_TABLE, LSR_TABLE, ROL_TABLE, ROR_TABLE = build_shift_tables()
+TABLE_BUILD_TIME = time.perf_counter() - _start
+TABLE_BYTES = sum(table.itemsize * len(table) for table in (ADC_TABLE, COMPARE_TABLE, ASL_TABLE, LSR_TABLE, ROL_TABLE, ROR_TABLE))
+del _start
+
+LOGGER.debug(f"ALU: tables built in {TABLE_BUILD_TIME * 1000:.1f} ms, {TABLE_BYTES / 1024:.0f} KiB")
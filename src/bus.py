@@ -4,36 +4,100 @@
 
 from abc import ABC
 import logging
-from typing import Dict, List
+from typing import Callable, Dict, List
 
 from .interface import IBus
 
 from .io_register import PPURegisterManager
-from .interface import IController
+from .interface import IController, Mirroring
 # from cpu import ICPU
 from .exceptions import CartridgeNotFound, InvalidAddress
 from .memory import IMemory
 from .cartridge import ICatridge
+from .scheduler import Scheduler
 
 LOGGER = logging.getLogger(__name__)
 
 
+# the CPU is stalled while OAM DMA copies 256 bytes, one more cycle when
+# the storing instruction ends on an odd cycle
+OAM_DMA_CYCLES = 513
+
+
 
 
 
 class CPUBus(IBus):
+    """
+    The CPU address space as 256 pages of 256 bytes. A page of RAM or PRG-ROM
+    is a memoryview of its backing bytes, read with one subscript; every other
+    page has a handler taking the full address. The mapper reports bank
+    switches through its PRG write callback and the bus then maps the pages
+    of that range again.
+    """
     memory:IMemory = None
     cartridge:ICatridge = None
     controllers:IController = {}
     ppu_reg_manager:PPURegisterManager = None
+    scheduler:Scheduler = None
 
     def __init__(self, memory:IMemory, ppu_reg_manager:PPURegisterManager=None):
         self.memory = memory
         self.ppu_reg_manager = ppu_reg_manager
+        # RAM bytes holding translated code, see register_ram_write_callback
+        self.watched_ram = bytearray(0x0800)
+        self.ram_write_callbacks:List[Callable[[int], None]] = []
+
+        # per page, either a memoryview or None for a handler
+        self.read_pages:List[memoryview|None] = [None] * 0x100
+        self.read_handlers:List[Callable[[int], int]|None] = [None] * 0x100
+        # only RAM pages are written directly, to check watched_ram
+        self.write_pages:List[memoryview|None] = [None] * 0x100
+        self.write_handlers:List[Callable[[int, int], None]|None] = [None] * 0x100
+
+        ram = memoryview(memory.memory)
+        for page in range(0x00, 0x20):
+            # mirror for $0x0800-$0x1FFF
+            offset = (page & 0x07) << 8
+            self._map_page(page, ram[offset:offset+0x100], None, ram[offset:offset+0x100], None)
+        if ppu_reg_manager is not None:
+            # straight to the register handlers, they mirror every 8 bytes
+            read_register, write_register = ppu_reg_manager.read_for_cpu, ppu_reg_manager.write_for_cpu
+        else:
+            read_register, write_register = self._read_ppu_register, self._write_ppu_register
+        for page in range(0x20, 0x40):
+            # PPU registers, mirrored every 8 bytes up to $3FFF
+            self._map_page(page, None, read_register, None, write_register)
+        self._map_page(0x40, None, self._read_io, None, self._write_io)
+        for page in range(0x41, 0x60):
+            self._map_page(page, None, self._read_expansion_rom, None, self._write_expansion_rom)
+        for page in range(0x60, 0x80):
+            self._map_page(page, None, self._read_sram, None, self._write_sram)
+        for page in range(0x80, 0x100):
+            self._map_page(page, None, self._read_prg, None, self._write_prg)
+
+    def _map_page(self, page:int, read_data:memoryview|None, read_handler:Callable[[int], int]|None,
+                  write_data:memoryview|None, write_handler:Callable[[int, int], None]|None):
+        self.read_pages[page] = read_data
+        self.read_handlers[page] = read_handler
+        self.write_pages[page] = write_data
+        self.write_handlers[page] = write_handler
+
+    def register_scheduler(self, scheduler:Scheduler):
+        # charges the CPU for OAM DMA
+        self.scheduler = scheduler
 
-    
     def set_cartridge(self, cartridge:ICatridge):
         self.cartridge = cartridge
+        cartridge.mapper.register_prg_write_callback(self._map_prg)
+        self._map_prg(0x8000, 0x10000)
+
+    def _map_prg(self, start:int, end:int):
+        if self.cartridge is None:
+            return
+        mapper = self.cartridge.mapper
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            self.read_pages[page] = mapper.get_prg_page(page)
 
     def register_controller(self, controller:IController, player_num:int=1):
         if player_num > 2:
@@ -43,138 +107,194 @@ class CPUBus(IBus):
     def unregister_controller(self, player_num:int=1):
         self.controllers.pop(player_num)
 
+    def register_ram_write_callback(self, func:Callable[[int], None]):
+        # func(address) is called with the RAM offset ($0000-$07FF) of every
+        # write to a byte that is marked in watched_ram
+        self.ram_write_callbacks.append(func)
+
     def write_byte(self, address:int, data:bytes):
         if data is None:
             raise ValueError("Data cannot be None")
-        
-        if address < 0x2000:
-            # RAM
-            # mirror for $0x0800-$0x1FFF
-            address %= 0x0800
-
-            self.memory.write(address, data)
-        elif address < 0x401f:
-            # IO registers
-            if address < 0x2008:
-                # PPU registers
-                self.ppu_reg_manager.write_for_cpu(address, data)
-
-            elif address < 0x4000 and address >= 0x2008:
-                # for mirror 0x2000-0x2007
-                address = 0x2000 + (address % 8)
-                self.write_byte(address, data)
-
-            elif address == 0x4014:
-                # OAMDMA
-                addr = data * 0x100
-                if addr > 0x07ff or addr < 0x0200:
-                    # LOGGER.warn(f"CPUBus: OAMDMA address out of range: {hex(addr)}")
-                    raise RuntimeError(f"CPUBus: OAMDMA address out of range: {hex(addr)}")
-                sprite_data = self.memory.read(addr, 256)
-                self.ppu_reg_manager.write_for_cpu(address, sprite_data)
-    
-            elif address == 0x4016:
-                # joypad
-                if self.controllers == {}:
-                    # LOGGER.warn(f"CPUBus: Controller not found")
-                    return
-                for k, v in self.controllers.items():
-                    v.write(data)
-                
-            # else:
-                # LOGGER.warn(f"CPUBus: IO registers not implemented")
-        elif address < 0x6000:
-            # TODO: Expansion ROM
-            raise NotImplementedError("Expansion ROM not implemented")
-        elif address < 0x8000:
-            # TODO: SRAM
-            raise NotImplementedError("SRAM not implemented")
-        elif address < 0x10000:
-            # Cartridge
-            if self.cartridge is None:
-                raise CartridgeNotFound("Cartridge not found")
-            self.cartridge.mapper.write(address, data)
-        else:
+        try:
+            page = self.write_pages[address >> 8]
+        except IndexError:
             raise InvalidAddress(f"Cannot access memory at {hex(address)}")
+        if page is None:
+            self.write_handlers[address >> 8](address, data)
+            return
+        page[address & 0xFF] = data
+        if self.watched_ram[address & 0x07FF]:
+            for func in self.ram_write_callbacks:
+                func(address & 0x07FF)
+
+    def _write_ppu_register(self, address:int, data:bytes):
+        self.ppu_reg_manager.write_for_cpu(address, data)
+
+    def _write_io(self, address:int, data:bytes):
+        if address == 0x4014:
+            # OAMDMA, from any page
+            sprite_data = self.read_block(data << 8, 256)
+            self.ppu_reg_manager.write_for_cpu(address, sprite_data)
+            if self.scheduler is not None:
+                self.scheduler.stall_cpu(OAM_DMA_CYCLES, align=True)
+
+        elif address == 0x4016:
+            # joypad
+            if self.controllers == {}:
+                # LOGGER.warn(f"CPUBus: Controller not found")
+                return
+            for k, v in self.controllers.items():
+                v.write(data)
+
+        elif address >= 0x401f:
+            self._write_expansion_rom(address, data)
+        # else:
+            # LOGGER.warn(f"CPUBus: IO registers not implemented")
+
+    def _write_expansion_rom(self, address:int, data:bytes):
+        # TODO: Expansion ROM
+        raise NotImplementedError("Expansion ROM not implemented")
+
+    def _write_sram(self, address:int, data:bytes):
+        # TODO: SRAM
+        raise NotImplementedError("SRAM not implemented")
+
+    def _write_prg(self, address:int, data:bytes):
+        # Cartridge
+        if self.cartridge is None:
+            raise CartridgeNotFound("Cartridge not found")
+        self.cartridge.mapper.write(address, data)
 
     def write_word(self, address:int, data:int):
         self.write_byte(address, data & 0xFF)
         self.write_byte(address+1, (data >> 8) & 0xFF)
 
+    # Block access to RAM for the fill/copy loops in fusion.py. Addresses are
+    # RAM offsets ($0000-$07FF) and a block must not cross $0800.
+
+    def read_ram(self, address:int, size:int) -> bytes:
+        data = self.memory.read(address, size)
+        return bytes((data,)) if size == 1 else bytes(data)
+
+    def write_ram(self, address:int, data:bytes):
+        self.memory.write_block(address, data)
+        self._notify_ram_block(address, len(data))
+
+    def fill_ram(self, address:int, size:int, data:int):
+        self.memory.fill(address, size, data)
+        self._notify_ram_block(address, size)
+
+    def _notify_ram_block(self, address:int, size:int):
+        if any(self.watched_ram[address:address+size]):
+            for offset in range(address, address + size):
+                if self.watched_ram[offset]:
+                    for func in self.ram_write_callbacks:
+                        func(offset)
+
     def read_byte(self, address:int) -> bytes:
-        
-        if address < 0x2000:
-            # RAM
-            # mirror for $0x0800-$0x1FFF
-            address %= 0x0800
-            return self.memory.read(address)
-        elif address < 0x401f:
-            # IO registers
-
-            if address < 0x2008 or address == 0x4014:
-                return self.ppu_reg_manager.read_for_cpu(address)
-            elif address < 0x4000 and address >= 0x2008:
-                # for mirror 0x2000-0x2007
-                address = 0x2000 + (address % 8)
-                return self.read_byte(address)
-            elif address == 0x4016:
-                if self.controllers == {}:
-                    # LOGGER.warn(f"CPUBus: Controller not found")
-                    return 0x00
-                return self.controllers[1].read()
-            elif address == 0x4017:
-                if self.controllers == {}:
-                    # LOGGER.warn(f"CPUBus: Controller not found")
-                    return 0x00
-                # return self.controllers[2].read()
-                return self.controllers[1].read()
-            else:
-                # TODO: IO registers
-                # LOGGER.warn(f"CPUBus: IO registers not implemented")
+        try:
+            page = self.read_pages[address >> 8]
+        except IndexError:
+            raise InvalidAddress(f"Cannot access memory at {hex(address)}")
+        if page is None:
+            return self.read_handlers[address >> 8](address)
+        return page[address & 0xFF]
+
+    def _read_ppu_register(self, address:int) -> bytes:
+        return self.ppu_reg_manager.read_for_cpu(address)
+
+    def _read_io(self, address:int) -> bytes:
+        if address == 0x4014:
+            return self.ppu_reg_manager.read_for_cpu(address)
+        elif address == 0x4016:
+            if self.controllers == {}:
+                # LOGGER.warn(f"CPUBus: Controller not found")
                 return 0x00
-            
-        elif address < 0x6000:
-            # TODO: Expansion ROM
-            raise NotImplementedError("Expansion ROM not implemented")
-        elif address < 0x8000:
-            # TODO: SRAM
-            raise NotImplementedError("SRAM not implemented")
-        elif address < 0x10000:
-            # Cartridge PRG-ROM
-            if self.cartridge is None:
-                raise CartridgeNotFound("Cartridge not found")
-            
-            return self.cartridge.mapper.read(address)
+            return self.controllers[1].read()
+        elif address == 0x4017:
+            if self.controllers == {}:
+                # LOGGER.warn(f"CPUBus: Controller not found")
+                return 0x00
+            # return self.controllers[2].read()
+            return self.controllers[1].read()
+        elif address >= 0x401f:
+            return self._read_expansion_rom(address)
         else:
-            raise InvalidAddress(f"Cannot access memory at {hex(address)}")
-        
+            # TODO: IO registers
+            # LOGGER.warn(f"CPUBus: IO registers not implemented")
+            return 0x00
+
+    def _read_expansion_rom(self, address:int) -> bytes:
+        # TODO: Expansion ROM
+        raise NotImplementedError("Expansion ROM not implemented")
+
+    def _read_sram(self, address:int) -> bytes:
+        # TODO: SRAM
+        raise NotImplementedError("SRAM not implemented")
+
+    def _read_prg(self, address:int) -> bytes:
+        # a PRG page before a cartridge is mapped in
+        raise CartridgeNotFound("Cartridge not found")
+
     def read_word(self, address:int) -> int:
         low = self.read_byte(address)
         high = self.read_byte(address+1)
         return (high << 8) | low
 
+    def read_block(self, address:int, size:int) -> memoryview:
+        if address < 0x2000:
+            # mirror for $0x0800-$0x1FFF
+            return self.memory.read_block(address % 0x0800, size)
+        elif address >= 0x8000:
+            if self.cartridge is None:
+                raise CartridgeNotFound("Cartridge not found")
+            return self.cartridge.mapper.read_block(address, size)
+        # registers have side effects, read them one by one
+        return memoryview(bytes([self.read_byte(address + i) for i in range(size)]))
+
+
+# the VRAM bank behind each name table
+NAMETABLE_BANKS = {
+    Mirroring.HORIZONTAL: (0, 0, 1, 1),
+    Mirroring.VERTICAL: (0, 1, 0, 1),
+    Mirroring.SINGLE_SCREEN_A: (0, 0, 0, 0),
+    Mirroring.SINGLE_SCREEN_B: (1, 1, 1, 1),
+}
+
 
 class PPUBus(IBus):
     memory:IMemory = None
     cartridge:ICatridge = None
     palette_index_memory:IMemory = None
 
-    is_horizontal_mirror:bool = True
-
-    exist_extended_vram:bool = False
+    mirroring:Mirroring = Mirroring.HORIZONTAL
 
     def __init__(self, memory:IMemory, palette_index_memory:IMemory):
         self.memory = memory
         self.palette_index_memory = palette_index_memory
+        # the 1KB name tables at $2000, $2400, $2800 and $2C00 (mirrored up
+        # to $3EFF), indexed by (address >> 10) & 0x03
+        self.nametables:List[memoryview] = [None] * 4
+        self.palette:memoryview = palette_index_memory.read_block(0x00, 0x20)
+        self.set_mirroring(Mirroring.HORIZONTAL)
 
     def set_cartridge(self, cartridge:ICatridge):
         self.cartridge = cartridge
-        self.is_horizontal_mirror = self.cartridge.rom.header.mirroring == 0
-        if self.cartridge.mapper.ram is not None\
-            and len(self.cartridge.mapper.ram) >= 2*1024:
-            self.exist_extended_vram = True
+        cartridge.mapper.register_mirroring_callback(self.set_mirroring)
+        self.set_mirroring(cartridge.mapper.mirroring)
+
+    def set_mirroring(self, mirroring:Mirroring):
+        if mirroring == Mirroring.FOUR_SCREEN:
+            vram = None if self.cartridge is None else self.cartridge.mapper.vram
+            if vram is None:
+                raise ValueError("Four-screen mirroring needs VRAM on the cartridge")
+            vram = memoryview(vram)
+            banks = [self.memory.read_block(0x0000, 0x0400), self.memory.read_block(0x0400, 0x0400),
+                     vram[0x0000:0x0400], vram[0x0400:0x0800]]
         else:
-            self.exist_extended_vram = False
+            banks = [self.memory.read_block(bank * 0x0400, 0x0400) for bank in NAMETABLE_BANKS[mirroring]]
+        self.mirroring = mirroring
+        self.nametables[:] = banks
 
     def write_byte(self, address:int, data:bytes):
         # for mirror
@@ -188,36 +308,7 @@ class PPUBus(IBus):
             # LOGGER.warn(f"PPUBus: CHR-ROM is write-only")
         elif address < 0x3f00: 
             # vram  (name table)
-
-            if address >= 0x3000:
-                # for mirror
-                address -= 0x1000
-
-            address -= 0x2000
-            if self.is_horizontal_mirror:
-                # address %= 0x0800
-                if address < 0x0800:
-                    address %= 0x0400
-                    self.memory.write(address, data)
-                    # if self.exist_extended_vram:
-                    #     self.cartridge.mapper.write(address, data)            
-                else:
-                    address -= 0x0800
-                    address %= 0x0400
-                    address += 0x0400
-                    self.memory.write(address, data)  
-                    # if self.exist_extended_vram:
-                    #     self.cartridge.mapper.write(address, data)    
-
-            else:
-                if address < 0x0800:
-                    self.memory.write(address, data)
-                else:
-                    address -= 0x0800
-                    self.memory.write(address, data)
-                    # if self.exist_extended_vram:
-                    #     self.cartridge.mapper.write(address, data)
-            
+            self.nametables[(address >> 10) & 0x03][address & 0x03FF] = data
                     
         elif address < 0x4000:
             # palette
@@ -243,28 +334,7 @@ class PPUBus(IBus):
             return self.cartridge.mapper.read(address)
         elif address < 0x3f00:
             # vram  (name table)
-
-            if address >= 0x3000:
-                # for mirror
-                address -= 0x1000
-
-            address -= 0x2000
-            if self.is_horizontal_mirror:
-                if address < 0x0800:
-                    address %= 0x0400
-                    return self.memory.read(address)
-                else:
-                    address -= 0x0800
-                    address %= 0x0400
-                    address += 0x0400
-                    return self.memory.read(address)
-            else:
-                if address < 0x0800:
-                    return self.memory.read(address)
-                else:
-                    address -= 0x0800
-                    return self.memory.read(address)
-
+            return self.nametables[(address >> 10) & 0x03][address & 0x03FF]
 
         elif address < 0x4000:
             # palette
@@ -279,4 +349,21 @@ class PPUBus(IBus):
     def read_word(self, address:int) -> int:
         low = self.read_byte(address)
         high = self.read_byte(address+1)
-        return (high << 8) | low
\ No newline at end of file
+        return (high << 8) | low
+
+    def read_block(self, address:int, size:int) -> memoryview:
+        # for mirror
+        address %= 0x4000
+
+        if address < 0x2000:
+            # CHR-ROM (parttern table)
+            if self.cartridge is None:
+                raise CartridgeNotFound("Cartridge not found")
+            return self.cartridge.mapper.read_block(address, size)
+        elif address < 0x3f00:
+            # vram  (name table), within one name table
+            address &= 0x0FFF
+            return self.nametables[address >> 10][address & 0x03FF:(address & 0x03FF) + size]
+        else:
+            # palette
+            return self.palette_index_memory.read_block((address - 0x3f00) % 0x20, size)
@@ -3,6 +3,7 @@
 
 from abc import ABC
 from enum import Enum
+from typing import Callable, List
 
 from .interface import ControllerButton
 
@@ -13,6 +14,15 @@ class Controller:
     data:bytes = 0x00
     is_strobed:bool = False
     offset:int = 0x00
+
+    def __init__(self):
+        self.latch_callbacks:List[Callable[["Controller"], None]] = []
+
+    def register_latch_callback(self, func:Callable[["Controller"], None]):
+        # func(controller) is called when the game strobes the controller,
+        # the moment the real pad latches its buttons, to update data
+        self.latch_callbacks.append(func)
+
     def update(self, button:ControllerButton, is_pressed:bool):
         if is_pressed:
             self.data |= button.value
@@ -23,6 +33,8 @@ class Controller:
         if data & 0x01:
             self.is_strobed = True
             self.offset = 0
+            for func in self.latch_callbacks:
+                func(self)
         else:
             self.is_strobed = False
 
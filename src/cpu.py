@@ -7,12 +7,13 @@
 
 from abc import ABC
 from enum import Enum
-from typing import List, Tuple
+from typing import Callable, Dict, List, Tuple
 
-from .decoder import Decoder
+from .decoder import DecodeCache, Decoder
+from .translator import BlockTranslator
 
 from .bus import CPUBus
-from .executor import Executor
+from .hooks import CPUHookType, Hook, compile_hook_chain
 from .interface import ICPU, Flags, Register
 from .instruction import INSTRUCTION_TABLE, Instruction
 
@@ -25,11 +26,9 @@ LOGGER = logging.getLogger(__name__)
 
 
 
-class CPUHookType(Enum):
-    STATUS = 1
-    BEFORE_EXEC = 2
-    AFTER_EXEC= 3
-    ON_SHUTDOWN = 4
+class ExecutionMode(Enum):
+    INTERPRET = 1   # one instruction per cycle() through the decode cache
+    TRANSLATE = 2   # one translated basic block per cycle()
 
 
 class CPU(ICPU):
@@ -41,23 +40,83 @@ class CPU(ICPU):
         self.bus: CPUBus = bus
         self.cycles: int = 0
         self.defer_cycles: int = 0
+        # only used to describe the current instruction to hooks
         self.decoder = Decoder(self)
-        self.executor = Executor(self)
+        self.decode_cache = DecodeCache(bus)
         self.current_instruction: Instruction = None
 
-        self._status_hook_func: dict = {}
-        self._before_exec_hook_func: dict = {}
-        self._after_exec_hook_func: dict = {}
-        self._shutdown_hook_func: dict = {}
+        self._status_hook_func: Dict[str, Hook] = {}
+        self._before_exec_hook_func: Dict[str, Hook] = {}
+        self._after_exec_hook_func: Dict[str, Hook] = {}
+        self._shutdown_hook_func: Dict[str, Hook] = {}
+        self._nmi_hook_func: Dict[str, Hook] = {}
+        # compiled from the hooks above while hooked, see _update_hook_chain
+        self._before_exec_chain: Callable = None
+        self._after_exec_chain: Callable = None
+        # ON_NMI hooks don't depend on hook_enable, None while there are none
+        self._nmi_chain: Callable = None
 
         self.nmi_enabled: bool = False
         self.irq_enabled: bool = False
+        # ends the current run_for() slice after the running instruction
+        self.yield_requested: bool = False
+        # set by reset(), the cycle count starts over and the slice ends there
+        self.was_reset: bool = False
+        # cycles used by the running slice before the current instruction
+        self.slice_cycles: int = 0
+        # cycle budget of the running slice, block loops in fusion.py stop at it
+        self.slice_budget: int = 0
+        # idle loop fast-forward, see idle.py
+        self.idle_snapshot: tuple = None
+        self.idle_period: int = 0
+        self.idle_skipped_cycles: int = 0
+        self.idle_skips: int = 0
 
         self.hook_enabled: bool = False
+        # hooks are enabled and at least one per-instruction hook is registered
+        self.hooked: bool = False
+
+        self.execution_mode: ExecutionMode = ExecutionMode.INTERPRET
+        self.translator: BlockTranslator = None
+        # single-instruction blocks, used while a STATUS hook traces every instruction
+        self.step_translator: BlockTranslator = None
+
+        self.cycle: Callable[[], None] = self._cycle
+        self._update_hook_chain()
 
 
     def hook_enable(self, enable:bool):
         self.hook_enabled = enable
+        self._update_hook_chain()
+
+    def _update_hook_chain(self):
+        if self._nmi_hook_func:
+            self._nmi_chain = compile_hook_chain("on_nmi", [("target", *hook) for hook in self._nmi_hook_func.values()])
+        else:
+            self._nmi_chain = None
+
+        # the hooked cycle() is only swapped in while there is a hook to call,
+        # otherwise nothing on the way of an instruction looks at hooks
+        self.hooked = self.hook_enabled and bool(self._status_hook_func or self._before_exec_hook_func or self._after_exec_hook_func)
+        if self.hooked:
+            self._before_exec_chain = compile_hook_chain("before_exec",
+                [("target", *hook) for hook in self._before_exec_hook_func.values()] +
+                [("status", *hook) for hook in self._status_hook_func.values()])
+            self._after_exec_chain = compile_hook_chain("after_exec",
+                [("target", *hook) for hook in self._after_exec_hook_func.values()])
+            self.cycle = self._hooked_cycle
+        else:
+            self._before_exec_chain = None
+            self._after_exec_chain = None
+            self.cycle = self._cycle
+        # a running run_for() slice picks the other loop up after this instruction
+        self.yield_requested = True
+
+    def set_execution_mode(self, mode:ExecutionMode):
+        if mode is ExecutionMode.TRANSLATE and self.translator is None:
+            self.translator = BlockTranslator(self.bus)
+            self.step_translator = BlockTranslator(self.bus, max_instructions=1)
+        self.execution_mode = mode
 
     def push_byte(self, data:bytes):
         addr = self.regs.SP + 0x100
@@ -86,40 +145,49 @@ class CPU(ICPU):
         return (hi << 8) | lo
 
     def irq(self):
-        if self.regs.P.I != 0:
+        if self.regs.P & Flags.I:
             return
         
         self.push_word(self.regs.PC)
-        self.push_byte((self.regs.P.read() | Flags.U) & ~Flags.B)
+        self.push_byte((self.regs.read_status() | Flags.U) & ~Flags.B)
 
-        self.regs.P.I = 1
+        self.regs.set_flag(Flags.I)
         self.regs.PC = self.bus.read_word(self.IRQ_ADDR)
         self.defer_cycles += 7
 
     def nmi(self):
         self.push_word(self.regs.PC)
-        self.push_byte((self.regs.P.read() | Flags.U) & ~Flags.B)
+        self.push_byte((self.regs.read_status() | Flags.U) & ~Flags.B)
 
-        self.regs.P.I = 1
+        self.regs.set_flag(Flags.I)
         self.regs.PC = self.bus.read_word(self.NMI_ADDR)
         self.defer_cycles += 7
+        if self._nmi_chain is not None:
+            self._nmi_chain(self)
 
     def reset(self, start_addr:int=None):
         self.regs.A = 0
         self.regs.X = 0
         self.regs.Y = 0
         self.regs.SP = 0xFD
-        self.regs.P.I = 1
-        self.regs.P.U = 1
+        self.regs.set_flag(Flags.I | Flags.U)
         self.regs.PC = self.bus.read_word(self.REST_ADDR) if start_addr is None else start_addr
         self.defer_cycles = 7
         self.cycles = 0        
+        self.yield_requested = True
+        self.was_reset = True
+        self.decode_cache.clear()
+        if self.translator is not None:
+            self.translator.clear()
+            self.step_translator.clear()
 
     def set_nmi(self,):
         self.nmi_enabled = True
+        self.yield_requested = True
     
     def set_irq(self,):
         self.irq_enabled = True
+        self.yield_requested = True
 
     def clock(self, debug:bool=False):
         
@@ -135,7 +203,7 @@ class CPU(ICPU):
             self.defer_cycles -= 1
             self.cycles += 1
     
-    def cycle(self,):
+    def poll_interrupts(self):
         if self.nmi_enabled:
             self.nmi()
             self.nmi_enabled = False
@@ -143,17 +211,156 @@ class CPU(ICPU):
             self.irq()
             self.irq_enabled = False
 
-        opcode:bytes = self.fetch()
-        self.current_instruction = self.decoder.decode(opcode)
-
-        if self.hook_enabled:
-            self._call_before_exec_hook()
-            self._call_status_hook()
-        # self.log()
-        self.executor.execute(self.current_instruction)
+    def run_for(self, cycle_budget:int) -> int:
+        """
+        Execute whole instructions until at least cycle_budget cycles have been
+        used and return the exact number of cycles consumed, including pending
+        defer cycles and interrupt entry. The last instruction may overshoot
+        the budget, the caller syncs the PPU with the returned count.
+        Interrupts are only taken when the slice starts: raising one ends the
+        running slice, so does a reset, whose own cycles are left to the next
+        slice.
+        """
+        self.yield_requested = False
+        self.was_reset = False
+        self.idle_snapshot = None
+        self.idle_period = 0
+        self.poll_interrupts()
+        used = self.defer_cycles
+        self.defer_cycles = 0
+
+        self.slice_budget = cycle_budget
+        if self.hooked or self.execution_mode is ExecutionMode.TRANSLATE:
+            # hooks read cpu.cycles, keep it exact after every instruction
+            self.cycles += used
+            while used < cycle_budget:
+                self.slice_cycles = used
+                self.cycle()
+                if self.was_reset:
+                    break
+                cycles = self.defer_cycles
+                self.defer_cycles = 0
+                self.cycles += cycles
+                used += cycles
+                if self.yield_requested:
+                    break
+            self.slice_cycles = 0
+            return used
+
+        regs = self.regs
+        entries = self.decode_cache.fused
+        decode = self.decode_cache.decode_fused
+        while used < cycle_budget:
+            pc = regs.PC
+            execute, operand, length, opcode = entries[pc] or decode(pc)
+            regs.PC = pc + length
+            self.slice_cycles = used
+            used += execute(self, operand)
+            if self.yield_requested:
+                if not self.idle_period:
+                    break
+                # nothing changes before the next event, skip whole passes up to it
+                skipped = (cycle_budget - used) // self.idle_period * self.idle_period
+                used += skipped
+                self.idle_skipped_cycles += skipped
+                if skipped:
+                    self.idle_skips += 1
+                self.idle_period = 0
+                self.yield_requested = False
+        self.slice_cycles = 0
+        if not self.was_reset:
+            # after a reset (KIL calls it through the shutdown hook) cycles
+            # count from the reset on, which ended the slice
+            self.cycles += used
+        return used
+
+    def idle_loop_taken(self, cycles:int, reads_controller:bool):
+        # two passes in a row within one slice that leave the registers alike
+        # make an idle loop; run_for() then skips to the end of the slice
+        if self.hooked:
+            return
+        regs = self.regs
+        now = self.slice_cycles + cycles
+        state = (regs.PC, regs.A, regs.X, regs.Y, regs.P, regs.nz, regs.SP)
+        snapshot = self.idle_snapshot
+        self.idle_snapshot = (state, now)
+        if snapshot is None or snapshot[0] != state:
+            return
+        if reads_controller and not all(controller.is_strobed for controller in self.bus.controllers.values()):
+            return
+        self.idle_period = now - snapshot[1]
+        self.yield_requested = True
+
+    def step(self) -> int:
+        """
+        Execute exactly one instruction, after a pending interrupt entry, and
+        return the cycles consumed like run_for() does.
+        """
+        self.was_reset = False
+        used = self.defer_cycles
+        self.defer_cycles = 0
+        self.cycles += used
+        # no budget left, a translated block runs a single instruction
+        self.slice_budget = 0
+        self.cycle()
+        if self.was_reset:
+            return used
+        cycles = self.defer_cycles
+        self.defer_cycles = 0
+        self.cycles += cycles
+        return used + cycles
+
+    def _cycle(self):
+        self.poll_interrupts()
+
+        if self.execution_mode is ExecutionMode.TRANSLATE:
+            self._run_block(self.translator)
+            return
 
-        if self.hook_enabled:
-            self._call_after_exec_hook()
+        regs = self.regs
+        pc = regs.PC
+        execute, operand, length, opcode = self.decode_cache.entries[pc] or self.decode_cache.decode(pc)
+        regs.PC = pc + length
+        self.defer_cycles += execute(self, operand)
+
+    def _hooked_cycle(self):
+        self.poll_interrupts()
+
+        regs = self.regs
+        pc = regs.PC
+        regs.PC = pc + 1
+        self.current_instruction = self.decoder.decode(self.bus.read_byte(pc))
+        self._before_exec_chain(self)
+
+        if self.execution_mode is ExecutionMode.TRANSLATE:
+            # hooks run once per block; tracing needs one block per instruction
+            regs.PC = pc
+            self._run_block(self.step_translator if self._status_hook_func else self.translator)
+        else:
+            execute, operand, length, opcode = self.decode_cache.entries[pc] or self.decode_cache.decode(pc)
+            regs.PC = pc + length
+            self.defer_cycles += execute(self, operand)
+
+        self._after_exec_chain(self)
+
+    def _run_block(self, translator:BlockTranslator):
+        regs = self.regs
+        pc = regs.PC
+        block = translator.lookup(pc)
+        if block is None:
+            # code outside of RAM and PRG-ROM is interpreted
+            execute, operand, length, opcode = self.decode_cache.decode(pc)
+            regs.PC = pc + length
+            cycles = execute(self, operand)
+        else:
+            slice_cycles = self.slice_cycles
+            if block.lead_cycles >= self.slice_budget - slice_cycles:
+                # the slice may end inside the block, stop where interpreting would
+                block = self.step_translator.lookup(pc)
+            cycles = block.func(self)
+            # the block moves slice_cycles along to its I/O accesses
+            self.slice_cycles = slice_cycles
+        self.defer_cycles += cycles
 
 
 
@@ -179,7 +386,7 @@ class CPU(ICPU):
             "A": self.regs.A,
             "X": self.regs.X,
             "Y": self.regs.Y,
-            "P": self.regs.P.read(),
+            "P": self.regs.read_status(),
             "SP": self.regs.SP,
             "CYC": self.cycles
         }
@@ -193,20 +400,12 @@ class CPU(ICPU):
             self._after_exec_hook_func[func.__name__] = (func, args, kwargs)
         elif hook_type == CPUHookType.ON_SHUTDOWN:
             self._shutdown_hook_func[func.__name__] = (func, args, kwargs)
+        elif hook_type == CPUHookType.ON_NMI:
+            self._nmi_hook_func[func.__name__] = (func, args, kwargs)
         else:
+            # frame hooks are registered on the PPU, see Machine.register_cpu_hook
             raise ValueError("Invalid hook type")
-
-    def _call_status_hook(self):
-        for func, args, kwargs in self._status_hook_func.values():
-            func(self.get_status(), *args, **kwargs)
-
-    def _call_before_exec_hook(self):
-        for func, args, kwargs in self._before_exec_hook_func.values():
-            func(self, *args, **kwargs)
-
-    def _call_after_exec_hook(self):
-        for func, args, kwargs in self._after_exec_hook_func.values():
-            func(self, *args, **kwargs)
+        self._update_hook_chain()
 
     def _call_shutdown_hook(self):
         self.reset()
@@ -221,8 +420,13 @@ class CPU(ICPU):
             self._before_exec_hook_func.pop(func.__name__, None)
         elif hook_type == CPUHookType.AFTER_EXEC:
             self._after_exec_hook_func.pop(func.__name__, None)
+        elif hook_type == CPUHookType.ON_SHUTDOWN:
+            self._shutdown_hook_func.pop(func.__name__, None)
+        elif hook_type == CPUHookType.ON_NMI:
+            self._nmi_hook_func.pop(func.__name__, None)
         else:
             raise ValueError("Invalid hook type")
+        self._update_hook_chain()
         
     def log(self,):
         status = self.get_status()
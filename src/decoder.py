@@ -4,9 +4,12 @@
 
 
 
-from typing import Tuple
-from .interface import ICPU
+from typing import Callable, Dict, List, Set, Tuple
+from .interface import ICPU, IBus, IMapper
 from .instruction import INSTRUCTION_TABLE, AddressingMethod, Instruction
+from .dispatch import OPCODE_LENGTHS, OPCODE_TABLE
+from .fusion import FUSION_MAX_BYTES, fuse
+from .idle import IDLE_LOOP_MAX_BYTES, ReadKind, find_idle_loop, idle_loop_branch
 
 
 
@@ -118,3 +121,105 @@ class Decoder:
                 raise ValueError("Invalid addressing method")
             
         return data, addr
+
+
+
+BRANCH_OPCODES = frozenset(opcode for opcode, info in INSTRUCTION_TABLE.items() if info[1] is AddressingMethod.rel)
+
+# (execute, operand, length, opcode)
+DecodedEntry = Tuple[Callable, int|None, int, int]
+
+
+class DecodeCache:
+    """
+    Decoded instructions keyed by PC.
+
+    An entry holds the per-opcode handler, the raw operand (which already is
+    the effective address for zp/abs addressing), the instruction length and
+    the opcode. Only PRG-ROM ($8000-$FFFF) is cached; the mapper notifies the
+    cache whenever its PRG bytes are written or a bank is switched.
+    Backward branches closing an idle loop get a handler that reports the
+    loop to the CPU (see idle.py).
+
+    `fused` holds the same entries with common idioms merged into one handler
+    (see fusion.py). Only the hook-free run_for() loop uses them, hooks and
+    debugging keep seeing every instruction. With fusion disabled `fused`
+    holds the plain entries.
+    """
+    CACHE_START = 0x8000
+
+    def __init__(self, bus: IBus):
+        self.bus = bus
+        self.entries: List[DecodedEntry|None] = [None] * 0x10000
+        self.fused: List[DecodedEntry|None] = [None] * 0x10000
+        # idiom -> PCs it was fused at, for the ROM currently mapped
+        self.fused_sites: Dict[str, Set[int]] = {}
+        # idiom -> [runs, instructions] of its fused handlers
+        self.fusion_counters: Dict[str, List[int]] = {}
+        self.fusion_enabled: bool = True
+        self.mapper: IMapper = None
+
+    def decode(self, pc:int) -> DecodedEntry:
+        read_byte = self.bus.read_byte
+        opcode = read_byte(pc)
+        length = OPCODE_LENGTHS[opcode]
+        if length == 1:
+            operand = None
+        elif length == 2:
+            operand = read_byte(pc + 1)
+        else:
+            operand = read_byte(pc + 1) | (read_byte(pc + 2) << 8)
+
+        entry = (OPCODE_TABLE[opcode], operand, length, opcode)
+        if pc >= self.CACHE_START and pc + length <= 0x10000:
+            self._watch_mapper()
+            if opcode in BRANCH_OPCODES and operand & 0x80:
+                target = pc + 2 + operand - 0x100
+                kind = find_idle_loop(self.bus, pc, target) if target >= self.CACHE_START else ReadKind.NONE
+                if kind != ReadKind.NONE:
+                    entry = (idle_loop_branch(entry[0], target, kind), operand, length, opcode)
+            self.entries[pc] = entry
+        return entry
+
+    def decode_fused(self, pc:int) -> DecodedEntry:
+        entry = self.entries[pc] or self.decode(pc)
+        if pc < self.CACHE_START:
+            return entry
+        fused = fuse(self.bus, pc, self.fusion_counters) if self.fusion_enabled else None
+        if fused is not None:
+            name, execute, length = fused
+            entry = (execute, None, length, entry[3])
+            self.fused_sites.setdefault(name, set()).add(pc)
+        self.fused[pc] = entry
+        return entry
+
+    def invalidate(self, start:int, end:int):
+        # an idiom starting up to FUSION_MAX_BYTES before `start` may overlap,
+        # a branch up to IDLE_LOOP_MAX_BYTES after `end` may close a loop over it
+        entries = self.entries
+        fused = self.fused
+        for pc in range(max(start - FUSION_MAX_BYTES, self.CACHE_START), min(end + IDLE_LOOP_MAX_BYTES, 0x10000)):
+            entries[pc] = None
+            fused[pc] = None
+
+    def clear(self):
+        self.entries[:] = [None] * 0x10000
+        self.fused[:] = [None] * 0x10000
+
+    def set_fusion(self, enable:bool):
+        self.fusion_enabled = enable
+        self.fused[:] = [None] * 0x10000
+
+    def fusion_report(self) -> Dict[str, Tuple[int, int, int]]:
+        # idiom -> (sites, runs, instructions), each run saves all but one
+        # dispatch of the instructions it stands for
+        return {name: (len(sites), *self.fusion_counters[name]) for name, sites in self.fused_sites.items()}
+
+    def _watch_mapper(self):
+        mapper = self.bus.cartridge.mapper
+        if mapper is not self.mapper:
+            self.clear()
+            self.fused_sites = {}
+            self.fusion_counters = {}
+            self.mapper = mapper
+            mapper.register_prg_write_callback(self.invalidate)
@@ -0,0 +1,242 @@
+from typing import Callable, List
+
+from .executor import EXECUTION_METHODS, OPERAND_TYPES, OperandType
+from .instruction import (BASE_CYCLES, BRANCH_PAGE_CROSS_CYCLES, BRANCH_TAKEN_CYCLES, INSTRUCTION_TABLE,
+                          PAGE_CROSS_CYCLES, AddressingMethod)
+
+
+# Each factory returns execute(cpu, operand) -> cycles for one opcode. The
+# operand is the raw operand of the instruction (a byte, a little-endian word
+# or None) and PC already points at the next instruction, so the closure only
+# resolves the effective address the same way Decoder.addressing does and
+# calls the mnemonic handler directly.
+#
+# Cycle counts come from the tables in instruction.py. Opcodes with a page
+# crossing penalty get their own closure that adds the carry out of the low
+# address byte, the others never look at it.
+
+
+def _imp(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    if operand_type is OperandType.NONE:
+        def execute(cpu, operand):
+            handler(cpu)
+            return cycles
+    else:
+        def execute(cpu, operand):
+            handler(cpu, None)
+            return cycles
+    return execute
+
+
+def _acc(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    def execute(cpu, operand):
+        handler(cpu, None)
+        return cycles
+    return execute
+
+
+def _imm(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    def execute(cpu, operand):
+        handler(cpu, operand)
+        return cycles
+    return execute
+
+
+def _rel(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    # indexed by whether the target is in another page than the next instruction
+    taken_cycles = (BRANCH_TAKEN_CYCLES[opcode], BRANCH_PAGE_CROSS_CYCLES[opcode])
+
+    def execute(cpu, operand):
+        pc = cpu.regs.PC
+        if operand & 0x80:
+            addr = (pc + operand - 0x100) & 0xFFFF
+        else:
+            addr = (pc + operand) & 0xFFFF
+        # branch handlers return 1 when the branch is taken
+        return cycles + handler(cpu, addr) * taken_cycles[(addr ^ pc) > 0xFF]
+    return execute
+
+
+def _zp(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    if operand_type is OperandType.VALUE:
+        def execute(cpu, operand):
+            handler(cpu, cpu.bus.read_byte(operand))
+            return cycles
+    else:
+        def execute(cpu, operand):
+            handler(cpu, operand)
+            return cycles
+    return execute
+
+
+def _zpx(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    if operand_type is OperandType.VALUE:
+        def execute(cpu, operand):
+            handler(cpu, cpu.bus.read_byte((operand + cpu.regs.X) & 0xFF))
+            return cycles
+    else:
+        def execute(cpu, operand):
+            handler(cpu, (operand + cpu.regs.X) & 0xFF)
+            return cycles
+    return execute
+
+
+def _zpy(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    if operand_type is OperandType.VALUE:
+        def execute(cpu, operand):
+            handler(cpu, cpu.bus.read_byte((operand + cpu.regs.Y) & 0xFF))
+            return cycles
+    else:
+        def execute(cpu, operand):
+            handler(cpu, (operand + cpu.regs.Y) & 0xFF)
+            return cycles
+    return execute
+
+
+def _abs(handler:Callable, opcode:int, operand_type:OperandType):
+    # zp and abs share the same shape: the operand is the effective address
+    return _zp(handler, opcode, operand_type)
+
+
+def _abx(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    if PAGE_CROSS_CYCLES[opcode]:
+        if operand_type is OperandType.VALUE:
+            def execute(cpu, operand):
+                X = cpu.regs.X
+                handler(cpu, cpu.bus.read_byte((operand + X) & 0xFFFF))
+                return cycles + (((operand & 0xFF) + X) >> 8)
+        else:
+            def execute(cpu, operand):
+                X = cpu.regs.X
+                handler(cpu, (operand + X) & 0xFFFF)
+                return cycles + (((operand & 0xFF) + X) >> 8)
+    elif operand_type is OperandType.VALUE:
+        def execute(cpu, operand):
+            handler(cpu, cpu.bus.read_byte((operand + cpu.regs.X) & 0xFFFF))
+            return cycles
+    else:
+        def execute(cpu, operand):
+            handler(cpu, (operand + cpu.regs.X) & 0xFFFF)
+            return cycles
+    return execute
+
+
+def _aby(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    if PAGE_CROSS_CYCLES[opcode]:
+        if operand_type is OperandType.VALUE:
+            def execute(cpu, operand):
+                Y = cpu.regs.Y
+                handler(cpu, cpu.bus.read_byte((operand + Y) & 0xFFFF))
+                return cycles + (((operand & 0xFF) + Y) >> 8)
+        else:
+            def execute(cpu, operand):
+                Y = cpu.regs.Y
+                handler(cpu, (operand + Y) & 0xFFFF)
+                return cycles + (((operand & 0xFF) + Y) >> 8)
+    elif operand_type is OperandType.VALUE:
+        def execute(cpu, operand):
+            handler(cpu, cpu.bus.read_byte((operand + cpu.regs.Y) & 0xFFFF))
+            return cycles
+    else:
+        def execute(cpu, operand):
+            handler(cpu, (operand + cpu.regs.Y) & 0xFFFF)
+            return cycles
+    return execute
+
+
+def _ind(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    def execute(cpu, operand):
+        read_byte = cpu.bus.read_byte
+        ## to emulate 6502 bug
+        lo = read_byte(operand)
+        hi = read_byte((operand & 0xFF00) | ((operand + 1) & 0xFF))
+        handler(cpu, (hi << 8) | lo)
+        return cycles
+    return execute
+
+
+def _izx(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    if operand_type is OperandType.VALUE:
+        def execute(cpu, operand):
+            read_byte = cpu.bus.read_byte
+            ptr = (operand + cpu.regs.X) & 0xFF
+            addr = (read_byte((ptr + 1) & 0xFF) << 8) | read_byte(ptr)
+            handler(cpu, read_byte(addr))
+            return cycles
+    else:
+        def execute(cpu, operand):
+            read_byte = cpu.bus.read_byte
+            ptr = (operand + cpu.regs.X) & 0xFF
+            addr = (read_byte((ptr + 1) & 0xFF) << 8) | read_byte(ptr)
+            handler(cpu, addr)
+            return cycles
+    return execute
+
+
+def _izy(handler:Callable, opcode:int, operand_type:OperandType):
+    cycles = BASE_CYCLES[opcode]
+    if PAGE_CROSS_CYCLES[opcode]:
+        def execute(cpu, operand):
+            read_byte = cpu.bus.read_byte
+            Y = cpu.regs.Y
+            base = (read_byte((operand + 1) & 0xFF) << 8) | read_byte(operand)
+            handler(cpu, read_byte((base + Y) & 0xFFFF))
+            return cycles + (((base & 0xFF) + Y) >> 8)
+    elif operand_type is OperandType.VALUE:
+        def execute(cpu, operand):
+            read_byte = cpu.bus.read_byte
+            addr = (((read_byte((operand + 1) & 0xFF) << 8) | read_byte(operand)) + cpu.regs.Y) & 0xFFFF
+            handler(cpu, read_byte(addr))
+            return cycles
+    else:
+        def execute(cpu, operand):
+            read_byte = cpu.bus.read_byte
+            addr = (((read_byte((operand + 1) & 0xFF) << 8) | read_byte(operand)) + cpu.regs.Y) & 0xFFFF
+            handler(cpu, addr)
+            return cycles
+    return execute
+
+
+ADDRESSING_FACTORIES = {
+    AddressingMethod.imp: _imp,
+    AddressingMethod.acc: _acc,
+    AddressingMethod.imm: _imm,
+    AddressingMethod.zp: _zp,
+    AddressingMethod.zpx: _zpx,
+    AddressingMethod.zpy: _zpy,
+    AddressingMethod.rel: _rel,
+    AddressingMethod.abs: _abs,
+    AddressingMethod.abx: _abx,
+    AddressingMethod.aby: _aby,
+    AddressingMethod.ind: _ind,
+    AddressingMethod.izx: _izx,
+    AddressingMethod.izy: _izy,
+}
+
+
+def build_opcode_table() -> List[Callable]:
+    table = [None] * 256
+    for opcode, (mnemonic, addressing_method, length, cycles) in INSTRUCTION_TABLE.items():
+        handler = EXECUTION_METHODS.get(mnemonic, None)
+        if handler is None:
+            raise ValueError(f"Unsupported instruction: {mnemonic}")
+        factory = ADDRESSING_FACTORIES[addressing_method]
+        execute = factory(handler, opcode, OPERAND_TYPES[mnemonic])
+        execute.__name__ = f"{mnemonic}_{addressing_method.name}_{opcode:02X}"
+        table[opcode] = execute
+    return table
+
+
+OPCODE_TABLE: List[Callable] = build_opcode_table()
+OPCODE_LENGTHS: List[int] = [INSTRUCTION_TABLE[opcode][2] for opcode in range(256)]
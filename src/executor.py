@@ -4,33 +4,29 @@
 
 
 
-from typing import List, Tuple
+from enum import Enum
 from .interface import ICPU, Flags
-from .instruction import AddressingMethod, Instruction
+from .alu import ADC_TABLE, ASL_TABLE, COMPARE_TABLE, LSR_TABLE, ROL_TABLE, ROR_TABLE
+
+
+class OperandType(Enum):
+    VALUE = 1       # handler(cpu, M): the byte at the effective address (or the immediate)
+    ADDRESS = 2     # handler(cpu, addr): the effective address (None for accumulator)
+    NONE = 3        # handler(cpu): implied
 
 
 EXECUTION_METHODS = {}
+OPERAND_TYPES = {}
 
-def method_register(func_name):
+def method_register(func_name, operand_type:OperandType=OperandType.VALUE):
     def decorator(func):
         EXECUTION_METHODS[func_name] = func
+        OPERAND_TYPES[func_name] = operand_type
         return func
     return decorator
 
 
 
-class Executor:
-    def __init__(self, cpu: ICPU):
-        self.cpu = cpu
-
-    def execute(self, ins: Instruction):
-        method = EXECUTION_METHODS.get(ins.mnemonic, None)
-        if method is None:
-            raise ValueError(f"Unsupported instruction: {ins.mnemonic}")
-        method(self.cpu, ins)
-
-
-
 
 def push_byte(cpu:ICPU, data:bytes):
     addr = cpu.regs.SP + 0x100
@@ -61,884 +57,394 @@ def pull_word(cpu:ICPU) -> int:
     high = pull_byte(cpu)
     return (high << 8) | low
 
-def add_8bit(*nums:List[bytes])->Tuple[bytes, bool, bool, bool]:
-    # 初始值
-    total = 0
-    carry = False
-    overflow = False
-    
-    for num in nums:
-        # num = int(num) & 0xFF
-        new_total = total + num
-        
-        # 检查进位
-        carry |= new_total > 0xFF
-        
-        # 计算临时结果
-        result = new_total & 0xFF
-        
-        # 检查溢出（通过检查符号位）
-        sign_total = total >> 7
-        sign_num = num >> 7
-        sign_result = result >> 7
-        overflow |= (sign_total == sign_num) and (sign_total != sign_result)
-        
-        # 更新总数
-        total = result
-    
-    # 检查结果的正负
-    is_negative = total >> 7 == 1
-    total &= 0xFF
-    return total, is_negative, carry, overflow
-
-def sub_8bit(*nums:List[bytes])->Tuple[bytes, bool, bool, bool]:
-    # 初始值为第一个数
-    total = int(nums[0]) & 0xFF
-    carry = False
-    overflow = False
-    
-    for num in nums[1:]:
-        # num = int(num) & 0xFF
-        # 补码减法
-        num = (~num + 1) & 0xFF
-        new_total = total + num
-        
-        # # 检查进位
-        carry |= new_total > 0xFF
-        
-        # 计算临时结果
-        result = new_total & 0xFF
-        
-        # 检查溢出（通过检查符号位）
-        sign_total = total >> 7
-        sign_num = num >> 7
-        sign_result = result >> 7
-        overflow |= (sign_total == sign_num) and (sign_total != sign_result)
-
-        # result, n, c, v = add_8bit(total, num)
-
-        # carry |= c
-        # overflow |= v
-        
-        # 更新总数
-        total = result
-    
-    # 检查结果的正负
-    is_negative = total >> 7 == 1
-    total &= 0xFF
-    return total, is_negative, carry, overflow
-
-def bcd_to_decimal(bcd):
-    """Convert BCD (Binary Coded Decimal) to Decimal."""
-    decimal = 0
-    multiplier = 1
-    while bcd > 0:
-        decimal += (bcd & 0xF) * multiplier
-        multiplier *= 10
-        bcd >>= 4
-    return decimal
-
-def decimal_to_bcd(decimal):
-    """Convert Decimal to BCD (Binary Coded Decimal)."""
-    bcd = 0
-    shift = 0
-    while decimal > 0:
-        bcd |= (decimal % 10) << shift
-        decimal //= 10
-        shift += 4
-    return bcd
-
-def bcd_add(*nums:List[bytes]):
-    """Perform BCD addition and return the result, carry, overflow, and sign."""
-    result_dec = bcd_to_decimal(nums[0])
-    for num in nums[1:]:
-        result_dec += bcd_to_decimal(num)
-
-    # Check for carry and overflow
-    max_bcd = 0x99  # Maximum value for 4-digit BCD (99)
-    carry = 1 if result_dec > max_bcd else 0
-    overflow = 1 if result_dec > 99 else 0
-
-    # Convert result back to BCD
-    result_bcd = decimal_to_bcd(result_dec)
-
-    # Determine the sign (positive or negative)
-    is_negative = 0 if result_dec >= 0 else 1
-
-    return result_bcd & 0xFF, is_negative, carry, overflow
-
-def bcd_sub(*nums:List[bytes]):
-    """Perform BCD subtraction and return the result, carry, overflow, and sign."""
-    result_dec = bcd_to_decimal(nums[0])
-    for num in nums[1:]:
-        result_dec -= bcd_to_decimal(num)
-
-    # Check for carry and overflow
-    carry = 1 if result_dec < 0 else 0
-    overflow = 0  # No overflow in subtraction for BCD
-
-    # Convert result back to BCD
-    result_bcd = decimal_to_bcd(abs(result_dec))
-
-    # Determine the sign (positive or negative)
-    is_negative = 0 if result_dec >= 0 else 1
-
-    return result_bcd & 0xFF, is_negative, carry, overflow
-
-
-
 
 
 @method_register("ADC")
-def ADC(cpu: ICPU, ins: Instruction):
+def ADC(cpu: ICPU, M: bytes):
     # A,Z,C,N = A + M + C
-    C = cpu.regs.P.C
-    A = cpu.regs.A
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    
-    result, is_negative, carry, overflow = add_8bit(A, M, C)
-
-    if result == 0:
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if carry:
-        cpu.regs.P.C = 1
-    else:
-        cpu.regs.P.C = 0
-        
-    if is_negative:
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    if overflow:
-        cpu.regs.P.V = 1
-    else:
-        cpu.regs.P.V = 0
-
-    cpu.regs.A = result
-    cpu.defer_cycles += ins.cycles[0]
+    regs = cpu.regs
+    value = ADC_TABLE[((regs.P & Flags.C) << 16) | (regs.A << 8) | M]
+    regs.A = regs.nz = value & 0xFF
+    regs.P = (regs.P & ~(Flags.C | Flags.V)) | (value >> 8)
 
 
 @method_register("AND")
-def AND(cpu: ICPU, ins: Instruction):
+def AND(cpu: ICPU, M: bytes):
     # A,Z,N = A & M
-    A = cpu.regs.A
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    result = A & M
-    if result == 0:
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (result >> 7) & 0x01:
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.A = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+    result = cpu.regs.A & M
+    cpu.regs.nz = result
+    cpu.regs.A = result
 
 
-@method_register("ASL")
-def ASL(cpu: ICPU, ins: Instruction):
+@method_register("ASL", OperandType.ADDRESS)
+def ASL(cpu: ICPU, addr: int|None):
     # A,Z,C,N = M << 1
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    addr = ins.addr
-    result = M << 1
-
-    if (result & 0xFF) == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
+    value = ASL_TABLE[cpu.regs.A if addr is None else cpu.bus.read_byte(addr)]
+    result = cpu.regs.nz = value & 0xFF
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | (value >> 8)
 
-    if (M >> 7 )& 0x01:
-        # C
-        cpu.regs.P.C = 1
+    if addr is None:
+        cpu.regs.A = result
     else:
-        cpu.regs.P.C = 0
+        cpu.bus.write_byte(addr, result)
 
-    if (result >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    if ins.addressing_method == AddressingMethod.acc:
-        cpu.regs.A = result & 0xFF
-    else:
-        cpu.bus.write_byte(addr, result & 0xFF)
-    cpu.defer_cycles += ins.cycles[0]
 
 
+@method_register("BCC", OperandType.ADDRESS)
+def BCC(cpu: ICPU, addr: int):
+    if not cpu.regs.P & Flags.C:
+        cpu.regs.PC = addr
+        return 1
+    return 0
 
-@method_register("BCC")
-def BCC(cpu: ICPU, ins: Instruction):
-    if not cpu.regs.P.C:
-        cpu.regs.PC = ins.addr
-        cpu.defer_cycles += 1
 
-    cpu.defer_cycles += ins.cycles[0]
+@method_register("BCS", OperandType.ADDRESS)
+def BCS(cpu: ICPU, addr: int):
+    if cpu.regs.P & Flags.C:
+        cpu.regs.PC = addr
+        return 1
+    return 0
 
-@method_register("BCS")
-def BCS(cpu: ICPU, ins: Instruction):
-    if cpu.regs.P.C:
-        cpu.regs.PC = ins.addr
-        cpu.defer_cycles += 1
 
-    cpu.defer_cycles += ins.cycles[0]
+@method_register("BEQ", OperandType.ADDRESS)
+def BEQ(cpu: ICPU, addr: int):
+    # check if Z flag is set
+    if not cpu.regs.nz & 0x3FF:
+        cpu.regs.PC = addr
+        return 1
+    return 0
 
-@method_register("BEQ")
-def BEQ(cpu: ICPU, ins: Instruction):
-    if cpu.regs.P.Z:
-        cpu.regs.PC = ins.addr
-        cpu.defer_cycles += 1
-
-    cpu.defer_cycles += ins.cycles[0]
 
 @method_register("BIT")
-def BIT(cpu: ICPU, ins: Instruction):
+def BIT(cpu: ICPU, M: bytes):
     # Z,N,V = M & A
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    A = cpu.regs.A
-    result = M & A
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
+    # N comes from M itself, 0x400 stands for N and Z both set
+    if M & cpu.regs.A:
+        cpu.regs.nz = (M & 0x80) | 0x01
     else:
-        cpu.regs.P.Z = 0
+        cpu.regs.nz = (M & 0x80) << 3
+    cpu.regs.P = (cpu.regs.P & ~Flags.V) | (M & Flags.V)
 
-    # V
-    m6 = ((M >> 6) & 0x01)
-    if m6 == 1:
-        cpu.regs.P.V = 1
-    else:
-        cpu.regs.P.V = 0
 
-    # N
-    m7 = ((M >> 7) & 0x01)
-    if m7 == 1:
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.defer_cycles += ins.cycles[0]
 
-
-@method_register("BMI")
-def BMI(cpu: ICPU, ins: Instruction):
+@method_register("BMI", OperandType.ADDRESS)
+def BMI(cpu: ICPU, addr: int):
     # check if N flag is set
-    if cpu.regs.P.N:
-        cpu.regs.PC = ins.addr
-        cpu.defer_cycles += 1
+    if cpu.regs.nz & 0x480:
+        cpu.regs.PC = addr
+        return 1
+    return 0
 
-    cpu.defer_cycles += ins.cycles[0]
 
-@method_register("BNE")
-def BNE(cpu: ICPU, ins: Instruction):
+@method_register("BNE", OperandType.ADDRESS)
+def BNE(cpu: ICPU, addr: int):
     # check if Z flag is not set
-    if not cpu.regs.P.Z:
-        cpu.regs.PC = ins.addr
-        cpu.defer_cycles += 1
+    if cpu.regs.nz & 0x3FF:
+        cpu.regs.PC = addr
+        return 1
+    return 0
 
-    cpu.defer_cycles += ins.cycles[0]
 
-@method_register("BPL")
-def BPL(cpu: ICPU, ins: Instruction):
+@method_register("BPL", OperandType.ADDRESS)
+def BPL(cpu: ICPU, addr: int):
     # check if N flag is not set
-    if not cpu.regs.P.N:
-        cpu.regs.PC = ins.addr
-        cpu.defer_cycles += 1
+    if not cpu.regs.nz & 0x480:
+        cpu.regs.PC = addr
+        return 1
+    return 0
 
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("BRK")
-def BRK(cpu: ICPU, ins: Instruction):
+@method_register("BRK", OperandType.NONE)
+def BRK(cpu: ICPU):
 
-    push_word(cpu, cpu.regs.PC)
-    push_byte(cpu, cpu.regs.P)
+    # the byte after BRK is a padding byte, so the return address skips it
+    push_word(cpu, cpu.regs.PC + 1)
+    push_byte(cpu, cpu.regs.read_status() | Flags.B | Flags.U)
 
+    cpu.regs.P |= Flags.I
     cpu.regs.PC = cpu.bus.read_word(cpu.IRQ_ADDR)
-    cpu.regs.P.B = 1
 
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("BVC")
-def BVC(cpu: ICPU, ins: Instruction):
-    if not cpu.regs.P.V:
-        cpu.regs.PC = ins.addr
-        cpu.defer_cycles += 1
+@method_register("BVC", OperandType.ADDRESS)
+def BVC(cpu: ICPU, addr: int):
+    if not cpu.regs.P & Flags.V:
+        cpu.regs.PC = addr
+        return 1
+    return 0
     
-    cpu.defer_cycles += ins.cycles[0]
 
-@method_register("BVS")
-def BVS(cpu: ICPU, ins: Instruction):
-    if cpu.regs.P.V:
-        cpu.regs.PC = ins.addr
-        cpu.defer_cycles += 1
+@method_register("BVS", OperandType.ADDRESS)
+def BVS(cpu: ICPU, addr: int):
+    if cpu.regs.P & Flags.V:
+        cpu.regs.PC = addr
+        return 1
+    return 0
 
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("CLC")
-def CLC(cpu: ICPU, ins: Instruction):
+@method_register("CLC", OperandType.NONE)
+def CLC(cpu: ICPU):
     # clear C flag
-    cpu.regs.P.C = 0
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.P &= ~Flags.C
 
 
-@method_register("CLD")
-def CLD(cpu: ICPU, ins: Instruction):
+@method_register("CLD", OperandType.NONE)
+def CLD(cpu: ICPU):
     # clear D flag
-    cpu.regs.P.D = 0
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.P &= ~Flags.D
 
 
-@method_register("CLI")
-def CLI(cpu: ICPU, ins: Instruction):
+@method_register("CLI", OperandType.NONE)
+def CLI(cpu: ICPU):
     # clear I flag
-    cpu.regs.P.I = 0
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.P &= ~Flags.I
 
 
-@method_register("CLV")
-def CLV(cpu: ICPU, ins: Instruction):
+@method_register("CLV", OperandType.NONE)
+def CLV(cpu: ICPU):
     # clear V flag
-    cpu.regs.P.V = 0
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.P &= ~Flags.V
 
 
 @method_register("CMP")
-def CMP(cpu: ICPU, ins: Instruction):
+def CMP(cpu: ICPU, M: bytes):
     # compare A with M
     # Z,C,N = A-M
-    A = cpu.regs.A
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    if M >> 7 == 1:
-        M = M & 0x7F - 128
-    if A >> 7 == 1:
-        A = A & 0x7F - 128
-
-    result = A - M
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else: 
-        cpu.regs.P.Z = 0
-
-    if result >= 0:
-        # C
-        cpu.regs.P.C = 1
-    else:
-        cpu.regs.P.C = 0
-
-    if (result >> 7) & 0x1:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
+    value = COMPARE_TABLE[(cpu.regs.A << 8) | M]
+    cpu.regs.nz = value & 0xFF
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | (value >> 8)
 
 
-    cpu.defer_cycles += ins.cycles[0]
 
 
 @method_register("CPX")
-def CPX(cpu: ICPU, ins: Instruction):
+def CPX(cpu: ICPU, M: bytes):
     # compare X with M
     # Z,C,N = X-M
-    X = cpu.regs.X
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    if M >> 7 == 1:
-        M = M & 0x7F - 128
-    if X >> 7 == 1:
-        X = X & 0x7F - 128
-        
-    result = X - M
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else: 
-        cpu.regs.P.Z = 0
-
-    if result >= 0:
-        # C
-        cpu.regs.P.C = 1
-    else:
-        cpu.regs.P.C = 0
-
-    if (result >> 7) & 0x1:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
+    value = COMPARE_TABLE[(cpu.regs.X << 8) | M]
+    cpu.regs.nz = value & 0xFF
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | (value >> 8)
 
-    cpu.defer_cycles += ins.cycles[0]
 
 
 @method_register("CPY")
-def CPY(cpu: ICPU, ins: Instruction):
+def CPY(cpu: ICPU, M: bytes):
     # compare Y with M
     # Z,C,N = Y-M
-    Y = cpu.regs.Y
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-
-    if M >> 7 == 1:
-        M = M & 0x7F - 128
-    if Y >> 7 == 1:
-        Y = Y & 0x7F - 128
-
-    result = Y - M
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else: 
-        cpu.regs.P.Z = 0
-
-    if result >= 0:
-        # C
-        cpu.regs.P.C = 1
-    else:
-        cpu.regs.P.C = 0
-
-    if (result >> 7) & 0x1:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
+    value = COMPARE_TABLE[(cpu.regs.Y << 8) | M]
+    cpu.regs.nz = value & 0xFF
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | (value >> 8)
 
 
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("DEC")
-def DEC(cpu: ICPU, ins: Instruction):
+@method_register("DEC", OperandType.ADDRESS)
+def DEC(cpu: ICPU, addr: int):
     # M = M - 1
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    addr = ins.addr
-    result, is_negative, carry, overflow = sub_8bit(M, 1)
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if is_negative:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.bus.write_byte(addr, result & 0xFF)
-    cpu.defer_cycles += ins.cycles[0]
+    result = (cpu.bus.read_byte(addr) - 1) & 0xFF
+    cpu.regs.nz = result
+    cpu.bus.write_byte(addr, result)
 
 
-@method_register("DEX")
-def DEX(cpu: ICPU, ins: Instruction):
+@method_register("DEX", OperandType.NONE)
+def DEX(cpu: ICPU):
     # X = X - 1
-    X = cpu.regs.X
-    result, is_negative, carry, overflow = sub_8bit(X, 1)
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if is_negative:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.X = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+    result = (cpu.regs.X - 1) & 0xFF
+    cpu.regs.nz = result
+    cpu.regs.X = result
 
 
-@method_register("DEY")
-def DEY(cpu: ICPU, ins: Instruction):
+@method_register("DEY", OperandType.NONE)
+def DEY(cpu: ICPU):
     # Y = Y - 1
-    Y = cpu.regs.Y
-    result, is_negative, carry, overflow = sub_8bit(Y, 1)
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if is_negative:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.Y = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+    result = (cpu.regs.Y - 1) & 0xFF
+    cpu.regs.nz = result
+    cpu.regs.Y = result
 
 
 @method_register("EOR")
-def EOR(cpu: ICPU, ins: Instruction):
+def EOR(cpu: ICPU, M: bytes):
     # A,Z,N = A ^ M
-    A = cpu.regs.A
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    result = A ^ M
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (result >> 7) & 0x01 :
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.A = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+    result = cpu.regs.A ^ M
+    cpu.regs.nz = result
+    cpu.regs.A = result
 
 
-@method_register("INC")
-def INC(cpu: ICPU, ins: Instruction):
+@method_register("INC", OperandType.ADDRESS)
+def INC(cpu: ICPU, addr: int):
     # M = M + 1
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    addr = ins.addr
-    result, is_negative, carry, overflow = add_8bit(M, 1)
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if is_negative:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.bus.write_byte(addr, result & 0xFF)
-    cpu.defer_cycles += ins.cycles[0]
+    result = (cpu.bus.read_byte(addr) + 1) & 0xFF
+    cpu.regs.nz = result
+    cpu.bus.write_byte(addr, result)
 
 
-@method_register("INX")
-def INX(cpu: ICPU, ins: Instruction):
+@method_register("INX", OperandType.NONE)
+def INX(cpu: ICPU):
     # X = X + 1
-    X = cpu.regs.X
-    result, is_negative, carry, overflow = add_8bit(X, 1)
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if is_negative:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.X = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+    result = (cpu.regs.X + 1) & 0xFF
+    cpu.regs.nz = result
+    cpu.regs.X = result
 
 
-@method_register("INY")
-def INY(cpu: ICPU, ins: Instruction):
+@method_register("INY", OperandType.NONE)
+def INY(cpu: ICPU):
     # Y = Y + 1
-    Y = cpu.regs.Y
-    result, is_negative, carry, overflow = add_8bit(Y, 1)
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if is_negative:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.Y = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+    result = (cpu.regs.Y + 1) & 0xFF
+    cpu.regs.nz = result
+    cpu.regs.Y = result
 
 
-@method_register("JMP")
-def JMP(cpu: ICPU, ins: Instruction):
+@method_register("JMP", OperandType.ADDRESS)
+def JMP(cpu: ICPU, addr: int):
     # PC = addr
-    cpu.regs.PC = ins.addr
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.PC = addr
 
 
-@method_register("JSR")
-def JSR(cpu: ICPU, ins: Instruction):
+@method_register("JSR", OperandType.ADDRESS)
+def JSR(cpu: ICPU, addr: int):
     # push PC-1, push P
 
     push_word(cpu, cpu.regs.PC-1)
     # push_byte(cpu.regs.P)
 
     # PC = addr
-    cpu.regs.PC = ins.addr
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.PC = addr
 
 
 @method_register("LDA")
-def LDA(cpu: ICPU, ins: Instruction):
+def LDA(cpu: ICPU, M: bytes):
     # A = M
-    A = cpu.regs.A
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    if M == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (M >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
+    cpu.regs.nz = M
     cpu.regs.A = M
-    cpu.defer_cycles += ins.cycles[0]
 
 
 @method_register("LDX")
-def LDX(cpu: ICPU, ins: Instruction):
+def LDX(cpu: ICPU, M: bytes):
     # X = M
-    X = cpu.regs.X
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    if M == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (M >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
+    cpu.regs.nz = M
     cpu.regs.X = M
-    cpu.defer_cycles += ins.cycles[0]
 
 
 @method_register("LDY")
-def LDY(cpu: ICPU, ins: Instruction):
+def LDY(cpu: ICPU, M: bytes):
     # Y = M
-    Y = cpu.regs.Y
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    if M == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (M >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
+    cpu.regs.nz = M
     cpu.regs.Y = M
-    cpu.defer_cycles += ins.cycles[0]
 
 
 
-@method_register("LSR")
-def LSR(cpu: ICPU, ins: Instruction):
+@method_register("LSR", OperandType.ADDRESS)
+def LSR(cpu: ICPU, addr: int|None):
     # M = M >> 1
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    addr = ins.addr
-    result = M >> 1
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if M & 0x01:
-        # C
-        cpu.regs.P.C = 1
-    else:
-        cpu.regs.P.C = 0
+    value = LSR_TABLE[cpu.regs.A if addr is None else cpu.bus.read_byte(addr)]
+    result = cpu.regs.nz = value & 0xFF
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | (value >> 8)
 
-    if (result >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
+    if addr is None:
+        cpu.regs.A = result
     else:
-        cpu.regs.P.N = 0
-
-    if ins.addressing_method == AddressingMethod.acc:
-        cpu.regs.A = result & 0xFF
-    else:
-        cpu.bus.write_byte(addr, result & 0xFF)
-    cpu.defer_cycles += ins.cycles[0]
+        cpu.bus.write_byte(addr, result)
 
 
-@method_register("NOP")
-def NOP(cpu: ICPU, ins: Instruction):
+@method_register("NOP", OperandType.ADDRESS)
+def NOP(cpu: ICPU, addr: int|None):
     # do nothing
-    cpu.defer_cycles += ins.cycles[0]
+    pass
 
 
 @method_register("ORA")
-def ORA(cpu: ICPU, ins: Instruction):
+def ORA(cpu: ICPU, M: bytes):
     # A,Z,N = A | M
-    A = cpu.regs.A
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    result = A | M
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (result >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.A = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+    result = cpu.regs.A | M
+    cpu.regs.nz = result
+    cpu.regs.A = result
 
 
 
-@method_register("PHA")
-def PHA(cpu: ICPU, ins: Instruction):
+@method_register("PHA", OperandType.NONE)
+def PHA(cpu: ICPU):
     # push A
 
     push_byte(cpu, cpu.regs.A)
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("PHP")
-def PHP(cpu: ICPU, ins: Instruction):
+@method_register("PHP", OperandType.NONE)
+def PHP(cpu: ICPU):
     # push P
     # push_byte(cpu.regs.P)
-    push_byte(cpu, cpu.regs.P.read() | Flags.B) # TODO:WTF? It's maybe a bug of NES CPU?
-    cpu.defer_cycles += ins.cycles[0]
+    push_byte(cpu, cpu.regs.read_status() | Flags.B) # TODO:WTF? It's maybe a bug of NES CPU?
 
 
-@method_register("PLA")
-def PLA(cpu: ICPU, ins: Instruction):
+@method_register("PLA", OperandType.NONE)
+def PLA(cpu: ICPU):
     # pull A
 
     A = pull_byte(cpu)
-    if A == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (A >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
+    cpu.regs.nz = A
 
     # cpu.regs.A = A
     
     # TODO:WTF? It's maybe a bug of NES CPU?
     cpu.regs.A = A 
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("PLP")
-def PLP(cpu: ICPU, ins: Instruction):
+@method_register("PLP", OperandType.NONE)
+def PLP(cpu: ICPU):
     # pull P
 
     P = pull_byte(cpu)
     # cpu.regs.P.write(P)
 
     # TODO:WTF? It's maybe a bug of NES CPU?
-    cpu.regs.P.write(P & (~Flags.B) | Flags.U)
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.write_status(P & (~Flags.B) | Flags.U)
 
 
-@method_register("ROL")
-def ROL(cpu: ICPU, ins: Instruction):
+@method_register("ROL", OperandType.ADDRESS)
+def ROL(cpu: ICPU, addr: int|None):
     # M = M << 1 | C
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    addr = ins.addr
-    result = (M << 1) | cpu.regs.P.C
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (M >> 7) & 0x01:
-        # C
-        cpu.regs.P.C = 1
-    else:
-        cpu.regs.P.C = 0
-
-    if (result >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
+    M = cpu.regs.A if addr is None else cpu.bus.read_byte(addr)
+    value = ROL_TABLE[((cpu.regs.P & Flags.C) << 8) | M]
+    result = cpu.regs.nz = value & 0xFF
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | (value >> 8)
 
-    if ins.addressing_method == AddressingMethod.acc:
-        cpu.regs.A = result & 0xFF
+    if addr is None:
+        cpu.regs.A = result
     else:
-        cpu.bus.write_byte(addr, result & 0xFF)
-    cpu.defer_cycles += ins.cycles[0]
+        cpu.bus.write_byte(addr, result)
 
 
-@method_register("ROR")
-def ROR(cpu: ICPU, ins: Instruction):
+@method_register("ROR", OperandType.ADDRESS)
+def ROR(cpu: ICPU, addr: int|None):
     # M = (C << 7) | (M >> 1)
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    addr = ins.addr
-    result = (cpu.regs.P.C << 7 )| ( M  >> 1 )
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if M  & 0x01:
-        # C
-        cpu.regs.P.C = 1
-    else:
-        cpu.regs.P.C = 0
-
-    if (result >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
+    M = cpu.regs.A if addr is None else cpu.bus.read_byte(addr)
+    value = ROR_TABLE[((cpu.regs.P & Flags.C) << 8) | M]
+    result = cpu.regs.nz = value & 0xFF
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | (value >> 8)
 
-    if ins.addressing_method == AddressingMethod.acc:
-        cpu.regs.A = result & 0xFF
+    if addr is None:
+        cpu.regs.A = result
     else:
-        cpu.bus.write_byte(addr, result & 0xFF)
-    cpu.defer_cycles += ins.cycles[0]
+        cpu.bus.write_byte(addr, result)
 
 
-@method_register("RTI")
-def RTI(cpu: ICPU, ins: Instruction):
+@method_register("RTI", OperandType.NONE)
+def RTI(cpu: ICPU):
     # pull P, pull PC
 
     P = pull_byte(cpu)
-    cpu.regs.P.write(P | Flags.U)
+    cpu.regs.write_status(P | Flags.U)
 
     # PC_lo = pull_byte(cpu)
     # PC_hi = pull_byte(cpu)
     PC = pull_word(cpu)
     cpu.regs.PC = PC
     # cpu.regs.PC += 1
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("RTS")
-def RTS(cpu: ICPU, ins: Instruction):
+@method_register("RTS", OperandType.NONE)
+def RTS(cpu: ICPU):
     # pull PC+1, pull PC
     # PC_lo = pull_byte(cpu)
     # PC_hi = pull_byte(cpu)
@@ -946,14 +452,12 @@ def RTS(cpu: ICPU, ins: Instruction):
     PC = pull_word(cpu)
     cpu.regs.PC = PC
     cpu.regs.PC += 1
-    cpu.defer_cycles += ins.cycles[0]
 
 
 # @method_register("SBC")
-# def SBC(cpu: ICPU, ins: Instruction):
+# def SBC(cpu: ICPU, M: bytes):
 #     A = cpu.regs.A
-#     M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-
+# 
 #     if cpu.regs.P.D:
 #         halfcarry = 1
 #         decimalcarry = 0
@@ -1015,213 +519,96 @@ def RTS(cpu: ICPU, ins: Instruction):
 #         cpu.regs.A = data
 
 
-#     cpu.defer_cycles += ins.cycles[0]
-
+# 
 @method_register("SBC")
-def SBC(cpu: ICPU, ins: Instruction):
-    # TODO: check this implementation
-
-    A = cpu.regs.A
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    carry = cpu.regs.P.C ^ 0x01
-
-    # Subtract M and the inverted carry from A
-    result = A - M - carry
-    
-    # Compute flags
-    carry_flag = 1 if result >= 0 else 0
-    zero_flag = 1 if result == 0 else 0
-    negative_flag = 1 if (result & 0x80) != 0 else 0  # Check if bit 7 is set
-    overflow_flag = 1 if ((A ^ result) & (A ^ M) & 0x80) != 0 else 0  # Check if sign bit is incorrect
-    
-    # # Result should be within 8 bits
-    # result &= 0xFF
-    # 处理进位和溢出
-    if carry_flag:
-        cpu.regs.P.C = 1
-
-    else:
-        cpu.regs.P.C = 0
-
-
-    # 处理零标志
-    if zero_flag:
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    # 处理溢出标志 (如果符号位不正确)
-    if overflow_flag:
-        cpu.regs.P.V = 1
-    else:
-        # cpu.regs.P.C = 1
-        cpu.regs.P.V = 0
-
-    # 处理负标志
-    if negative_flag:
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-    # TODO: check Overflow Flag
-
-    cpu.regs.A = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+def SBC(cpu: ICPU, M: bytes):
+    # A,Z,C,N,V = A - M - (1 - C), which is A + ~M + C
+    regs = cpu.regs
+    value = ADC_TABLE[((regs.P & Flags.C) << 16) | (regs.A << 8) | (M ^ 0xFF)]
+    regs.A = regs.nz = value & 0xFF
+    regs.P = (regs.P & ~(Flags.C | Flags.V)) | (value >> 8)
 
     
 
-@method_register("SEC")
-def SEC(cpu: ICPU, ins: Instruction):
+@method_register("SEC", OperandType.NONE)
+def SEC(cpu: ICPU):
     # C = 1
-    cpu.regs.P.C = 1
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.P |= Flags.C
 
 
-@method_register("SED")
-def SED(cpu: ICPU, ins: Instruction):
+@method_register("SED", OperandType.NONE)
+def SED(cpu: ICPU):
     # D = 1
-    cpu.regs.P.D = 1
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.P |= Flags.D
 
 
-@method_register("SEI")
-def SEI(cpu: ICPU, ins: Instruction):
+@method_register("SEI", OperandType.NONE)
+def SEI(cpu: ICPU):
     # I = 1
-    cpu.regs.P.I = 1
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.P |= Flags.I
 
 
-@method_register("STA")
-def STA(cpu: ICPU, ins: Instruction):
+@method_register("STA", OperandType.ADDRESS)
+def STA(cpu: ICPU, addr: int):
     # M = A
     A = cpu.regs.A
-    addr = ins.addr
     cpu.bus.write_byte(addr, A)
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("STX")
-def STX(cpu: ICPU, ins: Instruction):
+@method_register("STX", OperandType.ADDRESS)
+def STX(cpu: ICPU, addr: int):
     # M = X
     X = cpu.regs.X
-    addr = ins.addr
     cpu.bus.write_byte(addr, X)
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("STY")
-def STY(cpu: ICPU, ins: Instruction):
+@method_register("STY", OperandType.ADDRESS)
+def STY(cpu: ICPU, addr: int):
     # M = Y
     Y = cpu.regs.Y
-    addr = ins.addr
     cpu.bus.write_byte(addr, Y)
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("TAX")
-def TAX(cpu: ICPU, ins: Instruction):
+@method_register("TAX", OperandType.NONE)
+def TAX(cpu: ICPU):
     # X = A
-    X = cpu.regs.A
-    if X == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
+    cpu.regs.nz = cpu.regs.A
+    cpu.regs.X = cpu.regs.A
 
-    if (X >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
 
-    cpu.regs.X = X
-    cpu.defer_cycles += ins.cycles[0]
-
-
-@method_register("TAY")
-def TAY(cpu: ICPU, ins: Instruction):
+@method_register("TAY", OperandType.NONE)
+def TAY(cpu: ICPU):
     # Y = A
-    Y = cpu.regs.A
-    if Y == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (Y >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
+    cpu.regs.nz = cpu.regs.A
+    cpu.regs.Y = cpu.regs.A
 
-    cpu.regs.Y = Y
-    cpu.defer_cycles += ins.cycles[0]
 
-
-@method_register("TSX")
-def TSX(cpu: ICPU, ins: Instruction):
+@method_register("TSX", OperandType.NONE)
+def TSX(cpu: ICPU):
     # X = SP
     X = cpu.regs.SP
-    if X == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (X >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
+    cpu.regs.nz = X & 0xFF
     cpu.regs.X = X
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("TXA")
-def TXA(cpu: ICPU, ins: Instruction):
+@method_register("TXA", OperandType.NONE)
+def TXA(cpu: ICPU):
     # A = X
-    A = cpu.regs.X
-    if A == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (A >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.A = A
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.nz = cpu.regs.X
+    cpu.regs.A = cpu.regs.X
 
 
-@method_register("TXS")
-def TXS(cpu: ICPU, ins: Instruction):
+@method_register("TXS", OperandType.NONE)
+def TXS(cpu: ICPU):
     # SP = X
     cpu.regs.SP = cpu.regs.X
-    cpu.defer_cycles += ins.cycles[0]
 
 
-@method_register("TYA")
-def TYA(cpu: ICPU, ins: Instruction):
+@method_register("TYA", OperandType.NONE)
+def TYA(cpu: ICPU):
     # A = Y
-    A = cpu.regs.Y
-    if A == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else:
-        cpu.regs.P.Z = 0
-
-    if (A >> 7) & 0x01:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.A = A
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.regs.nz = cpu.regs.Y
+    cpu.regs.A = cpu.regs.Y
 
 
 
@@ -1244,203 +631,138 @@ def TYA(cpu: ICPU, ins: Instruction):
 
 
 ### Combined instructions
-@method_register("SLO")
-def SLO(cpu: ICPU, ins: Instruction):
-    ASL(cpu, ins)
-    if ins.addressing_method == AddressingMethod.acc:
-        ins.data = cpu.regs.A
-    else:
-        ins.data = cpu.bus.read_byte(ins.addr)
-
-    ORA(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
-
-
-@method_register("RLA")
-def RLA(cpu: ICPU, ins: Instruction):
-    ROL(cpu, ins)
-    if ins.addressing_method == AddressingMethod.acc:
-        ins.data = cpu.regs.A
-    else:
-        ins.data = cpu.bus.read_byte(ins.addr)
-        
-    AND(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+@method_register("SLO", OperandType.ADDRESS)
+def SLO(cpu: ICPU, addr: int|None):
+    ASL(cpu, addr)
+    ORA(cpu, cpu.regs.A if addr is None else cpu.bus.read_byte(addr))
 
 
-@method_register("SRE")
-def SRE(cpu: ICPU, ins: Instruction):
-    LSR(cpu, ins)
-    if ins.addressing_method == AddressingMethod.acc:
-        ins.data = cpu.regs.A
-    else:
-        ins.data = cpu.bus.read_byte(ins.addr)
+@method_register("RLA", OperandType.ADDRESS)
+def RLA(cpu: ICPU, addr: int|None):
+    ROL(cpu, addr)
+    AND(cpu, cpu.regs.A if addr is None else cpu.bus.read_byte(addr))
 
-    EOR(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
 
+@method_register("SRE", OperandType.ADDRESS)
+def SRE(cpu: ICPU, addr: int|None):
+    LSR(cpu, addr)
+    EOR(cpu, cpu.regs.A if addr is None else cpu.bus.read_byte(addr))
 
-@method_register("RRA")
-def RRA(cpu: ICPU, ins: Instruction):
-    ROR(cpu, ins)
-    if ins.addressing_method == AddressingMethod.acc:
-        ins.data = cpu.regs.A
-    else:
-        ins.data = cpu.bus.read_byte(ins.addr)
 
-    ADC(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+@method_register("RRA", OperandType.ADDRESS)
+def RRA(cpu: ICPU, addr: int|None):
+    ROR(cpu, addr)
+    ADC(cpu, cpu.regs.A if addr is None else cpu.bus.read_byte(addr))
 
 
 
-@method_register("SAX")
-def SAX(cpu: ICPU, ins: Instruction):
+@method_register("SAX", OperandType.ADDRESS)
+def SAX(cpu: ICPU, addr: int):
     # M = (A & X)
     A = cpu.regs.A
     X = cpu.regs.X
     result = (A & X)
-    cpu.bus.write_byte(ins.addr, result)
-    cpu.defer_cycles += ins.cycles[0]
-
-
-@method_register("LAX")
-def LAX(cpu: ICPU, ins: Instruction):
-    LDA(cpu, ins)
-    LDX(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+    cpu.bus.write_byte(addr, result)
 
 
-@method_register("DCP")
-def DCP(cpu: ICPU, ins: Instruction):
-    DEC(cpu, ins)
-    ins.data = cpu.bus.read_byte(ins.addr)
-    CMP(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+@method_register("DCP", OperandType.ADDRESS)
+def DCP(cpu: ICPU, addr: int):
+    DEC(cpu, addr)
+    CMP(cpu, cpu.bus.read_byte(addr))
 
-@method_register("ISB")
-@method_register("ISC")
-def ISC(cpu: ICPU, ins: Instruction):
-    INC(cpu, ins)
-    ins.data = cpu.bus.read_byte(ins.addr)
-    SBC(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+@method_register("ISB", OperandType.ADDRESS)
+@method_register("ISC", OperandType.ADDRESS)
+def ISC(cpu: ICPU, addr: int):
+    INC(cpu, addr)
+    SBC(cpu, cpu.bus.read_byte(addr))
 
 
 
 @method_register("ANC")
-def ANC(cpu: ICPU, ins: Instruction):
-    AND(cpu, ins)
-    cpu.regs.P.C = 0
-    cpu.regs.P |= (cpu.regs.A >> 7) & Flags.C
-    cpu.defer_cycles = ins.cycles[0]
+def ANC(cpu: ICPU, M: bytes):
+    AND(cpu, M)
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | ((cpu.regs.A >> 7) & 0x01)
 
 @method_register("ALR")
-def ALR(cpu: ICPU, ins: Instruction):
-    AND(cpu, ins)
-    LSR(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+def ALR(cpu: ICPU, M: bytes):
+    AND(cpu, M)
+    LSR(cpu, None)
 
 @method_register("ARR")
-def ARR(cpu: ICPU, ins: Instruction):
-    AND(cpu, ins)
-    ROR(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+def ARR(cpu: ICPU, M: bytes):
+    # C = bit 6 of the result, V = bit 6 ^ bit 5
+    AND(cpu, M)
+    ROR(cpu, None)
+    result = cpu.regs.A
+    cpu.regs.P = (cpu.regs.P & ~(Flags.C | Flags.V)) | ((result >> 6) & 0x01) | ((result ^ (result << 1)) & Flags.V)
 
 @method_register("XAA")
-def XAA(cpu: ICPU, ins: Instruction):
-    TAX(cpu, ins)
-    AND(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+def XAA(cpu: ICPU, M: bytes):
+    TAX(cpu)
+    AND(cpu, M)
 
 
 @method_register("LAX")
-def LAX(cpu: ICPU, ins: Instruction):
-    LDA(cpu, ins)
-    TAX(cpu, ins)
-    cpu.defer_cycles = ins.cycles[0]
+def LAX(cpu: ICPU, M: bytes):
+    LDA(cpu, M)
+    TAX(cpu)
 
 
 @method_register("AXS")
-def AXS(cpu: ICPU, ins: Instruction):
+def AXS(cpu: ICPU, M: bytes):
     # X = (A & X) - M
-    A = cpu.regs.A
-    X = cpu.regs.X
-    M = ins.data if ins.data is not None else cpu.bus.read_byte(ins.addr)
-    result = (A & X) - M
-
-    if result == 0:
-        # Z
-        cpu.regs.P.Z = 1
-    else: 
-        cpu.regs.P.Z = 0
-
-    if result >= 0:
-        # C
-        cpu.regs.P.C = 1
-    else:
-        cpu.regs.P.C = 0
-
-    if (result >> 7) & 0x1:
-        # N
-        cpu.regs.P.N = 1
-    else:
-        cpu.regs.P.N = 0
-
-    cpu.regs.X = result & 0xFF
-    cpu.defer_cycles += ins.cycles[0]
+    value = COMPARE_TABLE[((cpu.regs.A & cpu.regs.X) << 8) | M]
+    cpu.regs.X = cpu.regs.nz = value & 0xFF
+    cpu.regs.P = (cpu.regs.P & ~Flags.C) | (value >> 8)
 
 
 # @method_register("SBC*")
-# def SBC_star(cpu: ICPU, ins: Instruction):
+# def SBC_star(cpu: ICPU, M: bytes):
 #     SBC(cpu, ins)
 #     NOP(cpu, ins)
 
-@method_register("AHX")
-def AHX(cpu: ICPU, ins: Instruction):
+@method_register("AHX", OperandType.ADDRESS)
+def AHX(cpu: ICPU, addr: int):
     # M = (A & X) & 0xFF
     A = cpu.regs.A
     X = cpu.regs.X
     result = (A & X) & 0xFF
-    cpu.bus.write_byte(ins.addr, result)
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.bus.write_byte(addr, result)
 
 
-@method_register("SHX")
-def SHX(cpu: ICPU, ins: Instruction):
+@method_register("SHX", OperandType.ADDRESS)
+def SHX(cpu: ICPU, addr: int):
     # M = X & 0xFF
     X = cpu.regs.X
     result = X & 0xFF
-    cpu.bus.write_byte(ins.addr, result)
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.bus.write_byte(addr, result)
 
 
-@method_register("SHY")
-def SHY(cpu: ICPU, ins: Instruction):
+@method_register("SHY", OperandType.ADDRESS)
+def SHY(cpu: ICPU, addr: int):
     # M = Y & 0xFF
     Y = cpu.regs.Y
     result = Y & 0xFF
-    cpu.bus.write_byte(ins.addr, result)
-    cpu.defer_cycles += ins.cycles[0]
+    cpu.bus.write_byte(addr, result)
 
 
-@method_register("TAS")
-def TAS(cpu: ICPU, ins: Instruction):
+@method_register("TAS", OperandType.ADDRESS)
+def TAS(cpu: ICPU, addr: int):
     # SP+ = A & X
     # M = A & X & 0xFF
     A = cpu.regs.A
     X = cpu.regs.X
     result = A & X
     push_byte(cpu, result)
-    cpu.bus.write_byte(ins.addr, result & 0xFF)
+    cpu.bus.write_byte(addr, result & 0xFF)
 
 
 @method_register("LAS")
-def LAS(cpu: ICPU, ins: Instruction):
+def LAS(cpu: ICPU, M: bytes):
     # SP+ = M & SP-
     # A = M & SP-
     # X = M & SP-
     SP_ = pull_byte(cpu)
-    M = cpu.bus.read_byte(ins.addr)
     result = M & SP_
     cpu.regs.A = result
     cpu.regs.X = result
@@ -1449,6 +771,6 @@ def LAS(cpu: ICPU, ins: Instruction):
 
 
 
-@method_register("KIL")
-def KIL(cpu: ICPU, ins: Instruction):
+@method_register("KIL", OperandType.NONE)
+def KIL(cpu: ICPU):
     cpu._call_shutdown_hook()
\ No newline at end of file
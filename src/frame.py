@@ -1,15 +1,32 @@
 import numpy as np
 
 from .interface import IFrame
+from .palette import PALETTE_RGB
 
 
 class NPFrame(IFrame):
+    """
+    A frame of NES color indices (0-63), indices[y, x], as the PPU renders it.
+    data converts it to RGB [color, x, y] on first use after a render, so
+    frames nobody displays cost no conversion.
+    """
     width:int = 256
     height:int = 240
-    data:np.ndarray = np.zeros((3, width, height), dtype=np.uint8)
 
-    def set_pixel(self, x: int, y: int, color: tuple[int, int, int]):
-        self.data[0, x, y] = color[0]
-        self.data[1, x, y] = color[1]
-        self.data[2, x, y] = color[2]
+    def __init__(self):
+        self.indices:np.ndarray = np.zeros((self.height, self.width), dtype=np.uint8)
+        self.rgb:np.ndarray = np.zeros((3, self.width, self.height), dtype=np.uint8)
+        # set when indices changed since the last conversion
+        self.is_dirty:bool = True
 
+    @property
+    def data(self) -> np.ndarray:
+        if self.is_dirty:
+            np.take(PALETTE_RGB.T, self.indices.T, axis=1, out=self.rgb)
+            self.is_dirty = False
+        return self.rgb
+
+    def set_pixel(self, x: int, y: int, color: int):
+        # color is a NES color index, like everything the PPU renders
+        self.indices[y, x] = color
+        self.is_dirty = True
@@ -0,0 +1,457 @@
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from .alu import COMPARE_TABLE
+from .dispatch import OPCODE_LENGTHS, OPCODE_TABLE
+from .interface import Flags, IBus
+from .instruction import (BASE_CYCLES, BRANCH_PAGE_CROSS_CYCLES, BRANCH_TAKEN_CYCLES, INSTRUCTION_TABLE,
+                          PAGE_CROSS_CYCLES, AddressingMethod)
+
+
+# Superinstructions: short idioms that dominate game code run as one handler
+# with the same execute(cpu, operand) -> cycles shape as OPCODE_TABLE. A fused
+# handler performs the same bus accesses in the same order and leaves the
+# flags the separate instructions would. PC already points past the whole
+# idiom when it runs, like for any other instruction.
+#
+# A run_for() slice ends after the first instruction that reaches its budget.
+# When the slice could end before the last instruction of an idiom, the
+# handler runs only the first one, the rest follow as single instructions, so
+# slices (and the interrupts taken between them) end on the same instruction
+# as without fusion.
+#
+# Only plain memory is touched: loads from RAM or PRG-ROM, stores to RAM.
+# Anything that reaches the PPU, APU or mapper keeps running as single
+# instructions, since those accesses depend on the exact instruction time.
+#
+# Block loops (RAM clears and table copies) run many passes per call: the
+# whole passes that end before the run_for() slice may, with PC back at the
+# loop head if the loop isn't done yet. The pass the slice ends in runs as
+# single instructions.
+#
+# Every handler counts its runs and the instructions they stand for into a
+# [runs, instructions] list shared by all sites of its idiom, which the
+# per-ROM fusion report reads.
+
+FUSION_MAX_BYTES = 15
+
+BLOCK_FILL_MAX_STORES = 4
+
+# (mnemonic, addressing method, operand, opcode) of each instruction
+Part = Tuple[str, AddressingMethod, int|None, int]
+
+# [runs, instructions]
+Counter = List[int]
+
+FUSION_PATTERNS: List[Tuple[Tuple[str, ...], Callable]] = []
+
+
+def fusion_register(*mnemonics:str):
+    def decorator(factory:Callable):
+        FUSION_PATTERNS.append((mnemonics, factory))
+        # longest idioms are tried first
+        FUSION_PATTERNS.sort(key=lambda pattern: -len(pattern[0]))
+        return factory
+    return decorator
+
+
+def is_plain_load(addressing_method:AddressingMethod, operand:int|None) -> bool:
+    match addressing_method:
+        case AddressingMethod.imm | AddressingMethod.zp:
+            return True
+        case AddressingMethod.abs:
+            return operand < 0x2000 or operand >= 0x8000
+        case AddressingMethod.abx | AddressingMethod.aby:
+            return operand + 0xFF < 0x2000 or operand >= 0x8000
+    return False
+
+
+def is_plain_store(addressing_method:AddressingMethod, operand:int|None) -> bool:
+    match addressing_method:
+        case AddressingMethod.zp:
+            return True
+        case AddressingMethod.abs:
+            return operand < 0x2000
+        case AddressingMethod.abx | AddressingMethod.aby:
+            return operand + 0xFF < 0x2000
+    return False
+
+
+def branch_target(next_pc:int, offset:int) -> int:
+    return (next_pc + offset - 0x100) & 0xFFFF if offset & 0x80 else (next_pc + offset) & 0xFFFF
+
+
+def branch_taken_cycles(opcode:int, next_pc:int, target:int) -> int:
+    if (target ^ next_pc) > 0xFF:
+        return BRANCH_PAGE_CROSS_CYCLES[opcode]
+    return BRANCH_TAKEN_CYCLES[opcode]
+
+
+def page_cross(base:int, index:int) -> int:
+    return ((base & 0xFF) + index) >> 8
+
+
+def lead_cycles(parts:List[Part]) -> int:
+    # the most cycles the idiom can take before its last instruction
+    return sum(BASE_CYCLES[part[3]] + PAGE_CROSS_CYCLES[part[3]] for part in parts[:-1])
+
+
+def first_instruction(parts:List[Part], pc:int) -> Callable:
+    # runs only the first instruction of the idiom, as its OPCODE_TABLE handler
+    _, _, first_operand, opcode = parts[0]
+    execute = OPCODE_TABLE[opcode]
+    next_pc = pc + OPCODE_LENGTHS[opcode]
+
+    def execute_first(cpu):
+        cpu.regs.PC = next_pc
+        return execute(cpu, first_operand)
+    return execute_first
+
+
+@fusion_register("DEX", "BNE")
+@fusion_register("DEY", "BNE")
+@fusion_register("INX", "BNE")
+@fusion_register("INY", "BNE")
+def step_branch(parts:List[Part], pc:int, next_pc:int, counter:Counter) -> Callable|None:
+    # counted loops: DEX/BNE, INY/BNE ...
+    (mnemonic, _, _, step_opcode), (_, _, offset, branch_opcode) = parts
+    target = branch_target(next_pc, offset)
+    cycles = BASE_CYCLES[step_opcode] + BASE_CYCLES[branch_opcode]
+    taken_cycles = cycles + branch_taken_cycles(branch_opcode, next_pc, target)
+    delta = 1 if mnemonic[:2] == "IN" else 0xFF
+    lead = lead_cycles(parts)
+    first = first_instruction(parts, pc)
+
+    if mnemonic[2] == "X":
+        def execute(cpu, operand):
+            if cpu.slice_budget - cpu.slice_cycles <= lead:
+                return first(cpu)
+            counter[0] += 1
+            counter[1] += 2
+            regs = cpu.regs
+            result = (regs.X + delta) & 0xFF
+            regs.X = result
+            regs.nz = result
+            if result:
+                regs.PC = target
+                return taken_cycles
+            return cycles
+    else:
+        def execute(cpu, operand):
+            if cpu.slice_budget - cpu.slice_cycles <= lead:
+                return first(cpu)
+            counter[0] += 1
+            counter[1] += 2
+            regs = cpu.regs
+            result = (regs.Y + delta) & 0xFF
+            regs.Y = result
+            regs.nz = result
+            if result:
+                regs.PC = target
+                return taken_cycles
+            return cycles
+    return execute
+
+
+@fusion_register("INX", "CPX", "BNE")
+@fusion_register("INY", "CPY", "BNE")
+def step_compare_branch(parts:List[Part], pc:int, next_pc:int, counter:Counter) -> Callable|None:
+    # INY / CPY #n / BNE loop
+    (mnemonic, _, _, step_opcode), (_, compare_method, limit, compare_opcode), (_, _, offset, branch_opcode) = parts
+    if compare_method is not AddressingMethod.imm:
+        return None
+    target = branch_target(next_pc, offset)
+    cycles = BASE_CYCLES[step_opcode] + BASE_CYCLES[compare_opcode] + BASE_CYCLES[branch_opcode]
+    taken_cycles = cycles + branch_taken_cycles(branch_opcode, next_pc, target)
+    lead = lead_cycles(parts)
+    first = first_instruction(parts, pc)
+
+    if mnemonic[2] == "X":
+        def execute(cpu, operand):
+            if cpu.slice_budget - cpu.slice_cycles <= lead:
+                return first(cpu)
+            counter[0] += 1
+            counter[1] += 3
+            regs = cpu.regs
+            result = (regs.X + 1) & 0xFF
+            regs.X = result
+            value = COMPARE_TABLE[(result << 8) | limit]
+            regs.nz = value & 0xFF
+            regs.P = (regs.P & ~Flags.C) | (value >> 8)
+            if value & 0xFF:
+                regs.PC = target
+                return taken_cycles
+            return cycles
+    else:
+        def execute(cpu, operand):
+            if cpu.slice_budget - cpu.slice_cycles <= lead:
+                return first(cpu)
+            counter[0] += 1
+            counter[1] += 3
+            regs = cpu.regs
+            result = (regs.Y + 1) & 0xFF
+            regs.Y = result
+            value = COMPARE_TABLE[(result << 8) | limit]
+            regs.nz = value & 0xFF
+            regs.P = (regs.P & ~Flags.C) | (value >> 8)
+            if value & 0xFF:
+                regs.PC = target
+                return taken_cycles
+            return cycles
+    return execute
+
+
+@fusion_register("LDA", "STA")
+def load_store(parts:List[Part], pc:int, next_pc:int, counter:Counter) -> Callable|None:
+    # LDA/STA pairs and LDA abs,X / STA abs,Y copy loops
+    (_, load_method, source, load_opcode), (_, store_method, dest, store_opcode) = parts
+    if not is_plain_load(load_method, source) or not is_plain_store(store_method, dest):
+        return None
+    cycles = BASE_CYCLES[load_opcode] + BASE_CYCLES[store_opcode]
+    lead = lead_cycles(parts)
+    first = first_instruction(parts, pc)
+
+    if load_method is AddressingMethod.imm:
+        def execute(cpu, operand):
+            if cpu.slice_budget - cpu.slice_cycles <= lead:
+                return first(cpu)
+            counter[0] += 1
+            counter[1] += 2
+            regs = cpu.regs
+            regs.A = source
+            regs.nz = source
+            cpu.bus.write_byte(dest, source)
+            return cycles
+        return execute if store_method in (AddressingMethod.zp, AddressingMethod.abs) else None
+
+    if load_method in (AddressingMethod.zp, AddressingMethod.abs) \
+            and store_method in (AddressingMethod.zp, AddressingMethod.abs):
+        def execute(cpu, operand):
+            if cpu.slice_budget - cpu.slice_cycles <= lead:
+                return first(cpu)
+            counter[0] += 1
+            counter[1] += 2
+            regs = cpu.regs
+            bus = cpu.bus
+            M = bus.read_byte(source)
+            regs.A = M
+            regs.nz = M
+            bus.write_byte(dest, M)
+            return cycles
+        return execute
+
+    if load_method in (AddressingMethod.abx, AddressingMethod.aby) \
+            and store_method in (AddressingMethod.abx, AddressingMethod.aby):
+        load_x = load_method is AddressingMethod.abx
+        store_x = store_method is AddressingMethod.abx
+
+        def execute(cpu, operand):
+            if cpu.slice_budget - cpu.slice_cycles <= lead:
+                return first(cpu)
+            counter[0] += 1
+            counter[1] += 2
+            regs = cpu.regs
+            bus = cpu.bus
+            index = regs.X if load_x else regs.Y
+            M = bus.read_byte((source + index) & 0xFFFF)
+            regs.A = M
+            regs.nz = M
+            bus.write_byte((dest + (regs.X if store_x else regs.Y)) & 0xFFFF, M)
+            return cycles + page_cross(source, index)
+        return execute
+    return None
+
+
+INDEX_MODES = {
+    # addressing method -> (index register, RAM wraparound)
+    AddressingMethod.zpx: ("X", 0x100),
+    AddressingMethod.abx: ("X", 0x800),
+    AddressingMethod.aby: ("Y", 0x800),
+}
+
+
+def ram_slices(base:int, wrap:int, start:int, size:int) -> Iterator[Tuple[int, int, int]]:
+    # (RAM offset, offset in block, size) pieces of base+start ... base+start+size-1,
+    # split where zero page or the RAM mirror wraps around
+    offset = 0
+    while offset < size:
+        address = (base + start + offset) & (wrap - 1)
+        length = min(size - offset, wrap - address)
+        yield address, offset, length
+        offset += length
+
+
+def index_runs(first:int, count:int, delta:int) -> List[Tuple[int, int]]:
+    # index values of count passes starting at first, as ascending (start, size) runs
+    if delta == 1:
+        return [(first, count)]
+    low = first - count + 1
+    if low >= 0:
+        return [(low, count)]
+    return [(0, first + 1), (0x100 + low, -low)]
+
+
+def block_loop(parts:List[Part], pc:int, next_pc:int, counter:Counter, register:str, run:Callable) -> Callable|None:
+    # shared driver of the fill/copy loops: run(cpu, start, size) does the
+    # passes for index values start ... start+size-1 in one go and returns
+    # their page crossing penalties
+    (step, _, _, _), (_, _, offset, branch_opcode) = parts[-2:]
+    if step[2] != register or branch_target(next_pc, offset) != pc:
+        return None
+    taken_cycles = branch_taken_cycles(branch_opcode, next_pc, pc)
+    period = sum(BASE_CYCLES[part[3]] for part in parts) + taken_cycles
+    delta = 1 if step[:2] == "IN" else 0xFF
+    # pass n may start as late as (n - 1) * longest
+    lead = lead_cycles(parts)
+    longest = lead + BASE_CYCLES[branch_opcode] + taken_cycles
+    first_pass = first_instruction(parts, pc)
+
+    def execute(cpu, operand):
+        room = cpu.slice_budget - cpu.slice_cycles - lead
+        if room <= 0:
+            return first_pass(cpu)
+        regs = cpu.regs
+        first = getattr(regs, register)
+        left = (0x100 - first if delta == 1 else first) or 0x100
+        count = min(left, (room - 1) // longest + 1)
+        cycles = count * period
+        counter[0] += 1
+        counter[1] += count * len(parts)
+        for start, size in index_runs(first, count, delta):
+            cycles += run(cpu, start, size)
+        last = (first + (count - 1) * delta) & 0xFF
+        result = (last + delta) & 0xFF
+        setattr(regs, register, result)
+        regs.nz = result
+        if count == left:
+            return cycles - taken_cycles
+        regs.PC = pc
+        return cycles
+    return execute
+
+
+def fill_loop(parts:List[Part], pc:int, next_pc:int, counter:Counter) -> Callable|None:
+    # STA $0200,X / STA $0300,X / ... / INX / BNE: clear or fill RAM pages
+    stores = []
+    for _, addressing_method, base, _ in parts[:-2]:
+        if addressing_method not in INDEX_MODES:
+            return None
+        register, wrap = INDEX_MODES[addressing_method]
+        if wrap == 0x800 and not is_plain_store(addressing_method, base):
+            return None
+        stores.append((base, wrap))
+    registers = {INDEX_MODES[part[1]][0] for part in parts[:-2]}
+    if len(registers) != 1:
+        return None
+
+    def run(cpu, start, size):
+        bus = cpu.bus
+        value = cpu.regs.A
+        for base, wrap in stores:
+            for address, _, length in ram_slices(base, wrap, start, size):
+                bus.fill_ram(address, length, value)
+        return 0
+    return block_loop(parts, pc, next_pc, counter, registers.pop(), run)
+
+
+for stores in range(1, BLOCK_FILL_MAX_STORES + 1):
+    for step in ("INX", "DEX", "INY", "DEY"):
+        fusion_register(*(("STA",) * stores), step, "BNE")(fill_loop)
+
+
+@fusion_register("LDA", "STA", "INX", "BNE")
+@fusion_register("LDA", "STA", "DEX", "BNE")
+@fusion_register("LDA", "STA", "INY", "BNE")
+@fusion_register("LDA", "STA", "DEY", "BNE")
+def copy_loop(parts:List[Part], pc:int, next_pc:int, counter:Counter) -> Callable|None:
+    # LDA table,X / STA $0300,X / INX / BNE: copy a table into RAM
+    (_, load_method, source, load_opcode), (_, store_method, dest, _) = parts[:2]
+    if load_method not in INDEX_MODES or store_method not in INDEX_MODES:
+        return None
+    register, source_wrap = INDEX_MODES[load_method]
+    store_register, dest_wrap = INDEX_MODES[store_method]
+    if store_register != register:
+        return None
+    if dest_wrap == 0x800 and not is_plain_store(store_method, dest):
+        return None
+    from_rom = source_wrap == 0x800 and source >= 0x8000
+    if from_rom:
+        if source + 0xFF > 0xFFFF:
+            return None
+    elif source_wrap == 0x800 and source + 0xFF >= 0x2000:
+        return None
+    sources = {(source + index) & (source_wrap - 1) for index in range(0x100)}
+    dests = {(dest + index) & (dest_wrap - 1) for index in range(0x100)}
+    # overlapping blocks are copied byte by byte, in the order of the loop
+    ordered = not from_rom and not sources.isdisjoint(dests)
+    delta = 1 if parts[2][0][:2] == "IN" else -1
+    # index values from here on cross into the next page when loading
+    crossing = 0x100 - (source & 0xFF) if PAGE_CROSS_CYCLES[load_opcode] else 0x100
+
+    def run(cpu, start, size):
+        bus = cpu.bus
+        if ordered:
+            indexes = range(start, start + size) if delta == 1 else range(start + size - 1, start - 1, -1)
+            for index in indexes:
+                value = bus.read_byte((source + index) & (source_wrap - 1))
+                bus.write_byte((dest + index) & (dest_wrap - 1), value)
+        else:
+            if from_rom:
+                data = bytes([bus.read_byte(source + index) for index in range(start, start + size)])
+            else:
+                data = b"".join(bus.read_ram(address, length)
+                                for address, _, length in ram_slices(source, source_wrap, start, size))
+            for address, offset, length in ram_slices(dest, dest_wrap, start, size):
+                bus.write_ram(address, data[offset:offset + length])
+        # A holds the byte of the last pass
+        last = start if delta == -1 else start + size - 1
+        regs = cpu.regs
+        if from_rom:
+            regs.A = bus.read_byte(source + last)
+        else:
+            regs.A = bus.read_byte((source + last) & (source_wrap - 1))
+        return max(0, start + size - max(start, crossing))
+    return block_loop(parts, pc, next_pc, counter, register, run)
+
+
+def read_part(bus:IBus, pc:int) -> Tuple[Part, int]:
+    opcode = bus.read_byte(pc)
+    mnemonic, addressing_method, length, _ = INSTRUCTION_TABLE[opcode]
+    if length == 1:
+        operand = None
+    elif length == 2:
+        operand = bus.read_byte(pc + 1)
+    else:
+        operand = bus.read_byte(pc + 1) | (bus.read_byte(pc + 2) << 8)
+    return (mnemonic, addressing_method, operand, opcode), length
+
+
+def fuse(bus:IBus, pc:int, counters:Dict[str, Counter]) -> Tuple[str, Callable, int]|None:
+    """
+    Match the idioms starting at pc, returns (name, execute, length) of the
+    first fused handler that applies or None. Its runs are counted in
+    counters[name], which is added when missing.
+    """
+    first, length = read_part(bus, pc)
+    for mnemonics, factory in FUSION_PATTERNS:
+        if mnemonics[0] != first[0]:
+            continue
+        parts = [first]
+        end = pc + length
+        for mnemonic in mnemonics[1:]:
+            if end + 2 >= 0x10000:
+                break
+            part, part_length = read_part(bus, end)
+            if part[0] != mnemonic:
+                break
+            parts.append(part)
+            end += part_length
+        if len(parts) != len(mnemonics):
+            continue
+        name = "/".join(mnemonics)
+        counter = counters.get(name, [0, 0])
+        execute = factory(parts, pc, end, counter)
+        if execute is not None:
+            counters[name] = counter
+            execute.__name__ = name.replace("/", "_")
+            return name, execute, end - pc
+    return None
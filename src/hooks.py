@@ -0,0 +1,51 @@
+from enum import Enum
+from typing import Callable, List, Tuple
+
+
+class CPUHookType(Enum):
+    # per instruction, only while hooks are enabled
+    STATUS = 1
+    BEFORE_EXEC = 2
+    AFTER_EXEC= 3
+    # per event, called from wherever the event happens
+    ON_SHUTDOWN = 4
+    ON_FRAME_START = 5
+    ON_VBLANK = 6
+    ON_SCANLINE = 7
+    ON_NMI = 8
+
+
+# fired by the PPU from its scheduler events
+FRAME_HOOK_TYPES = frozenset((CPUHookType.ON_FRAME_START, CPUHookType.ON_VBLANK, CPUHookType.ON_SCANLINE))
+
+
+# (func, args, kwargs)
+Hook = Tuple[Callable, Tuple, dict]
+
+
+def compile_hook_chain(name:str, calls:List[Tuple[str, Callable, Tuple, dict]]) -> Callable:
+    """
+    Build one function name(target) making every hook call in order. Each call
+    is (argument, func, args, kwargs) with argument "target" or "status", the
+    status dict is built once from target.get_status() and shared by all
+    STATUS hooks.
+    """
+    namespace = {}
+    body = []
+    for i, (argument, func, args, kwargs) in enumerate(calls):
+        if argument == "status" and "status = target.get_status()" not in body:
+            body.append("status = target.get_status()")
+        namespace[f"func{i}"] = func
+        call = f"func{i}({argument}"
+        if args:
+            namespace[f"args{i}"] = args
+            call += f", *args{i}"
+        if kwargs:
+            namespace[f"kwargs{i}"] = kwargs
+            call += f", **kwargs{i}"
+        body.append(call + ")")
+    if not body:
+        body.append("pass")
+    source = f"def {name}(target):\n" + "".join(f"    {line}\n" for line in body)
+    exec(compile(source, f"<{name} hooks>", "exec"), namespace)
+    return namespace[name]
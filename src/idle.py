@@ -0,0 +1,87 @@
+from typing import Callable
+
+from .interface import IBus
+from .instruction import INSTRUCTION_TABLE, AddressingMethod
+
+
+# Idle loops are short backward branches over straight-line code that only
+# reads memory without side effects, e.g.
+#
+#   loop: LDA $2002        loop: LDA $30
+#         BPL loop               CMP #$01
+#                                BNE loop
+#
+# Once one pass leaves the registers exactly as it found them, every further
+# pass repeats until an event (vblank, sprite 0, an interrupt) changes what
+# the reads return, so the CPU can skip whole passes up to that event.
+
+IDLE_LOOP_MAX_BYTES = 16
+
+IDLE_LOOP_MNEMONICS = {"LDA", "LDX", "LDY", "BIT", "CMP", "CPX", "CPY", "AND", "ORA", "EOR", "NOP",
+                       "TAX", "TAY", "TXA", "TYA"}
+
+
+class ReadKind:
+    NONE = 0
+    SAFE = 1
+    CONTROLLER = 2
+
+
+def read_kind(address:int) -> int:
+    if address < 0x2000 or address >= 0x8000:
+        # RAM and PRG-ROM
+        return ReadKind.SAFE
+    if address < 0x4000 and address & 0x7 == 0x2:
+        # PPU status, reading it twice is the same as reading it once
+        return ReadKind.SAFE
+    if address in (0x4016, 0x4017):
+        # only repeats while the controller is strobed
+        return ReadKind.CONTROLLER
+    return ReadKind.NONE
+
+
+def find_idle_loop(bus:IBus, pc:int, target:int) -> int:
+    """
+    Check the body of the backward branch at pc, returns the ReadKind of its
+    riskiest read or ReadKind.NONE if it is not an idle loop.
+    """
+    if not 0 < pc - target <= IDLE_LOOP_MAX_BYTES:
+        return ReadKind.NONE
+    kind = ReadKind.SAFE
+    addr = target
+    while addr < pc:
+        mnemonic, addressing_method, length, cycles = INSTRUCTION_TABLE[bus.read_byte(addr)]
+        if mnemonic not in IDLE_LOOP_MNEMONICS:
+            return ReadKind.NONE
+        match addressing_method:
+            case AddressingMethod.imp | AddressingMethod.imm:
+                pass
+            case AddressingMethod.zp | AddressingMethod.zpx | AddressingMethod.zpy:
+                pass
+            case AddressingMethod.abs:
+                read = read_kind(bus.read_byte(addr + 1) | (bus.read_byte(addr + 2) << 8))
+                if read == ReadKind.NONE:
+                    return ReadKind.NONE
+                kind = max(kind, read)
+            case AddressingMethod.abx | AddressingMethod.aby:
+                base = bus.read_byte(addr + 1) | (bus.read_byte(addr + 2) << 8)
+                if not (base + 0xFF < 0x2000 or base >= 0x8000):
+                    return ReadKind.NONE
+            case _:
+                return ReadKind.NONE
+        addr += length
+    return kind if addr == pc else ReadKind.NONE
+
+
+def idle_loop_branch(execute:Callable, target:int, kind:int) -> Callable:
+    reads_controller = kind == ReadKind.CONTROLLER
+
+    def execute_idle_loop(cpu, operand):
+        cycles = execute(cpu, operand)
+        if cpu.regs.PC == target:
+            cpu.idle_loop_taken(cycles, reads_controller)
+        else:
+            cpu.idle_snapshot = None
+        return cycles
+    execute_idle_loop.__name__ = execute.__name__
+    return execute_idle_loop
@@ -3,7 +3,7 @@
 
 
 from enum import Enum
-from typing import Tuple
+from typing import List, Tuple
 
 
 class AddressingMethod(Enum):
@@ -309,23 +309,23 @@ INSTRUCTION_TABLE = {
 
     0x14: ("NOP", AddressingMethod.zpx, 2, (4, 0)),
     0x1a: ("NOP", AddressingMethod.imp, 1, (2, 0)),
-    0x1c: ("NOP", AddressingMethod.abx, 3, (4, 0)),
+    0x1c: ("NOP", AddressingMethod.abx, 3, (4, 1)),
 
     0x34: ("NOP", AddressingMethod.zpx, 2, (4, 0)),
     0x3a: ("NOP", AddressingMethod.imp, 1, (2, 0)),
-    0x3c: ("NOP", AddressingMethod.abx, 3, (4, 0)),
+    0x3c: ("NOP", AddressingMethod.abx, 3, (4, 1)),
 
     0x44: ("NOP", AddressingMethod.zp, 2, (3, 0)),
 
     0x54: ("NOP", AddressingMethod.zpx, 2, (4, 0)), 
     0x5a: ("NOP", AddressingMethod.imp, 1, (2, 0)),
-    0x5c: ("NOP", AddressingMethod.abx, 3, (4, 0)),
+    0x5c: ("NOP", AddressingMethod.abx, 3, (4, 1)),
 
     0x64: ("NOP", AddressingMethod.zp, 2, (3, 0)),
 
     0x74: ("NOP", AddressingMethod.zpx, 2, (4, 0)),
     0x7a: ("NOP", AddressingMethod.imp, 1, (2, 0)),
-    0x7c: ("NOP", AddressingMethod.abx, 3, (4, 0)),
+    0x7c: ("NOP", AddressingMethod.abx, 3, (4, 1)),
 
     0x80: ("NOP", AddressingMethod.imm, 2, (2, 0)),
     0x82: ("NOP", AddressingMethod.imm, 2, (2, 0)),
@@ -335,34 +335,34 @@ INSTRUCTION_TABLE = {
 
     0xd4: ("NOP", AddressingMethod.zpx, 2, (4, 0)),
     0xda: ("NOP", AddressingMethod.imp, 1, (2, 0)),
-    0xdc: ("NOP", AddressingMethod.abx, 3, (4, 0)),
+    0xdc: ("NOP", AddressingMethod.abx, 3, (4, 1)),
 
     0xe2: ("NOP", AddressingMethod.imm, 2, (2, 0)),
     0xea: ("NOP", AddressingMethod.imp, 1, (2, 0)),
 
     0xf4: ("NOP", AddressingMethod.zpx, 2, (4, 0)),
     0xfa: ("NOP", AddressingMethod.imp, 1, (2, 0)),
-    0xfc: ("NOP", AddressingMethod.abx, 3, (4, 0)),
+    0xfc: ("NOP", AddressingMethod.abx, 3, (4, 1)),
 
 
 
 
     0x03: ("SLO", AddressingMethod.izx, 2, (8, 0)),
-    0x13: ("SLO", AddressingMethod.izy, 2, (8, 1)),
+    0x13: ("SLO", AddressingMethod.izy, 2, (8, 0)),
     0x23: ("RLA", AddressingMethod.izx, 2, (8, 0)),
-    0x33: ("RLA", AddressingMethod.izy, 2, (8, 1)),
+    0x33: ("RLA", AddressingMethod.izy, 2, (8, 0)),
     0x43: ("SRE", AddressingMethod.izx, 2, (8, 0)),
-    0x53: ("SRE", AddressingMethod.izy, 2, (8, 1)),
+    0x53: ("SRE", AddressingMethod.izy, 2, (8, 0)),
     0x63: ("RRA", AddressingMethod.izx, 2, (8, 0)),
-    0x73: ("RRA", AddressingMethod.izy, 2, (8, 1)),
-    0x83: ("SAX", AddressingMethod.izx, 2, (6, 1)),
-    0x93: ("AHX", AddressingMethod.izy, 2, (6, 1)),
-    0xa3: ("LAX", AddressingMethod.izx, 2, (6, 1)),
+    0x73: ("RRA", AddressingMethod.izy, 2, (8, 0)),
+    0x83: ("SAX", AddressingMethod.izx, 2, (6, 0)),
+    0x93: ("AHX", AddressingMethod.izy, 2, (6, 0)),
+    0xa3: ("LAX", AddressingMethod.izx, 2, (6, 0)),
     0xb3: ("LAX", AddressingMethod.izy, 2, (5, 1)),
     0xc3: ("DCP", AddressingMethod.izx, 2, (8, 0)),
-    0xd3: ("DCP", AddressingMethod.izy, 2, (8, 1)),
+    0xd3: ("DCP", AddressingMethod.izy, 2, (8, 0)),
     0xe3: ("ISB", AddressingMethod.izx, 2, (8, 0)),
-    0xf3: ("ISB", AddressingMethod.izy, 2, (8, 1)),
+    0xf3: ("ISB", AddressingMethod.izy, 2, (8, 0)),
 
     0x07: ("SLO", AddressingMethod.zp, 2, (5, 0)),
     0x17: ("SLO", AddressingMethod.zpx, 2, (6, 0)),
@@ -390,8 +390,8 @@ INSTRUCTION_TABLE = {
     0x6b: ("ARR", AddressingMethod.imm, 2, (2, 0)),
     0x7b: ("RRA", AddressingMethod.aby, 3, (7, 0)),
     0x8b: ("XAA", AddressingMethod.imm, 2, (2, 0)),
-    0x9b: ("TAS", AddressingMethod.aby, 3, (5, 1)),
-    0xab: ("LAX", AddressingMethod.imm, 2, (2, 1)),
+    0x9b: ("TAS", AddressingMethod.aby, 3, (5, 0)),
+    0xab: ("LAX", AddressingMethod.imm, 2, (2, 0)),
     0xbb: ("LAS", AddressingMethod.aby, 3, (4, 1)),
     0xcb: ("AXS", AddressingMethod.imm, 2, (2, 0)),
     0xdb: ("DCP", AddressingMethod.aby, 3, (7, 0)),
@@ -420,6 +420,25 @@ INSTRUCTION_TABLE = {
 }
 
 
+# Per-opcode cycle tables, unpacked from the cycle tuples above:
+#   BASE_CYCLES               cycles without any penalty
+#   PAGE_CROSS_CYCLES         extra cycle when base + index crosses a page (abx, aby, izy reads)
+#   BRANCH_TAKEN_CYCLES       extra cycles of a taken branch
+#   BRANCH_PAGE_CROSS_CYCLES  extra cycles of a taken branch into another page
+def build_cycle_tables() -> Tuple[List[int], List[int], List[int], List[int]]:
+    base, page_cross, branch_taken, branch_page_cross = [0] * 256, [0] * 256, [0] * 256, [0] * 256
+    for opcode, (mnemonic, addressing_method, length, cycles) in INSTRUCTION_TABLE.items():
+        base[opcode] = cycles[0]
+        if addressing_method is AddressingMethod.rel:
+            branch_taken[opcode], branch_page_cross[opcode] = cycles[1], cycles[2]
+        else:
+            page_cross[opcode] = cycles[1]
+    return base, page_cross, branch_taken, branch_page_cross
+
+
+BASE_CYCLES, PAGE_CROSS_CYCLES, BRANCH_TAKEN_CYCLES, BRANCH_PAGE_CROSS_CYCLES = build_cycle_tables()
+
+
 
 
 class Instruction:
@@ -5,7 +5,7 @@
 
 from abc import ABC
 from enum import Enum
-from typing import List
+from typing import Callable, List
 
 from .rom import NESRom
 
@@ -23,17 +23,62 @@ class IBus(ABC):
     def read_word(self, address:int) -> int:
         pass
 
+    def read_block(self, address:int, size:int) -> memoryview:
+        # size bytes from address without copying, the block must not cross
+        # a mirror or bank boundary
+        pass
+
+
+class Mirroring(Enum):
+    # how the four name tables at $2000-$2FFF map onto 1KB VRAM banks
+    HORIZONTAL = 0
+    VERTICAL = 1
+    SINGLE_SCREEN_A = 2
+    SINGLE_SCREEN_B = 3
+    # two more banks of VRAM on the cartridge
+    FOUR_SCREEN = 4
+
 
 class IMapper(ABC):
     ram:bytearray = None
     prg_data:bytearray = None
     chr_data:bytearray = None
+    # name table RAM on the cartridge for four-screen mirroring
+    vram:bytearray = None
+    mirroring:Mirroring = Mirroring.HORIZONTAL
     def read(self, address:int) -> bytes:
         pass
 
     def write(self, address:int, data:bytes):
         pass
 
+    def read_block(self, address:int, size:int) -> memoryview:
+        pass
+
+    def register_prg_write_callback(self, func:Callable[[int, int], None]):
+        # func(start, end) is called with the CPU address range whose PRG
+        # bytes changed, either by a write or by a bank switch
+        pass
+
+    def get_prg_bank(self, address:int) -> int:
+        # the PRG bank currently mapped at a CPU address ($8000-$FFFF)
+        pass
+
+    def register_chr_write_callback(self, func:Callable[[int, int], None]):
+        # func(start, end) is called with the PPU address range whose CHR
+        # bytes changed, either by a write or by a bank switch
+        pass
+
+    def register_mirroring_callback(self, func:Callable[[Mirroring], None]):
+        # func(mirroring) is called whenever the mapper switches mirroring
+        pass
+
+    def get_prg_page(self, page:int) -> memoryview:
+        # the 256 PRG bytes currently mapped at a CPU page ($80-$FF), read
+        # directly by the CPU bus until the next bank switch notifies
+        # register_prg_write_callback for that range
+        pass
+
 
 class ICatridge(ABC):
     rom: NESRom = None
@@ -81,37 +126,56 @@ class IMemory(ABC):
     def read(self, address:int, size:int=1) -> List[bytes|bytearray]:
         pass
 
-class CPUStatusRegister:
-    N: bytes = 0
-    V: bytes = 0
-    U: bytes = 0
-    B: bytes = 0
-    D: bytes = 0
-    I: bytes = 0
-    Z: bytes = 0
-    C: bytes = 0
+    def read_block(self, address:int, size:int) -> memoryview:
+        pass
 
-    def read(self) -> bytes:
-        return (self.N << 7) | (self.V << 6) | (self.U << 5) | (self.B << 4) | (self.D << 3) | (self.I << 2) | (self.Z << 1) | self.C
+    def write_block(self, address:int, data:bytes):
+        pass
+
+    def fill(self, address:int, size:int, data:int):
+        pass
+
+def nz_from_flags(n:int, z:int) -> int:
+    # the smallest nz value that reads back as the given N and Z flags
+    if z:
+        return 0x400 if n else 0x00
+    return 0x80 if n else 0x01
 
-    def write(self, data:bytes):
-        self.N = (data >> 7) & 0x01
-        self.V = (data >> 6) & 0x01
-        self.U = (data >> 5) & 0x01
-        self.B = (data >> 4) & 0x01
-        self.D = (data >> 3) & 0x01
-        self.I = (data >> 2) & 0x01
-        self.Z = (data >> 1) & 0x01
-        self.C = data & 0x01
 
 class Register:
-    PC: int = 0
-    SP: bytes = 0
-    A: bytes = 0
-    X: bytes = 0
-    Y: bytes = 0
-    # P: bytes = 0
-    P:CPUStatusRegister = CPUStatusRegister()
+    """
+    The CPU register file.
+
+    P holds the status flags packed into one int, except for N and Z: those
+    are evaluated lazily from nz, the last result stored by an instruction.
+    Z is set when the low 10 bits of nz are clear and N when bit 7 (or bit
+    10) is set, so 0x400 stands for N and Z both set, which no result can
+    produce. read_status()/write_status() convert to and from the full byte.
+    """
+    __slots__ = ("PC", "SP", "A", "X", "Y", "P", "nz")
+
+    def __init__(self):
+        self.PC: int = 0
+        self.SP: bytes = 0
+        self.A: bytes = 0
+        self.X: bytes = 0
+        self.Y: bytes = 0
+        self.P: bytes = 0
+        self.nz: int = 0x01
+
+    def read_status(self) -> bytes:
+        nz = self.nz
+        return self.P | (Flags.N if nz & 0x480 else 0) | (0 if nz & 0x3FF else Flags.Z)
+
+    def write_status(self, data:bytes):
+        self.P = data & ~(Flags.N | Flags.Z)
+        self.nz = nz_from_flags(data & Flags.N, data & Flags.Z)
+
+    def set_flag(self, flag:bytes):
+        self.P |= flag
+
+    def clear_flag(self, flag:bytes):
+        self.P &= ~flag
 
 
 class Flags:
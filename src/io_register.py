@@ -9,7 +9,7 @@
 import logging
 
 from abc import ABC
-from typing import List
+from typing import Callable, List
 
 from .interface import IPPU, IBus, IORegister
 
@@ -293,90 +293,133 @@ class PPURegisterManager:
     def __init__(self, ppu, ppu_bus: IBus):
         self.ppu_bus = ppu_bus
         self.ppu = ppu
+        # registers of this PPU, the class attributes would be shared by every machine
+        self.internal_reg = PPUInternalRegister()
+        self.addr_reg = AddressRegister()
+        self.ctrl_reg = ControlRegister()
+        self.mask_reg = MaskRegister()
+        self.status_reg = StatusRegister()
+        self.scroll_reg = bytearray(2)
+        self.oam_data = bytearray(256)
+        # $2000-$2007 (mirrored up to $3FFF), indexed by address & 0x07
+        self.read_handlers:List[Callable[[int], bytes]] = [
+            self._read_write_only, self._read_write_only, self._read_status, self._read_write_only,
+            self._read_oam_data, self._read_write_only, self._read_write_only, self._read_data,
+        ]
+        self.write_handlers:List[Callable[[int, bytes], None]] = [
+            self._write_ctrl, self._write_mask, self._write_status, self._write_oam_addr,
+            self._write_oam_data, self._write_scroll, self._write_addr, self._write_data,
+        ]
 
     def read_for_cpu(self, address: int) -> bytes:
-        if address in [0x2000, 0x2001, 0x2003, 0x2005, 0x2006, 0x4014]:
-            # raise RuntimeError(f"Attempt to read from write-only PPU address {address:04X}")
-            LOGGER.warn(f"PPURegisterManager: Attempt to read from write-only IORegister at {address:04X}, it will be returned as 0x00")
-            # access write-only PPU register
-            return 0x00
-        elif address == 0x2002:
-            # Status Register
-            result = self.status_reg.read()
-            self.status_reg.clear_vblank()
-            self.internal_reg.w_latch = True
+        self.ppu.catch_up()
+        if address < 0x4000:
+            return self.read_handlers[address & 0x07](address)
+        # OAM DMA
+        return self._read_write_only(address)
+
+    def _read_write_only(self, address: int) -> bytes:
+        # raise RuntimeError(f"Attempt to read from write-only PPU address {address:04X}")
+        if LOGGER.isEnabledFor(logging.WARNING):
+            LOGGER.warning(f"PPURegisterManager: Attempt to read from write-only IORegister at {address:04X}, it will be returned as 0x00")
+        # access write-only PPU register
+        return 0x00
+
+    def _read_status(self, address: int) -> bytes:
+        # Status Register
+        result = self.status_reg.read()
+        self.status_reg.clear_vblank()
+        self.internal_reg.w_latch = True
+        return result
+
+    def _read_oam_data(self, address: int) -> bytes:
+        # OAM Data Register
+        return self.oam_data[self.oam_addr_reg]
+
+    def _read_data(self, address: int) -> bytes:
+        # PPU Data Register
+        addr = self.addr_reg.read()
+        self.addr_reg.write((addr + self.ctrl_reg.get_increment()) & 0x3fff)
+        if addr < 0x3f00:
+            result = self.internal_buffer
+            self.internal_buffer = self.ppu_bus.read_byte(addr)
             return result
-        elif address == 0x2004:
-            # OAM Data Register
-            # result = self.oam_data_reg
-            return self.oam_data[self.oam_addr_reg]
-        elif address == 0x2007:
-            addr = self.addr_reg.read()
-            self.addr_reg.increment(self.ctrl_reg.get_increment())
-            if addr < 0x3f00:
-                result = self.internal_buffer
-                self.internal_buffer = self.ppu_bus.read_byte(addr)
-                return result
-            else:
-                return self.ppu_bus.read_byte(addr)
+        else:
+            return self.ppu_bus.read_byte(addr)
 
     def write_for_cpu(self, address: int, data: bytes|bytearray):
-
-        self.internal_buffer = data
-
-        if address == 0x2000:
-            # Control Register
-            before_nmi_status = self.ctrl_reg.GENERATE_NMI
-            self.ctrl_reg.write(data)
-            if not before_nmi_status \
-                and self.ctrl_reg.GENERATE_NMI \
-                and self.status_reg.VBLANK:
-
-                self.ppu.nmi_for_cpu()
-                
-        elif address == 0x2001:
-            # Mask Register
-            self.mask_reg.write(data)
-        elif address == 0x2002:
-            # Status Register
-            LOGGER.warn(f"PPURegisterManager: Attempt to write to PPU Status Register at {address:04X}, it will be ignored")
-        elif address == 0x2003:
-            # OAM Address Register
-            self.oam_addr_reg = data
-        elif address == 0x2004:
-            # OAM Data Register
-            self.oam_data[self.oam_addr_reg] = data
-            self.oam_addr_reg += 1
-            self.oam_addr_reg %= 256
-        elif address == 0x2005:
-            # Scroll Register
-            # share address register state
-            if self.internal_reg.w_latch:
-                self.scroll_reg[0] = data
-            else:
-                self.scroll_reg[1] = data
-            self.update_w_latch()
-
-        elif address == 0x2006:
-            # PPU Address Register
-
-            self.addr_reg.update(data, self.internal_reg.w_latch)
-            self.update_w_latch()
-
-        elif address == 0x2007:
-            # PPU Data Register
-            addr = self.addr_reg.read()
-            self.addr_reg.increment(self.ctrl_reg.get_increment())
-            self.ppu_bus.write_byte(addr, data)
+        self.ppu.catch_up()
+        if address < 0x4000:
+            self.write_handlers[address & 0x07](address, data)
         elif address == 0x4014:
-            # OAM DMA
-
-            for i in range(256):
-                addr = (self.oam_addr_reg + i)%256
-                self.oam_data[addr] = data[i]
+            self._write_oam_dma(address, data)
         else:
             raise ValueError(f"Invalid PPU Register Address: {address}")
-        
+
+    def _write_ctrl(self, address: int, data: bytes):
+        # Control Register
+        before_nmi_status = self.ctrl_reg.GENERATE_NMI
+        self.ctrl_reg.write(data)
+        if not before_nmi_status \
+            and self.ctrl_reg.GENERATE_NMI \
+            and self.status_reg.VBLANK:
+
+            self.ppu.nmi_for_cpu()
+
+    def _write_mask(self, address: int, data: bytes):
+        # Mask Register
+        self.mask_reg.write(data)
+
+    def _write_status(self, address: int, data: bytes):
+        # Status Register
+        if LOGGER.isEnabledFor(logging.WARNING):
+            LOGGER.warning(f"PPURegisterManager: Attempt to write to PPU Status Register at {address:04X}, it will be ignored")
+
+    def _write_oam_addr(self, address: int, data: bytes):
+        # OAM Address Register
+        self.oam_addr_reg = data
+
+    def _write_oam_data(self, address: int, data: bytes):
+        # OAM Data Register
+        self.oam_data[self.oam_addr_reg] = data
+        self.oam_addr_reg += 1
+        self.oam_addr_reg %= 256
+        self.ppu.update_sprite_zero()
+
+    def _write_scroll(self, address: int, data: bytes):
+        # Scroll Register
+        # share address register state
+        if self.internal_reg.w_latch:
+            self.scroll_reg[0] = data
+        else:
+            self.scroll_reg[1] = data
+        self.update_w_latch()
+
+    def _write_addr(self, address: int, data: bytes):
+        # PPU Address Register
+        self.addr_reg.update(data, self.internal_reg.w_latch)
+        self.update_w_latch()
+
+    def _write_data(self, address: int, data: bytes):
+        # PPU Data Register, name table and palette bytes are stored
+        # straight into the bus memory
+        addr = self.addr_reg.read()
+        self.addr_reg.write((addr + self.ctrl_reg.get_increment()) & 0x3fff)
+        if addr < 0x2000:
+            self.ppu_bus.write_byte(addr, data)
+        elif addr < 0x3f00:
+            self.ppu_bus.nametables[(addr >> 10) & 0x03][addr & 0x03ff] = data
+        else:
+            self.ppu_bus.palette[addr & 0x1f] = data
+
+    def _write_oam_dma(self, address: int, data: bytes|bytearray):
+        # OAM DMA
+        # the copy starts at oam_addr and wraps around
+        start = self.oam_addr_reg
+        self.oam_data[start:] = data[:256 - start]
+        self.oam_data[:start] = data[256 - start:]
+        self.ppu.update_sprite_zero()
+
     def update_w_latch(self):
         self.internal_reg.w_latch = not self.internal_reg.w_latch
 
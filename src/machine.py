@@ -17,8 +17,10 @@ from .displayer import Displayer
 from .ppu import PPU
 from .bus import CPUBus, PPUBus
 from .cartridge import Cartridge
-from .cpu import CPU, CPUHookType
+from .cpu import CPU, ExecutionMode
+from .hooks import CPUHookType, FRAME_HOOK_TYPES
 from .memory import Memory
+from .scheduler import Scheduler
 import pygame
 import keyboard
 import logging
@@ -94,11 +96,15 @@ class Machine:
         self.ppu_palette_index_memory = Memory(32)
         self.ppu_bus = PPUBus(self.ppu_memory, self.ppu_palette_index_memory)
         self.ppu = PPU(self.ppu_bus)
+        self.scheduler = Scheduler()
+        self.ppu.register_scheduler(self.scheduler)
         # self.ppu.register_renderer(self.displayer.render)
 
         self.cpu_memory = Memory(CPU_MEMORY_SIZE)
         self.cpu_bus = CPUBus(self.cpu_memory, self.ppu.reg_manager)
+        self.cpu_bus.register_scheduler(self.scheduler)
         self.cpu = CPU(self.cpu_bus)
+        self.scheduler.register_cpu(self.cpu)
 
         self.controller = Controller()
 
@@ -107,8 +113,8 @@ class Machine:
 
         # Notify the CPU trigger NMI from the PPU
         self.ppu.register_cpu_nmi(self.cpu.set_nmi)
-        # Notify the PPU about the CPU's defer cycles
-        self.cpu.register_hook(CPUHookType.AFTER_EXEC, lambda cpu: self.ppu.set_cpu_defer_cycles(cpu.defer_cycles))
+        # frame hooks get the CPU like every other hook
+        self.ppu.register_hook_target(self.cpu)
 
         self.window = pygame.display.set_mode((256, 240),flags=pygame.RESIZABLE)
         pygame.display.set_caption("PyNES")
@@ -125,7 +131,7 @@ class Machine:
 
         self.cpu.register_hook(CPUHookType.ON_SHUTDOWN, shutdown_callback, (self.machine_status, ))
         
-        def key_callback(cpu:CPU, key_status:dict, controller:Controller):
+        def key_callback(controller:Controller, key_status:dict):
             key = 0
             if key_status["pressed"]:
                 for key_name, is_pressed in key_status["keys"].items():
@@ -136,13 +142,18 @@ class Machine:
                 controller.data = key
             key_status["pressed"] = False
 
+        # the keys are latched when the game strobes the controller, not by a CPU hook
+        self.controller.register_latch_callback(lambda controller: key_callback(controller, KEY_STATUS))
         self.cpu_bus.register_controller(self.controller)
 
-        self.cpu.register_hook(CPUHookType.BEFORE_EXEC, key_callback, args=(KEY_STATUS, self.controller))
+        # costs nothing until a per-instruction hook is registered
         self.cpu.hook_enable(True)
 
     def hook_enable(self, enable: bool):
         self.cpu.hook_enable(enable)
+
+    def set_execution_mode(self, mode: ExecutionMode):
+        self.cpu.set_execution_mode(mode)
         
     def reset(self, start_address: int = None):
         self.cpu.reset(start_address)
@@ -150,8 +161,7 @@ class Machine:
     def debug_step(self):
         if self.cartridge is None:
             raise Exception("No cartridge loaded")
-        self.cpu.clock(True)
-        self.ppu.clock()
+        self.scheduler.step()
 
     def run(self):
         pygame.init()
@@ -179,13 +189,21 @@ class Machine:
 
 
                 start_time = time.perf_counter_ns()
-                self.cpu.clock()
-                self.ppu.clock()
+                # run the CPU up to the next PPU/mapper event and fire it
+                self.scheduler.run()
         except:
             traceback.print_exc()
             pygame.quit()
         finally:
             pygame.quit()
+            self.log_fusion_report()
+
+    def log_fusion_report(self):
+        report = self.cpu.decode_cache.fusion_report()
+        idioms = ", ".join(f"{name}: {sites} sites, {runs} runs, {instructions} instructions"
+                           for name, (sites, runs, instructions) in sorted(report.items())) or "none"
+        saved = sum(instructions - runs for sites, runs, instructions in report.values())
+        LOGGER.info(f"Machine: fused idioms in {self.cartridge.rom.file_path}: {idioms}; {saved} dispatches saved")
 
     def set_cartridge(self, cartridge: Cartridge):
         self.cartridge = cartridge
@@ -195,8 +213,14 @@ class Machine:
         self.cpu.reset()
         
 
-    def register_cpu_hook(self, hook_type: CPUHookType, func: Callable, args: tuple = (), kwargs: dict = {}):
-        self.cpu.register_hook(hook_type, func, args, kwargs)
-
-    def unregister_cpu_hook(self, hook_type: CPUHookType, func: Callable):
-        self.cpu.unregister_hook(hook_type, func)
+    def register_cpu_hook(self, hook_type: CPUHookType, func: Callable, args: tuple = (), kwargs: dict = {}, scanline: int = None):
+        if hook_type in FRAME_HOOK_TYPES:
+            self.ppu.register_hook(hook_type, func, args, kwargs, scanline)
+        else:
+            self.cpu.register_hook(hook_type, func, args, kwargs)
+
+    def unregister_cpu_hook(self, hook_type: CPUHookType, func: Callable, scanline: int = None):
+        if hook_type in FRAME_HOOK_TYPES:
+            self.ppu.unregister_hook(hook_type, func, scanline)
+        else:
+            self.cpu.unregister_hook(hook_type, func)
@@ -4,15 +4,21 @@
 
 from abc import ABC
 import logging
-from .interface import IMapper
+from typing import Callable, List
+from .interface import IMapper, Mirroring
 
 from .exceptions import InvalidAddress
 from .rom import NESRom
 LOGGER = logging.getLogger(__name__)
 
+def header_mirroring(rom:NESRom) -> Mirroring:
+    if rom.header.has_vram:
+        return Mirroring.FOUR_SCREEN
+    return Mirroring(rom.header.mirroring)
+
 def choose_mapper(rom:NESRom):
     if rom.header.mapper_type == 0:
-        return Mapper0(bytearray(2*1024), rom.prg_data, rom.chr_data)
+        return Mapper0(bytearray(2*1024), rom.prg_data, rom.chr_data, header_mirroring(rom))
     else:
         raise NotImplementedError(f"Mapper {rom.header.mapper_type} not implemented")
 
@@ -24,13 +30,48 @@ class Mapper0(IMapper):
     ram:bytearray = None
     prg_data:bytearray = None
     chr_data:bytearray = None
+    vram:bytearray = None
+    mirroring:Mirroring = Mirroring.HORIZONTAL
 
-    def __init__(self, ram:bytearray, prg_data:bytearray, chr_data:bytearray):
+    def __init__(self, ram:bytearray, prg_data:bytearray, chr_data:bytearray, mirroring:Mirroring=Mirroring.HORIZONTAL):
         
         self.is_mirrored = True if len(prg_data) == 16*1024 else False
         self.ram = ram
         self.prg_data = prg_data
         self.chr_data = chr_data if len(chr_data) > 0 else bytearray(int(0x2000))
+        self.prg_write_callbacks:List[Callable[[int, int], None]] = []
+        self.mirroring = mirroring
+        if mirroring == Mirroring.FOUR_SCREEN:
+            self.vram = bytearray(2*1024)
+        self.mirroring_callbacks:List[Callable[[Mirroring], None]] = []
+        self.chr_write_callbacks:List[Callable[[int, int], None]] = []
+
+    def register_prg_write_callback(self, func:Callable[[int, int], None]):
+        self.prg_write_callbacks.append(func)
+
+    def _notify_prg_write(self, start:int, end:int):
+        for func in self.prg_write_callbacks:
+            func(start, end)
+
+    def register_chr_write_callback(self, func:Callable[[int, int], None]):
+        self.chr_write_callbacks.append(func)
+
+    def register_mirroring_callback(self, func:Callable[[Mirroring], None]):
+        self.mirroring_callbacks.append(func)
+
+    def set_mirroring(self, mirroring:Mirroring):
+        # NROM is wired to one mirroring, mappers with a mirroring register
+        # switch it from write()
+        self.mirroring = mirroring
+        for func in self.mirroring_callbacks:
+            func(mirroring)
+
+    def get_prg_bank(self, address:int) -> int:
+        # NROM has no bank switching
+        return 0
+
+    def get_prg_page(self, page:int) -> memoryview:
+        return self.read_block(page << 8, 0x100)
 
     def read(self, address:int)->bytes:
         # address &= 0xffff
@@ -46,12 +87,28 @@ class Mapper0(IMapper):
         else:
             raise InvalidAddress(f"Cannot access memory at {hex(address)}")
             
+    def read_block(self, address:int, size:int) -> memoryview:
+        if address < 0x2000:
+            return memoryview(self.chr_data)[address:address+size]
+        elif address < 0x8000:
+            if self.ram is None:
+                raise InvalidAddress(f"Cannot access memory at {hex(address)}")
+            address -= 0x6000
+            return memoryview(self.ram)[address:address+size]
+        elif address < 0x10000:
+            address = (address & 0xbfff if self.is_mirrored else address) - 0x8000
+            return memoryview(self.prg_data)[address:address+size]
+        else:
+            raise InvalidAddress(f"Cannot access memory at {hex(address)}")
+
     def write(self, address:int, data:bytes):
         # address &= 0xffff
 
         if address < 0x2000:
             # CHR ROM
             self.chr_data[address] = data
+            for func in self.chr_write_callbacks:
+                func(address, address + 1)
             # LOGGER.warn(f"Mapper0: Attempt to write a byte {data:04X} to CHR ROM at {address:04X}")
         elif address < 0x8000:
             # SRAM
@@ -61,6 +118,14 @@ class Mapper0(IMapper):
         elif address < 0x10000:
             # PRG ROM
             self.prg_data[(address & 0xbfff if self.is_mirrored else address) - 0x8000] = data
+            if self.prg_write_callbacks:
+                if self.is_mirrored:
+                    # the byte is visible at both $8000-$BFFF and $C000-$FFFF
+                    address &= 0xbfff
+                    self._notify_prg_write(address, address + 1)
+                    self._notify_prg_write(address + 0x4000, address + 0x4001)
+                else:
+                    self._notify_prg_write(address, address + 1)
             # LOGGER.warn(f"Mapper0: Attempt to write a byte {data:04X} to PRG ROM at {address:04X}")
         else:
             raise InvalidAddress(f"Cannot access memory at {hex(address)}")
\ No newline at end of file
@@ -25,4 +25,13 @@ class Memory(IMemory):
         if size == 1:
             return self.memory[address]
         else:
-            return self.memory[address:address+size]
\ No newline at end of file
+            return self.memory[address:address+size]
+
+    def read_block(self, address:int, size:int) -> memoryview:
+        return memoryview(self.memory)[address:address+size]
+
+    def write_block(self, address:int, data:bytes):
+        self.memory[address:address+len(data)] = data
+
+    def fill(self, address:int, size:int, data:int):
+        self.memory[address:address+size] = bytes((data,)) * size
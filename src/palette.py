@@ -1,4 +1,4 @@
-
+import numpy as np
 
 STANDARD_PALETTE = {
     0x00:(98,98,98),
@@ -70,3 +70,6 @@ STANDARD_PALETTE = {
     0x3F:(0,0,0),
 }
 
+
+# STANDARD_PALETTE as a lookup table for arrays of color indices
+PALETTE_RGB = np.array([STANDARD_PALETTE[i] for i in range(64)], dtype=np.uint8)
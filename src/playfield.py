@@ -0,0 +1,91 @@
+import numpy as np
+
+from .interface import IBus
+from .tiles import PATTERN_TABLE_TILES, TileCache
+
+
+PLAYFIELD_HEIGHT = 480
+PLAYFIELD_WIDTH = 512
+
+
+# the shift of a tile's palette bits in its attribute byte, for 30x32 tiles
+ATTRIBUTE_SHIFT = (((np.arange(30) & 0x02) << 1)[:, None] | (np.arange(32) & 0x02)[None, :]).astype(np.uint8)
+
+
+def nametable_map(quadrants:np.ndarray) -> np.ndarray:
+    # (4, 30, 32) per name table to one (60, 64) map, name table n at the
+    # top (n = 0, 1) or bottom (n = 2, 3), left (n = 0, 2) or right (n = 1, 3)
+    return quadrants.reshape(2, 2, 30, 32).transpose(0, 2, 1, 3).reshape(60, 64)
+
+
+def attribute_tiles(attributes:np.ndarray) -> np.ndarray:
+    # (4, 64) attribute bytes to (4, 30, 32), one attribute byte per 4x4 tiles
+    return attributes.reshape(4, 8, 8).repeat(4, axis=1).repeat(4, axis=2)[:, :30]
+
+
+class Playfield:
+    """
+    The background of all four logical name tables, as the bus mirrors them,
+    rendered to 4-bit color indices in the background palettes, image[y, x].
+    update() compares the name tables with their copy from the last update
+    and draws again only the tiles whose name table or attribute byte
+    changed, whose pattern changed or all of them when the pattern table
+    changed. A frame is then a wrapped 240x256 slice of the image.
+    """
+    def __init__(self, bus:IBus, tile_cache:TileCache):
+        self.bus = bus
+        self.tile_cache = tile_cache
+        self.image = np.zeros((PLAYFIELD_HEIGHT, PLAYFIELD_WIDTH), dtype=np.uint8)
+        # the image as [row, column, y, x] of its 60x64 tiles
+        self.cells = self.image.reshape(60, 8, 64, 8).transpose(0, 2, 1, 3)
+        self.nametables = np.zeros((4, 0x400), dtype=np.uint8)
+        self.drawn = np.zeros((4, 0x400), dtype=np.uint8)
+        # None until the first update draws every tile
+        self.pattern_base:int = None
+        self.dirty_tiles = np.zeros(PATTERN_TABLE_TILES, dtype=bool)
+        self.any_dirty_tiles = False
+        tile_cache.register_update_callback(self.invalidate_tiles)
+
+    def invalidate_tiles(self, tiles:np.ndarray):
+        self.dirty_tiles[tiles] = True
+        self.any_dirty_tiles = True
+
+    def update(self, pattern_base:int):
+        for i, nametable in enumerate(self.bus.nametables):
+            self.nametables[i] = np.frombuffer(nametable, dtype=np.uint8)
+        changed = self.nametables != self.drawn
+        if pattern_base == self.pattern_base and not self.any_dirty_tiles and not changed.any():
+            return
+
+        pattern_idx = nametable_map(self.nametables[:, :960].reshape(4, 30, 32)).astype(np.intp) + pattern_base
+        palette_idx = nametable_map(attribute_tiles(self.nametables[:, 0x3C0:]) >> ATTRIBUTE_SHIFT) & 0x03
+        if pattern_base != self.pattern_base:
+            dirty = np.ones((60, 64), dtype=bool)
+        else:
+            dirty = nametable_map(changed[:, :960].reshape(4, 30, 32) | attribute_tiles(changed[:, 0x3C0:]))
+            if self.any_dirty_tiles:
+                dirty |= self.dirty_tiles[pattern_idx]
+
+        tiles = self.tile_cache.tiles
+        if dirty.all():
+            self.cells[:] = tiles[pattern_idx] | (palette_idx << 2)[:, :, None, None]
+        else:
+            rows, cols = np.nonzero(dirty)
+            self.cells[rows, cols] = tiles[pattern_idx[rows, cols]] | (palette_idx[rows, cols] << 2)[:, None, None]
+
+        self.nametables, self.drawn = self.drawn, self.nametables
+        self.pattern_base = pattern_base
+        self.dirty_tiles[:] = False
+        self.any_dirty_tiles = False
+
+    def view(self, x:int, y:int, out:np.ndarray) -> np.ndarray:
+        # the 240x256 pixels from (x, y) on, wrapping around the image edges
+        x %= PLAYFIELD_WIDTH
+        y %= PLAYFIELD_HEIGHT
+        height = min(240, PLAYFIELD_HEIGHT - y)
+        width = min(256, PLAYFIELD_WIDTH - x)
+        out[:height, :width] = self.image[y:y + height, x:x + width]
+        out[height:, :width] = self.image[:240 - height, x:x + width]
+        out[:height, width:] = self.image[y:y + height, :256 - width]
+        out[height:, width:] = self.image[:240 - height, :256 - width]
+        return out
@@ -6,19 +6,45 @@
 
 
 from abc import ABC
-from functools import lru_cache
 from typing import Callable, Dict, List, Tuple
 
-from .palette import STANDARD_PALETTE
+import numpy as np
 
 from .frame import NPFrame
 
+from .hooks import CPUHookType, Hook, compile_hook_chain
 from .interface import IPPU, IBus
 from .io_register import PPURegisterManager
+from .playfield import Playfield
+from .scheduler import EventType, Scheduler
+from .tiles import TileCache
 import logging
 
 LOGGER = logging.getLogger(__name__)
 
+
+DOTS_PER_SCANLINE = 341
+# 240 visible, 1 post-render, 20 vblank and the pre-render scanline
+SCANLINES_PER_FRAME = 262
+VBLANK_SCANLINE = 241
+# 3 dots per CPU cycle, a frame is 29780 2/3 CPU cycles
+DOTS_PER_FRAME = DOTS_PER_SCANLINE * SCANLINES_PER_FRAME
+
+
+# pixel offsets inside a tile
+ROWS = np.arange(8)[:, None]
+COLUMNS = np.arange(8)[None, :]
+
+
+def dot_cycle(dot:int) -> int:
+    # first CPU cycle at which the dot is over
+    return -(-dot // 3)
+
+
+def scanline_end_dot(scanline:int) -> int:
+    # relative to the frame start
+    return (scanline + 1) * DOTS_PER_SCANLINE
+
 class PPU(IPPU):
     reg_manager: PPURegisterManager = None
     bus:IBus = None
@@ -28,7 +54,6 @@ class PPU(IPPU):
     tick:int = 0
 
     cycles:int = 0
-    cpu_defer_cycles:int = 0
 
     renderers:Dict[str,Tuple[Callable,tuple,dict]] = {}
 
@@ -36,11 +61,32 @@ class PPU(IPPU):
 
     scanline:int = 0
 
-    
+    scheduler:Scheduler = None
+    # counted in dots, frames don't start on whole CPU cycles
+    frame_start_dot:int = 0
+    sprite_zero_scanline:int = 0
 
     def __init__(self, bus:IBus):
         self.bus = bus
         self.reg_manager = PPURegisterManager(self, bus)
+        self.tile_cache = TileCache(bus)
+        self.playfield = Playfield(bus, self.tile_cache)
+        self.background = np.zeros((240, 256), dtype=np.uint8)
+        # [y, x] of background pixels that sprites behind the background hide behind
+        self.background_opaque = np.zeros((240, 256), dtype=bool)
+
+        # frame hooks, each called as func(hook_target, *args, **kwargs)
+        self.hook_target = self
+        self._frame_start_hook_func: Dict[str, Hook] = {}
+        self._vblank_hook_func: Dict[str, Hook] = {}
+        self._scanline_hook_func: Dict[int, Dict[str, Hook]] = {}
+        # compiled from the hooks above, None while there are none
+        self._frame_start_chain: Callable = None
+        self._vblank_chain: Callable = None
+        self._scanline_chains: Dict[int, Callable] = {}
+        self.hook_scanlines: List[int] = []
+        # the scanline of the pending SCANLINE_HOOK event
+        self.hook_scanline: int = 0
 
 
     def register_cpu_nmi(self, func: Callable):
@@ -53,35 +99,133 @@ class PPU(IPPU):
         else:
             raise ValueError("CPU NMI Function is not registered")
 
-    def set_cpu_defer_cycles(self, cycles:int):
-        self.cpu_defer_cycles = cycles
-
-    def clock(self,):
-        self.cycles += self.cpu_defer_cycles*3
-        self.set_cpu_defer_cycles(0)
-
-        if self.cycles >= 341:
-            if self.is_sprite_zero_hit(self.cycles):
-                self.reg_manager.status_reg.set_sprite_zero_hit()
-            
-            self.cycles -= 341
-            self.scanline += 1
-
-            if self.scanline == 241:
-                self.reg_manager.status_reg.set_vblank()
-                self.reg_manager.status_reg.clear_sprite_zero_hit()
-
-                if self.reg_manager.ctrl_reg.GENERATE_NMI:
-                    self.nmi_for_cpu()
-            
-            if self.scanline >= 261:
-                self.scanline = 0
-                self.reg_manager.status_reg.clear_sprite_zero_hit()
-                self.reg_manager.status_reg.clear_vblank()
-
-
-
-
+    def register_scheduler(self, scheduler:Scheduler):
+        # the PPU is never clocked, its state only changes at these events
+        self.scheduler = scheduler
+        self._schedule_frame(scheduler.cycles * 3)
+
+    def catch_up(self):
+        # called before the CPU touches the PPU: the flags are already exact,
+        # bring the beam position up to the running instruction in one step
+        if self.scheduler is None:
+            return
+        dots = self.scheduler.now() * 3 - self.frame_start_dot
+        self.scanline, self.cycles = divmod(dots, DOTS_PER_SCANLINE)
+
+    def _schedule_frame(self, frame_start_dot:int):
+        self.frame_start_dot = frame_start_dot
+        self.scheduler.schedule(EventType.VBLANK, dot_cycle(frame_start_dot + scanline_end_dot(VBLANK_SCANLINE - 1)), self._on_vblank)
+        self.scheduler.schedule(EventType.PRE_RENDER, dot_cycle(frame_start_dot + DOTS_PER_FRAME), self._on_pre_render)
+        self._schedule_sprite_zero_hit()
+        self._schedule_scanline_hook(0)
+
+    def _schedule_sprite_zero_hit(self):
+        self.sprite_zero_scanline = self.reg_manager.oam_data[0]
+        self.scheduler.schedule(EventType.SPRITE_ZERO_HIT, dot_cycle(self.frame_start_dot + scanline_end_dot(self.sprite_zero_scanline)), self._on_sprite_zero_hit)
+
+    def update_sprite_zero(self):
+        # sprite 0 moved, from now on the hit is checked against its new y
+        y = self.reg_manager.oam_data[0]
+        if self.scheduler is None or y == self.sprite_zero_scanline:
+            return
+        self.sprite_zero_scanline = y
+        cycle = dot_cycle(self.frame_start_dot + scanline_end_dot(y))
+        if cycle > self.scheduler.now():
+            self.scheduler.schedule(EventType.SPRITE_ZERO_HIT, cycle, self._on_sprite_zero_hit)
+        else:
+            self.scheduler.cancel(EventType.SPRITE_ZERO_HIT)
+
+    def _on_sprite_zero_hit(self, cycle:int):
+        self.scanline = self.sprite_zero_scanline
+        self.cycles = DOTS_PER_SCANLINE
+        if self.is_sprite_zero_hit(self.cycles):
+            self.reg_manager.status_reg.set_sprite_zero_hit()
+
+    def _on_vblank(self, cycle:int):
+        self.scanline = VBLANK_SCANLINE
+        self.cycles = 0
+        self.reg_manager.status_reg.set_vblank()
+        self.reg_manager.status_reg.clear_sprite_zero_hit()
+        if self._vblank_chain is not None:
+            self._vblank_chain(self.hook_target)
+
+        if self.reg_manager.ctrl_reg.GENERATE_NMI:
+            self.nmi_for_cpu()
+
+    def _on_pre_render(self, cycle:int):
+        self.scanline = 0
+        self.cycles = 0
+        self.reg_manager.status_reg.clear_sprite_zero_hit()
+        self.reg_manager.status_reg.clear_vblank()
+        self._schedule_frame(self.frame_start_dot + DOTS_PER_FRAME)
+        if self._frame_start_chain is not None:
+            self._frame_start_chain(self.hook_target)
+
+    def _schedule_scanline_hook(self, first_scanline:int):
+        # the next hooked scanline from first_scanline on, in this frame
+        if self.scheduler is None:
+            return
+        for scanline in self.hook_scanlines:
+            if scanline >= first_scanline:
+                self.hook_scanline = scanline
+                cycle = dot_cycle(self.frame_start_dot + scanline * DOTS_PER_SCANLINE)
+                self.scheduler.schedule(EventType.SCANLINE_HOOK, cycle, self._on_scanline_hook)
+                return
+        self.scheduler.cancel(EventType.SCANLINE_HOOK)
+
+    def _on_scanline_hook(self, cycle:int):
+        scanline = self.hook_scanline
+        self.scanline = scanline
+        self.cycles = 0
+        self._scanline_chains[scanline](self.hook_target)
+        self._schedule_scanline_hook(scanline + 1)
+
+    def register_hook_target(self, target):
+        # the first argument of every frame hook, Machine passes the CPU
+        self.hook_target = target
+
+    def register_hook(self, hook_type:CPUHookType, func:Callable, args:tuple=(), kwargs:dict={}, scanline:int=None):
+        if hook_type == CPUHookType.ON_FRAME_START:
+            self._frame_start_hook_func[func.__name__] = (func, args, kwargs)
+        elif hook_type == CPUHookType.ON_VBLANK:
+            self._vblank_hook_func[func.__name__] = (func, args, kwargs)
+        elif hook_type == CPUHookType.ON_SCANLINE:
+            if scanline is None or not 0 <= scanline < SCANLINES_PER_FRAME:
+                raise ValueError(f"Invalid scanline: {scanline}")
+            self._scanline_hook_func.setdefault(scanline, {})[func.__name__] = (func, args, kwargs)
+        else:
+            raise ValueError("Invalid hook type")
+        self._update_hook_chains()
+
+    def unregister_hook(self, hook_type:CPUHookType, func:Callable, scanline:int=None):
+        if hook_type == CPUHookType.ON_FRAME_START:
+            self._frame_start_hook_func.pop(func.__name__, None)
+        elif hook_type == CPUHookType.ON_VBLANK:
+            self._vblank_hook_func.pop(func.__name__, None)
+        elif hook_type == CPUHookType.ON_SCANLINE:
+            hooks = self._scanline_hook_func.get(scanline, {})
+            hooks.pop(func.__name__, None)
+            if not hooks:
+                self._scanline_hook_func.pop(scanline, None)
+        else:
+            raise ValueError("Invalid hook type")
+        self._update_hook_chains()
+
+    def _update_hook_chains(self):
+        def chain(name:str, hooks:Dict[str, Hook]) -> Callable|None:
+            if not hooks:
+                return None
+            return compile_hook_chain(name, [("target", *hook) for hook in hooks.values()])
+
+        self._frame_start_chain = chain("on_frame_start", self._frame_start_hook_func)
+        self._vblank_chain = chain("on_vblank", self._vblank_hook_func)
+        self._scanline_chains = {scanline: chain(f"on_scanline_{scanline}", hooks)
+                                 for scanline, hooks in self._scanline_hook_func.items()}
+        self.hook_scanlines = sorted(self._scanline_chains)
+        if self.scheduler is not None:
+            # from the next scanline that starts after now
+            dots = self.scheduler.now() * 3 - self.frame_start_dot
+            self._schedule_scanline_hook(-(-dots // DOTS_PER_SCANLINE))
 
     def is_sprite_zero_hit(self, cycle:int) -> bool:
         y = self.reg_manager.oam_data[0]
@@ -104,162 +248,62 @@ class PPU(IPPU):
 
     def render(self):
         # self.current_frame = NPFrame()
+        self.tile_cache.update()
         self.render_background()
         self.render_sprite()
 
 
-    def _get_bg_palette(self, nametable_base_addr:int, tile_x:int, tile_y:int, view_port_offset_x:int=0, view_port_offset_y:int=0):
-        tile_offset_x = view_port_offset_x//8
-        tile_offset_y = view_port_offset_y//8
-        attr_idx = 0
-        is_horizontal_mirror = self.bus.is_horizontal_mirror
-        if not is_horizontal_mirror:
-            if 31 - tile_offset_x >= tile_x:
-                attr_idx = (tile_y // 4)  * 8 + ((tile_x + tile_offset_x) // 4)
-            else:
-                tile_x = (tile_x -(31 - tile_offset_x))
-                attr_idx = (tile_y // 4)  * 8 + (tile_x // 4) + 0x400
-        else:
-            if 29 - tile_offset_y >= tile_y:
-                attr_idx = ((tile_y + tile_offset_y) // 4)  * 8 + (tile_x // 4)
-
-            else:
-                tile_y = (tile_y + tile_offset_y - 29)
-                attr_idx = ((tile_y // 4)  * 8 + (tile_x // 4)) + 0x800
-        attr = self.bus.read_byte(nametable_base_addr + 0x3C0 + attr_idx)
-
-
-        palette_idx = 0x00
-        match (tile_y % 4 // 2, tile_x % 4 // 2):
-            case (0, 0):
-                palette_idx = (attr >> 0) & 0x03
-            case (0, 1):
-                palette_idx = (attr >> 2) & 0x03
-            case (1, 0):
-                palette_idx = (attr >> 4) & 0x03
-            case (1, 1):
-                palette_idx = (attr >> 6) & 0x03
-
-        
-        palette_start_addr = 0x3F00 + palette_idx*4
-
-        return self._get_palette(palette_start_addr)
-        
-
-    def _get_palette(self, base_addr:int) -> List[Tuple[int,int,int]]:
-        color_idx = [self.bus.read_byte(base_addr + i) if i!=0 else self.bus.read_byte(0x3F00) for i in range(4)]
-        palette = [STANDARD_PALETTE[i] for i in color_idx]
-        return palette
-    
-    # @lru_cache(maxsize=1024)
-    def tile_pos_to_tile_idx(self, tile_x:int, tile_y:int, view_port_offset_x:int=0, view_port_offset_y:int=0):
-        # tile_idx = (tile_y + view_port_offset_y//8 ) * 32 + (tile_x + view_port_offset_x//8)
-        # return tile_idx
-        
-        tile_offset_x = view_port_offset_x//8
-        tile_offset_y = view_port_offset_y//8
-        tile_idx = 0
-        is_horizontal_mirror = self.bus.is_horizontal_mirror
-        if not is_horizontal_mirror:
-            if 31 - tile_offset_x >= tile_x:
-                tile_idx = tile_y * 32 + (tile_x + tile_offset_x) 
-            else:
-                tile_idx = tile_y * 32 + (tile_x -(31 - tile_offset_x)) + 0x400
-        else:
-            if 29 - tile_offset_y >= tile_y:
-                tile_idx = (tile_y + tile_offset_y) * 32 + tile_x 
-            else:
-                tile_idx = (tile_y + tile_offset_y - 29) * 32 + tile_x + 0x800
-
-        return tile_idx
-
-    @lru_cache(maxsize=960)
-    def tile_idx_to_tile_pos(self, tile_idx:int):
-        tile_x = tile_idx % 32
-        tile_y = tile_idx // 32
-        return (tile_x, tile_y)
-
-
     def render_background(self):
-        pattern_base_addr = self.reg_manager.ctrl_reg.get_background_pattern_addr()
-        nametable_base_addr = self.reg_manager.ctrl_reg.get_nametable_addr()
-
-        view_port_offset_x = self.reg_manager.scroll_reg[0]
-        view_port_offset_y = self.reg_manager.scroll_reg[1]
-        
-        for offset in range(960):
-            # Get Tile Index from Nametable
-            tile_x, tile_y = self.tile_idx_to_tile_pos(offset)
-            tile_idx = self.tile_pos_to_tile_idx(tile_x, tile_y, view_port_offset_x, view_port_offset_y)
-            tile_addr = nametable_base_addr + tile_idx
-            pattern_idx = self.bus.read_byte(tile_addr)
-            # Get Tile Data from Pattern Table
-            tile = [self.bus.read_byte(pattern_base_addr + (pattern_idx * 16 + f)) for f in range(16)]
-
-            palette = self._get_bg_palette(nametable_base_addr, tile_x, tile_y,view_port_offset_x, view_port_offset_y)
-            
-            # Render Tile
-            for y in range(8):
-                # TODO: check this
-                high_byte = tile[y]
-                low_byte = tile[y+8]
-
-                for x in range(8):
-                    low_bit = (high_byte >> (7-x)) & 0x01
-                    high_bit = (low_byte >> (7-x)) & 0x01
-                    color_idx = (high_bit << 1) | low_bit
-                    color = palette[color_idx]
-
-                    self.current_frame.set_pixel(tile_x * 8  +x, tile_y * 8+y, color)
+        ctrl_reg = self.reg_manager.ctrl_reg
+        nametable_idx = (ctrl_reg.get_nametable_addr() >> 10) & 0x03
+        self.playfield.update(ctrl_reg.get_background_pattern_addr() >> 4)
+        # the selected name table is at (256, 240) times its right and bottom bits
+        x = (nametable_idx & 0x01) * 256 + self.reg_manager.scroll_reg[0]
+        y = (nametable_idx >> 1) * 240 + self.reg_manager.scroll_reg[1]
+        # color indices in the 16 background palette entries, as [y, x]
+        color_idx = self.playfield.view(x, y, self.background)
+
+        palette = np.frombuffer(self.bus.palette, dtype=np.uint8)[:16] & 0x3F
+        palette[::4] = palette[0]
+        np.take(palette, color_idx, out=self.current_frame.indices)
+        self.current_frame.is_dirty = True
+        self.background_opaque = color_idx & 0x03 != 0
 
     def render_sprite(self):
-        pattern_base_addr = self.reg_manager.ctrl_reg.get_sprite_pattern_addr()
-        # nametable_base_addr = self.reg_manager.ctrl_reg.get_nametable_addr()
-
-        for sprite_idx in range(64):
-            tile_y = self.reg_manager.oam_data[sprite_idx*4]
-            tile_x = self.reg_manager.oam_data[sprite_idx*4+3]
-            pattern_idx = self.reg_manager.oam_data[sprite_idx*4+1]
-            attr = self.reg_manager.oam_data[sprite_idx*4+2]
-            flip_h = (attr >> 6) & 0x01 == 1
-            flip_v = (attr >> 7) & 0x01 == 1
-            # prio = (attr >> 5) & 0x01
-
-            tile = [self.bus.read_byte(pattern_base_addr + (pattern_idx * 16 + f)) for f in range(16)]
-            palette_idx = attr & 0b11
-            palette_start_addr = 0x3F10 + palette_idx*4
-            palette = self._get_palette(palette_start_addr)
-
-            # Render Tile
-            for y in range(8):
-                # TODO: check this
-                high_byte = tile[y]
-                low_byte = tile[y+8]
-                for x in range(8):
-                    low_bit = (high_byte >> (7-x)) & 0x01
-                    high_bit = (low_byte >> (7-x)) & 0x01
-                    color_idx = (high_bit << 1) | low_bit
-
-                    color = palette[color_idx]
-                    pos_x = 0
-                    pos_y = 0
-    
-                    match (flip_h, flip_v):
-                        case (False, False):
-                           pos_x = tile_x + x
-                           pos_y = tile_y + y
-                        case (True, False):
-                            pos_x = tile_x + 7 - x
-                            pos_y = tile_y + y
-                        case (False, True):
-                            pos_x = tile_x + x
-                            pos_y = tile_y + 7 - y
-                        case (True, True):
-                            pos_x = tile_x + 7 - x
-                            pos_y = tile_y + 7 - y
-
-                    if pos_x >= 0 and pos_x < 256 and pos_y >= 0 and pos_y < 240:
-                        self.current_frame.set_pixel(pos_x, pos_y, color)
-    
-
-                    
+        ctrl_reg = self.reg_manager.ctrl_reg
+        oam = np.frombuffer(self.reg_manager.oam_data, dtype=np.uint8).reshape(64, 4).astype(np.intp)
+        sprite_idx = np.flatnonzero(oam[:, 0] < 240)
+        if len(sprite_idx) == 0:
+            return
+        tile_y, pattern_idx, attr, tile_x = oam[sprite_idx].T
+        flip = attr >> 6
+
+        if ctrl_reg.get_sprite_size() == 8:
+            tiles = (ctrl_reg.get_sprite_pattern_addr() >> 4) + pattern_idx
+        else:
+            # 8x16 sprites take the pattern table from bit 0 and are drawn as
+            # two tiles, a vertical flip swaps them
+            top = ((pattern_idx & 0x01) << 8) | (pattern_idx & 0xFE)
+            swap = (flip >> 1) & 0x01
+            tiles = np.concatenate((top + swap, top + 1 - swap))
+            sprite_idx, tile_y, tile_x, attr, flip = (np.concatenate((a, a)) for a in (sprite_idx, tile_y, tile_x, attr, flip))
+            tile_y = tile_y + np.repeat((0, 8), len(tiles) // 2)
+
+        # one value per opaque sprite pixel: the OAM index above the priority
+        # bit and the color index in the sprite palettes, the lowest wins
+        pixels = self.tile_cache.flipped[flip, tiles]
+        values = (sprite_idx << 8 | (attr & 0x20) << 2 | (attr & 0x03) << 2)[:, None, None] | pixels
+        ys = np.broadcast_to(tile_y[:, None, None] + ROWS, pixels.shape)
+        xs = np.broadcast_to(tile_x[:, None, None] + COLUMNS, pixels.shape)
+        visible = (pixels != 0) & (ys < 240) & (xs < 256)
+        ys, xs, values = ys[visible], xs[visible], values[visible]
+        layer = np.full((240, 256), 0xFFFF, dtype=np.uint16)
+        np.minimum.at(layer, (ys, xs), values.astype(np.uint16))
+
+        # every covered pixel takes the winning value, a sprite behind the
+        # background only shows through transparent background pixels
+        values = layer[ys, xs]
+        shown = (values & 0x80 == 0) | ~self.background_opaque[ys, xs]
+        palette = np.frombuffer(self.bus.palette, dtype=np.uint8)[16:] & 0x3F
+        self.current_frame.indices[ys[shown], xs[shown]] = palette[values[shown] & 0x0F]
+        self.current_frame.is_dirty = True
@@ -0,0 +1,107 @@
+from enum import Enum
+from typing import Callable, Dict, Tuple
+
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+NEVER = 1 << 62
+
+
+class EventType(Enum):
+    # events due at the same cycle fire in this order
+    SPRITE_ZERO_HIT = 1
+    VBLANK = 2
+    PRE_RENDER = 3
+    MAPPER_IRQ = 4
+    FRAME_COUNTER = 5
+    SCANLINE_HOOK = 6
+
+
+class Scheduler:
+    """
+    Timeline of the machine in CPU cycles. Every component schedules the cycle
+    of its next event here, the CPU then runs uninterrupted until the earliest
+    one and the due handlers are called with the cycle they were scheduled at.
+    At most one event of each type is pending, scheduling it again moves it.
+    """
+    def __init__(self):
+        self.cycles: int = 0
+        self.events: Dict[EventType, Tuple[int, Callable]] = {}
+        self.next_cycle: int = NEVER
+        self.cpu = None
+        # cycles the CPU loses once its running instruction ends
+        self.pending_stall: int = 0
+        # and one more if that instruction ends on an odd cycle
+        self.pending_alignment: bool = False
+
+    def register_cpu(self, cpu):
+        self.cpu = cpu
+
+    def now(self) -> int:
+        # inside a slice this is the start of the running instruction
+        if self.cpu is None:
+            return self.cycles
+        return self.cycles + self.cpu.slice_cycles
+
+    def schedule(self, event_type: EventType, cycle: int, handler: Callable):
+        self.events[event_type] = (cycle, handler)
+        if cycle < self.next_cycle:
+            self.next_cycle = cycle
+            if self.cpu is not None:
+                # the running slice was sized for a later event
+                self.cpu.yield_requested = True
+
+    def schedule_in(self, event_type: EventType, cycles: int, handler: Callable):
+        self.schedule(event_type, self.now() + cycles, handler)
+
+    def cancel(self, event_type: EventType):
+        if self.events.pop(event_type, None) is not None:
+            self._update_next_cycle()
+
+    def stall_cpu(self, cycles: int, align: bool = False):
+        # e.g. OAM DMA: the slice ends with the running instruction and the
+        # CPU starts the next one cycles later. With align the parity of the
+        # instruction's end decides, which now() (its start) cannot tell
+        self.pending_stall += cycles
+        self.pending_alignment = self.pending_alignment or align
+        self.cpu.yield_requested = True
+
+    def get_event_cycle(self, event_type: EventType) -> int:
+        event = self.events.get(event_type, None)
+        return NEVER if event is None else event[0]
+
+    def _update_next_cycle(self):
+        self.next_cycle = min((cycle for cycle, handler in self.events.values()), default=NEVER)
+
+    def run(self) -> int:
+        return self._advance(self.cpu.run_for(self.next_cycle - self.cycles))
+
+    def step(self) -> int:
+        # one instruction at a time, for debugging and tracing
+        return self._advance(self.cpu.step())
+
+    def _advance(self, cycles: int) -> int:
+        self.cycles += cycles
+        if self.pending_stall:
+            if self.pending_alignment:
+                # self.cycles is where the stalling instruction ended
+                self.pending_stall += self.cycles & 1
+                self.pending_alignment = False
+            # charged as pending cycles of the next slice
+            self.cpu.defer_cycles += self.pending_stall
+            self.pending_stall = 0
+        while self.next_cycle <= self.cycles:
+            self._fire_due_events()
+        return cycles
+
+    def _fire_due_events(self):
+        due = [(event_type, event) for event_type, event in self.events.items() if event[0] <= self.cycles]
+        due.sort(key=lambda item: (item[1][0], item[0].value))
+        for event_type, (cycle, handler) in due:
+            # a handler may have moved or cancelled a later event
+            if self.events.get(event_type, None) == (cycle, handler):
+                del self.events[event_type]
+                handler(cycle)
+        self._update_next_cycle()
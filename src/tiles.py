@@ -0,0 +1,68 @@
+from typing import Callable, List
+
+import numpy as np
+
+from .interface import IBus, IMapper
+
+
+PATTERN_TABLE_TILES = 512
+
+
+def decode_tiles(chr_data:memoryview) -> np.ndarray:
+    # 16 bytes per tile: 8 rows of the low bit plane, then 8 of the high one
+    planes = np.frombuffer(chr_data, dtype=np.uint8).reshape(-1, 2, 8)
+    bits = np.unpackbits(planes, axis=2).reshape(-1, 2, 8, 8)
+    return bits[:, 0] | (bits[:, 1] << 1)
+
+
+def flip_tiles(tiles:np.ndarray) -> np.ndarray:
+    # indexed by the sprite attribute bits 6-7: none, horizontal, vertical, both
+    return np.stack((tiles, tiles[..., ::-1], tiles[..., ::-1, :], tiles[..., ::-1, ::-1]))
+
+
+class TileCache:
+    """
+    The 512 tiles of both pattern tables ($0000-$1FFF) decoded to 2-bit color
+    indices, tiles[tile, y, x], and flipped[flip, tile, y, x] in all four
+    sprite orientations. CHR writes only mark their tile dirty, update()
+    decodes the dirty tiles again before a frame is rendered and passes their
+    numbers to the update callbacks.
+    """
+    def __init__(self, bus:IBus):
+        self.bus = bus
+        self.mapper:IMapper = None
+        self.flipped = np.zeros((4, PATTERN_TABLE_TILES, 8, 8), dtype=np.uint8)
+        self.tiles = self.flipped[0]
+        self.dirty = bytearray(PATTERN_TABLE_TILES)
+        self.any_dirty = False
+        self.update_callbacks:List[Callable[[np.ndarray], None]] = []
+
+    def register_update_callback(self, func:Callable[[np.ndarray], None]):
+        self.update_callbacks.append(func)
+
+    def invalidate(self, start:int, end:int):
+        for tile in range(start >> 4, ((end - 1) >> 4) + 1):
+            self.dirty[tile] = 1
+        self.any_dirty = True
+
+    def update(self) -> np.ndarray:
+        self._watch_mapper()
+        if self.any_dirty:
+            dirty = np.flatnonzero(np.frombuffer(self.dirty, dtype=np.uint8))
+            if len(dirty) > PATTERN_TABLE_TILES // 8:
+                self.flipped[:] = flip_tiles(decode_tiles(self.bus.read_block(0x0000, 0x2000)))
+            else:
+                for tile in dirty:
+                    self.flipped[:, tile] = flip_tiles(decode_tiles(self.bus.read_block(tile << 4, 16))[0])
+            self.dirty[:] = bytes(PATTERN_TABLE_TILES)
+            self.any_dirty = False
+            for func in self.update_callbacks:
+                func(dirty)
+        return self.tiles
+
+    def _watch_mapper(self):
+        mapper = self.bus.cartridge.mapper
+        if mapper is not self.mapper:
+            self.mapper = mapper
+            mapper.register_chr_write_callback(self.invalidate)
+            self.invalidate(0x0000, 0x2000)
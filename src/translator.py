@@ -0,0 +1,550 @@
+import re
+from typing import Callable, Dict, List, Set, Tuple
+
+from .dispatch import OPCODE_LENGTHS, OPCODE_TABLE
+from .alu import ADC_TABLE, ASL_TABLE, COMPARE_TABLE, LSR_TABLE, ROL_TABLE, ROR_TABLE
+from .instruction import (BASE_CYCLES, BRANCH_PAGE_CROSS_CYCLES, BRANCH_TAKEN_CYCLES, INSTRUCTION_TABLE,
+                          PAGE_CROSS_CYCLES, AddressingMethod)
+from .bus import CPUBus
+from .interface import Flags, IMapper
+
+
+# Basic-block translation: a run of straight-line 6502 code is turned into one
+# Python function with the registers, nz (see Register) and the C/V
+# flags held in locals. The
+# generated code follows the executor handlers line by line (quirks included),
+# anything without a template here is executed by calling its OPCODE_TABLE
+# handler from inside the block.
+
+REGISTERS = ("A", "X", "Y", "SP", "nz")
+_NAME_PATTERN = re.compile(r"\b(A|X|Y|SP|nz|C|V)\b")
+
+RAM_BANK = -1
+MAX_BLOCK_INSTRUCTIONS = 32
+
+BRANCH_CONDITIONS = {
+    "BCC": "not C",
+    "BCS": "C",
+    "BEQ": "not nz & 0x3FF",
+    "BNE": "nz & 0x3FF",
+    "BMI": "nz & 0x480",
+    "BPL": "not nz & 0x480",
+    "BVC": "not V",
+    "BVS": "V",
+}
+
+
+
+
+def _push(value:str) -> List[str]:
+    return [
+        "if SP < 0:",
+        "    raise RuntimeError(\"Stack overflow\")",
+        f"write_byte(SP + 0x100, {value})",
+        "SP -= 1",
+    ]
+
+
+def _pull(target:str) -> List[str]:
+    return [
+        "SP += 1",
+        "if SP > 0xFF:",
+        "    raise RuntimeError(\"Stack underflow\")",
+        f"{target} = read_byte(SP + 0x100)",
+    ]
+
+
+def _compare(reg:str) -> List[str]:
+    return [f"value = COMPARE_TABLE[({reg} << 8) | M]", "nz = value & 0xFF", "C = value >> 8"]
+
+
+def _add(operand:str) -> List[str]:
+    return [f"value = ADC_TABLE[(C << 16) | (A << 8) | {operand}]", "A = nz = value & 0xFF", "C = (value >> 8) & 0x01", "V = value >> 14"]
+
+
+# instructions that consume the byte at the effective address, as M
+VALUE_SOURCE: Dict[str, List[str]] = {
+    "ADC": _add("M"),
+    "SBC": _add("(M ^ 0xFF)"),
+    "AND": ["A &= M", "nz = A"],
+    "ORA": ["A |= M", "nz = A"],
+    "EOR": ["A ^= M", "nz = A"],
+    "BIT": ["nz = (M & 0x80) | 0x01 if M & A else (M & 0x80) << 3", "V = (M >> 6) & 1"],
+    "CMP": _compare("A"),
+    "CPX": _compare("X"),
+    "CPY": _compare("Y"),
+    "LDA": ["A = nz = M"],
+    "LDX": ["X = nz = M"],
+    "LDY": ["Y = nz = M"],
+    "LAX": ["A = X = nz = M"],
+}
+
+# read-modify-write instructions: M in, R out
+MODIFY_SOURCE: Dict[str, List[str]] = {
+    "ASL": ["value = ASL_TABLE[M]", "R = nz = value & 0xFF", "C = value >> 8"],
+    "LSR": ["value = LSR_TABLE[M]", "R = nz = value & 0xFF", "C = value >> 8"],
+    "ROL": ["value = ROL_TABLE[(C << 8) | M]", "R = nz = value & 0xFF", "C = value >> 8"],
+    "ROR": ["value = ROR_TABLE[(C << 8) | M]", "R = nz = value & 0xFF", "C = value >> 8"],
+    "INC": ["R = nz = (M + 1) & 0xFF"],
+    "DEC": ["R = nz = (M - 1) & 0xFF"],
+}
+
+# unofficial read-modify-write instructions: (modify, then use the new value)
+COMBINED_SOURCE: Dict[str, Tuple[str, str]] = {
+    "SLO": ("ASL", "ORA"),
+    "RLA": ("ROL", "AND"),
+    "SRE": ("LSR", "EOR"),
+    "RRA": ("ROR", "ADC"),
+    "DCP": ("DEC", "CMP"),
+    "ISB": ("INC", "SBC"),
+    "ISC": ("INC", "SBC"),
+}
+
+STORE_SOURCE: Dict[str, str] = {
+    "STA": "A",
+    "STX": "X",
+    "STY": "Y",
+    "SAX": "A & X",
+}
+
+IMPLIED_SOURCE: Dict[str, List[str]] = {
+    "CLC": ["C = 0"],
+    "SEC": ["C = 1"],
+    "CLV": ["V = 0"],
+    "CLD": [f"regs.P &= {0xFF & ~Flags.D:#x}"],
+    "SED": [f"regs.P |= {Flags.D:#x}"],
+    "CLI": [f"regs.P &= {0xFF & ~Flags.I:#x}"],
+    "SEI": [f"regs.P |= {Flags.I:#x}"],
+    "DEX": ["X = nz = (X - 1) & 0xFF"],
+    "DEY": ["Y = nz = (Y - 1) & 0xFF"],
+    "INX": ["X = nz = (X + 1) & 0xFF"],
+    "INY": ["Y = nz = (Y + 1) & 0xFF"],
+    "TAX": ["X = nz = A"],
+    "TAY": ["Y = nz = A"],
+    "TXA": ["A = nz = X"],
+    "TYA": ["A = nz = Y"],
+    "TSX": ["X = SP", "nz = X & 0xFF"],
+    "TXS": ["SP = X"],
+    "PHA": _push("A"),
+    "PLA": [*_pull("A"), "nz = A"],
+}
+
+# PPU, APU, controller, expansion and PRG-RAM reads see the current cycle
+IO_READ_RANGE = (0x2000, 0x7FFF)
+# writes there (and to mapper registers) may also end the running slice
+IO_WRITE_RANGE = (0x2000, 0xFFFF)
+
+# handled through OPCODE_TABLE and always end a block
+CONTROL_FALLBACKS = {"BRK", "RTI", "KIL"}
+# handled through OPCODE_TABLE and may write anywhere
+WRITING_FALLBACKS = {"AHX", "SHX", "SHY", "TAS"}
+STACK_WRITERS = {"PHA", "PHP", "JSR", "BRK"}
+
+
+def _address_source(mode:AddressingMethod, operand:int) -> List[str]:
+    # same effective address (and bus read order) as dispatch.py
+    match mode:
+        case AddressingMethod.zp | AddressingMethod.abs:
+            return [f"addr = {operand}"]
+        case AddressingMethod.zpx:
+            return [f"addr = ({operand} + X) & 0xFF"]
+        case AddressingMethod.zpy:
+            return [f"addr = ({operand} + Y) & 0xFF"]
+        case AddressingMethod.abx:
+            return [f"addr = ({operand} + X) & 0xFFFF"]
+        case AddressingMethod.aby:
+            return [f"addr = ({operand} + Y) & 0xFFFF"]
+        case AddressingMethod.ind:
+            return [
+                f"lo = read_byte({operand})",
+                f"addr = (read_byte({(operand & 0xFF00) | ((operand + 1) & 0xFF)}) << 8) | lo",
+            ]
+        case AddressingMethod.izx:
+            return [
+                f"ptr = ({operand} + X) & 0xFF",
+                "addr = (read_byte((ptr + 1) & 0xFF) << 8) | read_byte(ptr)",
+            ]
+        case AddressingMethod.izy:
+            return [
+                f"base = (read_byte({(operand + 1) & 0xFF}) << 8) | read_byte({operand})",
+                "addr = (base + Y) & 0xFFFF",
+            ]
+    raise ValueError(f"Invalid addressing method: {mode}")
+
+
+def _page_cross_source(mode:AddressingMethod, operand:int) -> List[str]:
+    # the page crossing penalty, added after the instruction (none of them
+    # changes its own index register)
+    match mode:
+        case AddressingMethod.abx:
+            return [f"cycles += ({operand & 0xFF} + X) >> 8"]
+        case AddressingMethod.aby:
+            return [f"cycles += ({operand & 0xFF} + Y) >> 8"]
+        case AddressingMethod.izy:
+            return ["cycles += ((base & 0xFF) + Y) >> 8"]
+    raise ValueError(f"Invalid addressing method: {mode}")
+
+
+def _value_source(mode:AddressingMethod, operand:int) -> List[str]:
+    if mode is AddressingMethod.imm:
+        return [f"M = {operand}"]
+    if mode in (AddressingMethod.zp, AddressingMethod.abs):
+        return [f"M = read_byte({operand})"]
+    return [*_address_source(mode, operand), "M = read_byte(addr)"]
+
+
+def _modify_source(mnemonic:str, mode:AddressingMethod, operand:int) -> List[str]:
+    if mode is AddressingMethod.acc:
+        return ["M = A", *MODIFY_SOURCE[mnemonic], "A = R"]
+    return [*_address_source(mode, operand), "M = read_byte(addr)", *MODIFY_SOURCE[mnemonic], "write_byte(addr, R)"]
+
+
+def _instruction_source(mnemonic:str, mode:AddressingMethod, operand:int) -> List[str]|None:
+    if mnemonic in VALUE_SOURCE:
+        return [*_value_source(mode, operand), *VALUE_SOURCE[mnemonic]]
+    if mnemonic in MODIFY_SOURCE:
+        return _modify_source(mnemonic, mode, operand)
+    if mnemonic in COMBINED_SOURCE:
+        modify, use = COMBINED_SOURCE[mnemonic]
+        reload = "M = A" if mode is AddressingMethod.acc else "M = read_byte(addr)"
+        return [*_modify_source(modify, mode, operand), reload, *VALUE_SOURCE[use]]
+    if mnemonic in STORE_SOURCE:
+        return [*_address_source(mode, operand), f"write_byte(addr, {STORE_SOURCE[mnemonic]})"]
+    if mnemonic in IMPLIED_SOURCE:
+        return IMPLIED_SOURCE[mnemonic]
+    if mnemonic == "NOP":
+        return []
+    return None
+
+
+def _write_range(mnemonic:str, mode:AddressingMethod, operand:int) -> Tuple[int, int]|None:
+    # the (inclusive) range of addresses an instruction may write to
+    if mnemonic in STACK_WRITERS:
+        return 0x100, 0x1FF
+    if mnemonic in WRITING_FALLBACKS:
+        return 0x0000, 0xFFFF
+    if mnemonic not in STORE_SOURCE and mnemonic not in MODIFY_SOURCE and mnemonic not in COMBINED_SOURCE:
+        return None
+    match mode:
+        case AddressingMethod.acc:
+            return None
+        case AddressingMethod.zp | AddressingMethod.zpx | AddressingMethod.zpy:
+            return 0x00, 0xFF
+        case AddressingMethod.abs:
+            return operand, operand
+        case AddressingMethod.abx | AddressingMethod.aby if operand + 0xFF <= 0xFFFF:
+            return operand, operand + 0xFF
+    return 0x0000, 0xFFFF
+
+
+def _access_range(mnemonic:str, mode:AddressingMethod, operand:int) -> Tuple[int, int]|None:
+    # the (inclusive) range of addresses an instruction may read or write,
+    # besides the stack and its own code
+    if mnemonic in WRITING_FALLBACKS:
+        return 0x0000, 0xFFFF
+    match mode:
+        case AddressingMethod.zp | AddressingMethod.zpx | AddressingMethod.zpy:
+            return 0x00, 0xFF
+        case AddressingMethod.abs if mnemonic not in ("JMP", "JSR"):
+            return operand, operand
+        case AddressingMethod.abx | AddressingMethod.aby if operand + 0xFF <= 0xFFFF:
+            return operand, operand + 0xFF
+        case AddressingMethod.abx | AddressingMethod.aby | AddressingMethod.ind | AddressingMethod.izx | AddressingMethod.izy:
+            return 0x0000, 0xFFFF
+    return None
+
+
+def _assigned_names(line:str) -> Set[str]:
+    line = line.strip()
+    for op in ("+=", "-=", "&=", "|=", "^="):
+        if f" {op} " in line:
+            return {line.split(" ", 1)[0]}
+    parts = line.split(" = ")
+    names = set()
+    for target in parts[:-1]:
+        names.update(name.strip() for name in target.split(","))
+    return names
+
+
+class TranslatedBlock:
+    def __init__(self, start:int, end:int, func:Callable, source:str, lead_cycles:int):
+        self.start = start
+        self.end = end
+        # the most cycles the block can take before its last instruction
+        self.lead_cycles = lead_cycles
+        self.func = func
+        self.source = source
+
+
+class BlockTranslator:
+    """
+    Translated basic blocks keyed by (bank, PC).
+
+    A block runs straight-line code from its start address up to the first
+    branch, jump, return or interrupt instruction, and also stops right after
+    any instruction that may write to the memory the block itself lives in,
+    so self-modifying code never runs stale. Writes that may reach an I/O
+    register end a block too, and the block sets cpu.slice_cycles before
+    any I/O access, so the PPU and APU see the same cycle as when
+    interpreting. A caller that must stop at a cycle budget checks
+    lead_cycles before running a block. PRG-ROM blocks are dropped when
+    the mapper reports a PRG write or bank switch, RAM blocks when the bus
+    reports a write to one of their bytes. Code anywhere else is not
+    translated and lookup returns None.
+    """
+
+    def __init__(self, bus:CPUBus, max_instructions:int=MAX_BLOCK_INSTRUCTIONS):
+        self.bus = bus
+        self.max_instructions = max_instructions
+        self.blocks: Dict[Tuple[int, int], TranslatedBlock] = {}
+        # the block for each PC in the banks that are currently mapped in
+        self.active: List[TranslatedBlock|None] = [None] * 0x10000
+        self.covering: List[Set[Tuple[int, int]]|None] = [None] * 0x10000
+        self.mapper: IMapper = None
+        bus.register_ram_write_callback(self.invalidate_ram)
+
+    def lookup(self, pc:int) -> TranslatedBlock|None:
+        block = self.active[pc]
+        if block is not None:
+            return block
+
+        if pc >= 0x8000:
+            self._watch_mapper()
+            key = (self.mapper.get_prg_bank(pc), pc)
+        elif pc < 0x2000:
+            key = (RAM_BANK, pc)
+        else:
+            return None
+
+        block = self.blocks.get(key, None)
+        if block is None:
+            block = self.translate(pc)
+            if block is None:
+                return None
+            self.blocks[key] = block
+            for address in range(block.start, block.end):
+                covering = self.covering[address]
+                if covering is None:
+                    covering = self.covering[address] = set()
+                covering.add(key)
+                if key[0] == RAM_BANK:
+                    self.bus.watched_ram[address % 0x0800] = 1
+        self.active[pc] = block
+        return block
+
+    def translate(self, start:int) -> TranslatedBlock|None:
+        read_byte = self.bus.read_byte
+        region_end = 0x10000 if start >= 0x8000 else 0x2000
+        # the addresses whose writes would modify this block's code
+        code_lo, code_hi = (0x8000, 0xFFFF) if start >= 0x8000 else (0x0000, 0x1FFF)
+
+        items = []
+        # the most cycles each instruction can take
+        max_cycles = []
+        static_cycles = 0
+        dynamic_cycles = False
+        terminator = None
+        pc = start
+        while len(max_cycles) < self.max_instructions:
+            opcode = read_byte(pc)
+            length = OPCODE_LENGTHS[opcode]
+            if pc + length > region_end:
+                break
+            if length == 1:
+                operand = None
+            elif length == 2:
+                operand = read_byte(pc + 1)
+            else:
+                operand = read_byte(pc + 1) | (read_byte(pc + 2) << 8)
+            mnemonic, mode, _, _ = INSTRUCTION_TABLE[opcode]
+            next_pc = pc + length
+            if mnemonic == "KIL" and max_cycles:
+                # KIL resets the CPU, in a block of its own the cycles before it still count
+                break
+
+            accessed =_access_range(mnemonic, mode, operand)
+            written = _write_range(mnemonic, mode, operand)
+            writes_io = written is not None and written[0] <= IO_WRITE_RANGE[1] and written[1] >= IO_WRITE_RANGE[0]
+            if items and (writes_io or accessed is not None and accessed[0] <= IO_READ_RANGE[1] and accessed[1] >= IO_READ_RANGE[0]):
+                items.append(("sync", static_cycles))
+
+            if mode is AddressingMethod.rel:
+                target = (next_pc + operand - 0x100) & 0xFFFF if operand & 0x80 else (next_pc + operand) & 0xFFFF
+                static_cycles += BASE_CYCLES[opcode]
+                if (target ^ next_pc) > 0xFF:
+                    taken_cycles = BRANCH_PAGE_CROSS_CYCLES[opcode]
+                else:
+                    taken_cycles = BRANCH_TAKEN_CYCLES[opcode]
+                max_cycles.append(BASE_CYCLES[opcode] + BRANCH_PAGE_CROSS_CYCLES[opcode])
+                terminator = ("branch", BRANCH_CONDITIONS[mnemonic], target, next_pc, taken_cycles)
+                pc = next_pc
+                break
+            max_cycles.append(BASE_CYCLES[opcode] + PAGE_CROSS_CYCLES[opcode])
+            if mnemonic == "JMP":
+                static_cycles += BASE_CYCLES[opcode]
+                if mode is AddressingMethod.abs:
+                    terminator = ("jump", str(operand))
+                else:
+                    items.append(("source", _address_source(mode, operand)))
+                    terminator = ("jump", "addr")
+                pc = next_pc
+                break
+            if mnemonic == "JSR":
+                static_cycles += BASE_CYCLES[opcode]
+                items.append(("source", _push(str(((next_pc - 1) >> 8) & 0xFF)) + _push(str((next_pc - 1) & 0xFF))))
+                terminator = ("jump", str(operand))
+                pc = next_pc
+                break
+            if mnemonic == "RTS":
+                static_cycles += BASE_CYCLES[opcode]
+                items.append(("source", [*_pull("lo"), *_pull("hi")]))
+                terminator = ("jump", "((hi << 8) | lo) + 1")
+                pc = next_pc
+                break
+
+            source = _instruction_source(mnemonic, mode, operand)
+            if source is None or mnemonic in CONTROL_FALLBACKS:
+                items.append(("fallback", opcode, operand, next_pc))
+            else:
+                static_cycles += BASE_CYCLES[opcode]
+                if PAGE_CROSS_CYCLES[opcode]:
+                    source = [*source, *_page_cross_source(mode, operand)]
+                    dynamic_cycles = True
+                items.append(("source", source))
+            pc = next_pc
+
+            if mnemonic in CONTROL_FALLBACKS:
+                terminator = ("fallback",)
+                break
+            if written is not None and written[0] <= code_hi and written[1] >= code_lo:
+                break
+            if writes_io:
+                # the write may raise an interrupt or move an event, which ends the slice
+                break
+
+        if not items and terminator is None:
+            return None
+        if terminator is None:
+            terminator = ("jump", str(pc))
+        source = self._emit(start, items, terminator, static_cycles, dynamic_cycles)
+        namespace = {
+            "ADC_TABLE": ADC_TABLE,
+            "COMPARE_TABLE": COMPARE_TABLE,
+            "ASL_TABLE": ASL_TABLE,
+            "LSR_TABLE": LSR_TABLE,
+            "ROL_TABLE": ROL_TABLE,
+            "ROR_TABLE": ROR_TABLE,
+            "OPCODE_TABLE": OPCODE_TABLE,
+        }
+        exec(compile(source, f"<block {start:04X}>", "exec"), namespace)
+        return TranslatedBlock(start, pc, namespace[f"block_{start:04X}"], source, sum(max_cycles[:-1]))
+
+    def _emit(self, start:int, items:list, terminator:tuple, static_cycles:int, dynamic_cycles:bool) -> str:
+        used = set()
+        for item in items:
+            if item[0] == "source":
+                for line in item[1]:
+                    used.update(_NAME_PATTERN.findall(line))
+        if terminator[0] == "branch":
+            used.update(_NAME_PATTERN.findall(terminator[1]))
+        has_fallback = any(item[0] == "fallback" for item in items)
+        # fallbacks and page crossings add to a cycles local
+        dynamic_cycles = dynamic_cycles or has_fallback
+
+        def load() -> List[str]:
+            lines = [f"{name} = regs.{name}" for name in REGISTERS if name in used]
+            if "C" in used:
+                lines.append(f"C = regs.P & {Flags.C:#x}")
+            if "V" in used:
+                lines.append("V = (regs.P >> 6) & 0x01")
+            return lines
+
+        def store(names:Set[str]) -> List[str]:
+            lines = [f"regs.{name} = {name}" for name in REGISTERS if name in names]
+            if "C" in names and "V" in names:
+                lines.append(f"regs.P = (regs.P & {0xFF & ~(Flags.C | Flags.V):#x}) | (V << 6) | C")
+            elif "C" in names:
+                lines.append(f"regs.P = (regs.P & {0xFF & ~Flags.C:#x}) | C")
+            elif "V" in names:
+                lines.append(f"regs.P = (regs.P & {0xFF & ~Flags.V:#x}) | (V << 6)")
+            return lines
+
+        body = [
+            "regs = cpu.regs",
+            "read_byte = cpu.bus.read_byte",
+            "write_byte = cpu.bus.write_byte",
+            *load(),
+        ]
+        if dynamic_cycles:
+            body.append("cycles = 0")
+        if any(item[0] == "sync" for item in items):
+            body.append("slice_cycles = cpu.slice_cycles")
+        dirty = set()
+        for item in items:
+            if item[0] == "source":
+                for line in item[1]:
+                    dirty.update(_assigned_names(line) & used)
+                body.extend(item[1])
+            elif item[0] == "sync":
+                # where the next instruction starts, for the I/O it accesses
+                offset = f"cycles + {item[1]}" if dynamic_cycles else str(item[1])
+                body.append(f"cpu.slice_cycles = slice_cycles + {offset}")
+            else:
+                _, opcode, operand, next_pc = item
+                body.extend(store(dirty))
+                dirty = set()
+                body.append(f"regs.PC = {next_pc}")
+                body.append(f"cycles += OPCODE_TABLE[{opcode}](cpu, {operand})")
+                if terminator[0] != "fallback" or item is not items[-1]:
+                    body.extend(load())
+
+        cycles = f"cycles + {static_cycles}" if dynamic_cycles else str(static_cycles)
+        if terminator[0] == "fallback":
+            body.append(f"return {cycles}")
+        else:
+            body.extend(store(dirty))
+            if terminator[0] == "branch":
+                _, condition, target, next_pc, taken = terminator
+                taken_cycles = f"cycles + {static_cycles + taken}" if dynamic_cycles else str(static_cycles + taken)
+                body.extend([
+                    f"if {condition}:",
+                    f"    regs.PC = {target}",
+                    f"    return {taken_cycles}",
+                    f"regs.PC = {next_pc}",
+                    f"return {cycles}",
+                ])
+            else:
+                body.extend([f"regs.PC = {terminator[1]}", f"return {cycles}"])
+
+        return f"def block_{start:04X}(cpu):\n" + "".join(f"    {line}\n" for line in body)
+
+    def invalidate(self, start:int, end:int):
+        covering = self.covering
+        for address in range(start, min(end, 0x10000)):
+            keys = covering[address]
+            if keys:
+                for key in list(keys):
+                    self._drop(key)
+
+    def invalidate_ram(self, address:int):
+        for mirror in range(address, 0x2000, 0x0800):
+            self.invalidate(mirror, mirror + 1)
+
+    def clear(self):
+        self.blocks.clear()
+        self.active[:] = [None] * 0x10000
+        self.covering[:] = [None] * 0x10000
+
+    def _drop(self, key:Tuple[int, int]):
+        block = self.blocks.pop(key)
+        if self.active[key[1]] is block:
+            self.active[key[1]] = None
+        for address in range(block.start, block.end):
+            self.covering[address].discard(key)
+
+    def _watch_mapper(self):
+        mapper = self.bus.cartridge.mapper
+        if mapper is not self.mapper:
+            self.clear()
+            self.mapper = mapper
+            mapper.register_prg_write_callback(self.invalidate)
@@ -5,11 +5,12 @@ logging.basicConfig(level=logging.ERROR, format='%(levelname)s - %(message)s', f
 # from cpu import CPU
 import random
 from typing import List, Tuple
+import numpy as np
 from src.frame import NPFrame
 from src.instruction import INSTRUCTION_TABLE
 from src.machine import Machine
 from src.cartridge import Cartridge
-from src.cpu import CPUHookType
+from src.cpu import CPUHookType, ExecutionMode
 
 
 
@@ -160,11 +161,12 @@ def show_bg():
 
     pattern_base_addr = 0x1000
 
+    # NES color indices: black, red, green, blue
     PALETTE={
-        0: (0,0,0),
-        1: (255,0,0),
-        2: (0,255,0),
-        3: (0,0,255),
+        0: 0x0F,
+        1: 0x16,
+        2: 0x1A,
+        3: 0x12,
     }
     frame = NPFrame()
 
@@ -288,10 +290,337 @@ def test_bus():
             break
 
 
+def make_test_rom(prg:bytes, chr:bytes=bytes(0x2000)) -> Cartridge:
+    # an NROM-128 cartridge running prg from $8000
+    import os, tempfile
+    prg_data = bytearray(0x4000)
+    prg_data[:len(prg)] = prg
+    prg_data[0x3FFC:0x3FFE] = (0x00, 0x80)
+    fd, path = tempfile.mkstemp(suffix=".nes")
+    with os.fdopen(fd, "wb") as f:
+        f.write(b"NES\x1a" + bytes((1, 1)) + bytes(10) + prg_data + chr)
+    try:
+        return Cartridge(path)
+    finally:
+        os.remove(path)
+
+
+def test_fusion(cycles=200000):
+    # the idioms of fusion.py, run again and again with a changing $12
+    prg = bytes((
+        0xA2, 0x00,             # 8000 LDX #$00
+        0xA9, 0x55,             # 8002 LDA #$55
+        0x9D, 0x00, 0x02,       # 8004 STA $0200,X   fill loop
+        0x9D, 0x00, 0x03,       # 8007 STA $0300,X
+        0xE8,                   # 800A INX
+        0xD0, 0xF7,             # 800B BNE $8004
+        0xA0, 0x00,             # 800D LDY #$00
+        0xB9, 0x00, 0x80,       # 800F LDA $8000,Y   copy loop
+        0x99, 0x00, 0x04,       # 8012 STA $0400,Y
+        0xC8,                   # 8015 INY
+        0xD0, 0xF7,             # 8016 BNE $800F
+        0xA2, 0x10,             # 8018 LDX #$10
+        0xCA,                   # 801A DEX
+        0xD0, 0xFD,             # 801B BNE $801A
+        0xA0, 0x00,             # 801D LDY #$00
+        0xC8,                   # 801F INY
+        0xC0, 0x40,             # 8020 CPY #$40
+        0xD0, 0xFB,             # 8022 BNE $801F
+        0xA5, 0x12,             # 8024 LDA $12
+        0x85, 0x11,             # 8026 STA $11
+        0xA9, 0x80,             # 8028 LDA #$80
+        0x8D, 0x00, 0x05,       # 802A STA $0500
+        0xA6, 0x12,             # 802D LDX $12
+        0xA0, 0x09,             # 802F LDY #$09
+        0xBD, 0xF8, 0x04,       # 8031 LDA $04F8,X
+        0x99, 0x00, 0x06,       # 8034 STA $0600,Y
+        0xE6, 0x12,             # 8037 INC $12
+        0x4C, 0x00, 0x80,       # 8039 JMP $8000
+    ))
+
+    def state(m:Machine):
+        regs = m.cpu.regs
+        return (regs.PC, regs.A, regs.X, regs.Y, regs.SP, regs.read_status(), bytes(m.cpu_memory.memory))
+
+    # with and without fusion, every slice must end on the same cycle with
+    # the same registers, flags and RAM
+    fused = Machine(make_test_rom(prg))
+    plain = Machine(make_test_rom(prg))
+    plain.cpu.decode_cache.set_fusion(False)
+    for m in (fused, plain):
+        # fused handlers only run in the hook-free loop
+        m.hook_enable(False)
+        m.reset()
+    while fused.scheduler.cycles < cycles:
+        fused.scheduler.run()
+        plain.scheduler.run()
+        assert state(fused) == state(plain), f"fused slice differs at cycle {plain.scheduler.cycles}"
+    assert not plain.cpu.decode_cache.fusion_report(), "fused with fusion disabled"
+
+    report = fused.cpu.decode_cache.fusion_report()
+    assert report, "nothing was fused"
+    for name, (sites, runs, instructions) in sorted(report.items()):
+        print(f"{name:<20}: {sites} sites, {runs} runs, {instructions} instructions")
+
+
+def test_fusion_nmi(frames=20):
+    # a DEX/BNE loop with NMI on: when vblank starts during DEX the NMI must
+    # come between DEX and BNE, the handler logs where it returns to
+    prg = bytes((
+        0xA9, 0x80,             # 8000 LDA #$80
+        0x8D, 0x00, 0x20,       # 8002 STA $2000     NMI on
+        0xCA,                   # 8005 DEX
+        0xD0, 0xFD,             # 8006 BNE $8005
+        0x4C, 0x05, 0x80,       # 8008 JMP $8005
+        0xBA,                   # 800B TSX           NMI handler
+        0xBD, 0x02, 0x01,       # 800C LDA $0102,X   return address, low byte
+        0xA4, 0x21,             # 800F LDY $21
+        0x99, 0x00, 0x03,       # 8011 STA $0300,Y
+        0xE6, 0x21,             # 8014 INC $21
+        0x40,                   # 8016 RTI
+    ))
+    prg += bytes(0x3FFA - len(prg)) + bytes((0x0B, 0x80))
+
+    logs = []
+    for fusion in (True, False):
+        m = Machine(make_test_rom(prg))
+        m.cpu.decode_cache.set_fusion(fusion)
+        m.hook_enable(False)
+        m.reset()
+        while m.cpu_memory.memory[0x21] < frames:
+            m.scheduler.run()
+        logs.append(bytes(m.cpu_memory.memory[0x300:0x300 + frames]))
+    assert logs[0] == logs[1], f"NMIs returned to {logs[0].hex()} with fusion, {logs[1].hex()} without"
+    assert 0x06 in logs[0], "no NMI came between DEX and BNE"
+
+
+def test_translate(cycles=300000):
+    # $2002 reads and a sprite 0 move in the middle of a block, a vblank
+    # wait and an NMI handler
+    prg = bytes((
+        0xA9, 0x80,             # 8000 LDA #$80
+        0x8D, 0x00, 0x20,       # 8002 STA $2000     NMI on
+        0xA9, 0x18,             # 8005 LDA #$18
+        0x8D, 0x01, 0x20,       # 8007 STA $2001     background and sprites on
+        0xA2, 0x00,             # 800A LDX #$00
+        0xAD, 0x02, 0x20,       # 800C LDA $2002
+        0x9D, 0x00, 0x03,       # 800F STA $0300,X
+        0xE8,                   # 8012 INX
+        0xA9, 0x00,             # 8013 LDA #$00
+        0x8D, 0x03, 0x20,       # 8015 STA $2003
+        0xA5, 0x10,             # 8018 LDA $10
+        0x18,                   # 801A CLC
+        0x69, 0x03,             # 801B ADC #$03
+        0x85, 0x10,             # 801D STA $10
+        0x8D, 0x04, 0x20,       # 801F STA $2004     sprite 0 y
+        0xAD, 0x02, 0x20,       # 8022 LDA $2002
+        0x29, 0xC0,             # 8025 AND #$C0
+        0x9D, 0x00, 0x04,       # 8027 STA $0400,X
+        0xE0, 0xF0,             # 802A CPX #$F0
+        0xD0, 0xDE,             # 802C BNE $800C
+        0xAD, 0x02, 0x20,       # 802E LDA $2002
+        0x10, 0xFB,             # 8031 BPL $802E     vblank wait
+        0x4C, 0x0A, 0x80,       # 8033 JMP $800A
+        0xE6, 0x11,             # 8036 INC $11       NMI handler
+        0xA5, 0x10,             # 8038 LDA $10
+        0x85, 0x12,             # 803A STA $12
+        0x40,                   # 803C RTI
+    ))
+    prg += bytes(0x3FFA - len(prg)) + bytes((0x36, 0x80))
+
+    def state(m:Machine):
+        regs = m.cpu.regs
+        return (m.scheduler.cycles, regs.PC, regs.A, regs.X, regs.Y, regs.SP, regs.read_status(),
+                bytes(m.cpu_memory.memory))
+
+    # translated blocks must end every slice where interpreting does and
+    # show the PPU the same cycle on every access
+    machines = []
+    for mode in (ExecutionMode.INTERPRET, ExecutionMode.TRANSLATE):
+        m = Machine(make_test_rom(prg))
+        m.hook_enable(False)
+        m.set_execution_mode(mode)
+        m.reset()
+        machines.append(m)
+    interpreted, translated = machines
+    while interpreted.scheduler.cycles < cycles:
+        interpreted.scheduler.run()
+        translated.scheduler.run()
+        assert state(translated) == state(interpreted), f"translated slice differs at cycle {interpreted.scheduler.cycles}"
+    assert interpreted.cpu_memory.memory[0x11] > 1, "no NMI was taken"
+
+
+def test_oam_dma_stall():
+    # STA $4014 (4 cycles) and STA $4014,X (5 cycles) are both charged 513
+    # cycles, 514 when the storing instruction ends on an odd cycle
+    for name, store in (("STA abs", (0x8D, 0x14, 0x40)), ("STA abs,X", (0x9D, 0x14, 0x40))):
+        for padding in range(2):
+            # LDA #$02, padding LDA $00 (3 cycles each) to shift the parity
+            prg = bytes((0xA9, 0x02) + (0xA5, 0x00) * padding + store + (0x4C, 0x00, 0x80))
+            m = Machine(make_test_rom(prg))
+            m.reset()
+            for _ in range(1 + padding):
+                m.scheduler.step()
+            m.scheduler.step()
+            # the stall is pending for the next instruction
+            stall = m.cpu.defer_cycles
+            end = m.scheduler.cycles
+            assert stall == 513 + (end & 1), f"{name} ending on cycle {end} stalled {stall} cycles"
+
+
+def bench_frame_hooks(frames=60):
+    import time
+
+    # a main loop over RAM and an NMI handler doing OAM DMA and scrolling
+    prg = bytes((
+        0xA9, 0x80,             # 8000 LDA #$80
+        0x8D, 0x00, 0x20,       # 8002 STA $2000     NMI on
+        0xA9, 0x18,             # 8005 LDA #$18
+        0x8D, 0x01, 0x20,       # 8007 STA $2001     background and sprites on
+        0xA2, 0x00,             # 800A LDX #$00
+        0xBD, 0x00, 0x03,       # 800C LDA $0300,X
+        0x18,                   # 800F CLC
+        0x69, 0x01,             # 8010 ADC #$01
+        0x9D, 0x00, 0x03,       # 8012 STA $0300,X
+        0xE8,                   # 8015 INX
+        0xD0, 0xF4,             # 8016 BNE $800C
+        0x4C, 0x0A, 0x80,       # 8018 JMP $800A
+        0x48,                   # 801B PHA           NMI handler
+        0xA9, 0x03,             # 801C LDA #$03
+        0x8D, 0x14, 0x40,       # 801E STA $4014     OAM DMA from $0300
+        0xA9, 0x00,             # 8021 LDA #$00
+        0x8D, 0x05, 0x20,       # 8023 STA $2005
+        0x8D, 0x05, 0x20,       # 8026 STA $2005
+        0x68,                   # 8029 PLA
+        0x40,                   # 802A RTI
+    ))
+    prg += bytes(0x3FFA - len(prg)) + bytes((0x1B, 0x80))
+
+    def count_frame(cpu, counter:dict):
+        counter["frames"] += 1
+
+    def on_vblank(cpu):
+        pass
+
+    def on_scanline(cpu):
+        pass
+
+    def on_nmi(cpu):
+        pass
+
+    def after_exec(cpu):
+        pass
+
+    def run_frames(m:Machine, counter:dict):
+        counter["frames"] = 0
+        start = time.perf_counter()
+        while counter["frames"] < frames:
+            m.scheduler.run()
+        return time.perf_counter() - start
+
+    m=Machine(make_test_rom(prg))
+    m.reset()
+    counter = {"frames": 0}
+    m.register_cpu_hook(CPUHookType.ON_FRAME_START, count_frame, (counter,))
+    print(f"no hooks:          {frames / run_frames(m, counter):.1f} fps")
+
+    m.register_cpu_hook(CPUHookType.ON_VBLANK, on_vblank)
+    m.register_cpu_hook(CPUHookType.ON_SCANLINE, on_scanline, scanline=120)
+    m.register_cpu_hook(CPUHookType.ON_NMI, on_nmi)
+    print(f"frame hooks:       {frames / run_frames(m, counter):.1f} fps")
+
+    m.register_cpu_hook(CPUHookType.AFTER_EXEC, after_exec)
+    print(f"instruction hooks: {frames / run_frames(m, counter):.1f} fps")
+
+
+def make_render_fixture(seed=0) -> Machine:
+    # random pattern tables, name tables, attributes and palettes
+    rng = random.Random(seed)
+    m = Machine(make_test_rom(bytes((0x4C, 0x00, 0x80)), bytes(rng.randrange(256) for _ in range(0x2000))))
+    for address in range(0x2000, 0x3000):
+        m.ppu.bus.write_byte(address, rng.randrange(256))
+    for address in range(0x3F00, 0x3F20):
+        m.ppu.bus.write_byte(address, rng.randrange(0x40))
+    return m
+
+
+def reference_background(m:Machine) -> np.ndarray:
+    # the background pixel by pixel, as NES color indices [y, x]
+    bus = m.ppu.bus
+    ctrl_reg = m.ppu.reg_manager.ctrl_reg
+    pattern_addr = ctrl_reg.get_background_pattern_addr()
+    nametable_idx = (ctrl_reg.get_nametable_addr() >> 10) & 0x03
+    scroll_x, scroll_y = m.ppu.reg_manager.scroll_reg
+    frame = np.zeros((240, 256), dtype=np.uint8)
+    for y in range(240):
+        world_y = ((nametable_idx >> 1) * 240 + scroll_y + y) % 480
+        tile_y, fine_y = divmod(world_y % 240, 8)
+        for x in range(256):
+            world_x = ((nametable_idx & 0x01) * 256 + scroll_x + x) % 512
+            tile_x, fine_x = divmod(world_x % 256, 8)
+            nametable = bus.nametables[world_x // 256 | (world_y // 240) << 1]
+            tile_addr = pattern_addr + nametable[tile_y * 32 + tile_x] * 16 + fine_y
+            low, high = bus.read_byte(tile_addr), bus.read_byte(tile_addr + 8)
+            color = ((low >> (7 - fine_x)) & 0x01) | ((high >> (7 - fine_x)) & 0x01) << 1
+            attr = nametable[0x3C0 + (tile_y // 4) * 8 + tile_x // 4]
+            palette_idx = (attr >> ((tile_y % 4 // 2) * 4 + (tile_x % 4 // 2) * 2)) & 0x03
+            frame[y, x] = bus.read_byte(0x3F00 + (palette_idx * 4 + color if color else 0)) & 0x3F
+    return frame
+
+
+def test_render_background():
+    # the NumPy background against the pixel by pixel reference, for every
+    # name table, both pattern tables, scroll positions on and off the tile
+    # grid and after name table writes
+    m = make_render_fixture()
+    rng = random.Random(1)
+    for nametable_idx in range(4):
+        for pattern_table in range(2):
+            for scroll in ((rng.randrange(32) * 8, rng.randrange(30) * 8), (rng.randrange(256), rng.randrange(240))):
+                m.cpu_bus.write_byte(0x2000, nametable_idx | pattern_table << 4)
+                m.cpu_bus.write_byte(0x2005, scroll[0])
+                m.cpu_bus.write_byte(0x2005, scroll[1])
+                for address in rng.sample(range(0x2000, 0x3000), 64):
+                    m.ppu.bus.write_byte(address, rng.randrange(256))
+                m.ppu.tile_cache.update()
+                m.ppu.render_background()
+                expected = reference_background(m)
+                mismatches = np.count_nonzero(m.ppu.current_frame.indices != expected)
+                assert mismatches == 0, f"{mismatches} background pixels differ, name table {nametable_idx}, pattern table {pattern_table}, scroll {scroll}"
+
+
+def bench_render(frames=100):
+    import time
+
+    m = make_render_fixture()
+    ctrl = [0x00]
+
+    def redraw_background():
+        # a new pattern table draws every tile again
+        ctrl[0] ^= 0x10
+        m.cpu_bus.write_byte(0x2000, ctrl[0])
+        m.ppu.render_background()
+
+    benches = (("background", m.ppu.render_background), ("redrawn", redraw_background),
+               ("sprites", m.ppu.render_sprite), ("frame", m.ppu.render))
+    for name, render in benches:
+        start = time.perf_counter()
+        for _ in range(frames):
+            render()
+        print(f"{name:<10}: {(time.perf_counter() - start) / frames * 1000:.2f} ms")
+
+
 
 if __name__ == '__main__':
 
     # test_cpu()
+    test_fusion()
+    test_fusion_nmi()
+    test_translate()
+    test_oam_dma_stall()
+    bench_frame_hooks()
+    test_render_background()
+    bench_render()
     test_all()
     # show_bg()
     # convert_to_log()